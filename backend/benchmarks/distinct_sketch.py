@@ -0,0 +1,161 @@
+"""
+Точность и память скетчей HyperLogLog для act_days, region_cnt, city_cnt и url_host_cnt
+в сравнении с точным подсчетом при разной точности скетча. С --raw-path
+дополнительно сравнивается ROC AUC модели на точных и приближенных признаках.
+Запуск из папки backend: python -m benchmarks.distinct_sketch --precisions 8 10 12 14
+Версия: 1.0
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from src.config.settings import get_config
+from src.data.get_data import get_data
+from src.preprocessing.preprocessing_data import (change_cols_type,
+                                                  pipeline_raw_preprocessing,
+                                                  pipeline_feature_generation)
+from src.preprocessing.streaming_aggregation import UserAggregates
+from src.train.train import load_best_params
+from .feature_generation import measure
+from .synthetic import make_raw_logs
+
+CONFIG_PATH = "../config/parameters.yaml"
+REPORT_DIR = "../report/benchmarks"
+SKETCH_FEATURES = ['act_days', 'region_cnt', 'city_cnt', 'url_host_cnt']
+
+
+def relative_errors(exact: pd.DataFrame, approx: pd.DataFrame) -> dict:
+    """
+    Относительная ошибка приближенных кол-в по каждому признаку
+    :param exact: признаки с точным подсчетом
+    :param approx: признаки со скетчами
+    :return: средняя, p95 и максимальная ошибка и доля точных значений
+    """
+    errors = {}
+    for feature in SKETCH_FEATURES:
+        expected = exact[feature].to_numpy(dtype=np.float64)
+        error = np.abs(approx[feature].to_numpy(dtype=np.float64) - expected) / np.maximum(expected, 1)
+        errors[feature] = {
+            "mean": round(float(error.mean()), 5),
+            "p95": round(float(np.percentile(error, 95)), 5),
+            "max": round(float(error.max()), 5),
+            "exact_share": round(float((error == 0).mean()), 5),
+        }
+    return errors
+
+
+def state_size_mb(data: pd.DataFrame, hll_precision: int = None, n_chunks: int = 4) -> float:
+    """
+    Размер хранимых множеств или скетчей после аггрегации данных по частям
+    :param data: предобработанные сырые данные
+    :param hll_precision: точность скетча, None - точные множества
+    :param n_chunks: кол-во частей
+    :return: размер в МБ
+    """
+    aggregates = UserAggregates(hll_precision=hll_precision)
+    for chunk in np.array_split(np.arange(len(data)), n_chunks):
+        aggregates.update(data.iloc[chunk])
+    size = sum(keys.nbytes for keys in aggregates.distinct.values())
+    size += sum(sketch.nbytes for sketch in aggregates.sketches.values())
+    return round(size / 2 ** 20, 2)
+
+
+def model_auc(features: pd.DataFrame, config: dict) -> float:
+    """
+    ROC AUC CatBoost на отложенной выборке пользователей
+    :param features: аггрегированные признаки
+    :param config: словарь с данными из конфигурационного файла
+    :return: ROC AUC
+    """
+    train_config = config['train']
+    target = train_config['target']
+    targets = pd.read_parquet(train_config['target_data_path'])[['user_id', target]]
+    targets = targets[targets[target] != 'NA'].dropna()
+    data = change_cols_type(features, config['preprocessing']['agg_columns_type'])
+    data = change_cols_type(data.merge(targets, on='user_id'), train_config['target_type'])
+
+    data_train, data_test = train_test_split(data, stratify=data[target],
+                                             test_size=train_config['train_test_size'],
+                                             random_state=train_config['random_state'])
+    drop = [target] + np.atleast_1d(train_config['columns_to_drop']).tolist()
+    x_train = data_train.drop(columns=drop, errors='ignore')
+    x_test = data_test.drop(columns=drop, errors='ignore')
+    clf = CatBoostClassifier(**load_best_params(train_config['best_params_path']),
+                             cat_features=x_train.select_dtypes('category').columns.tolist(),
+                             random_seed=train_config['random_state'],
+                             allow_writing_files=False,
+                             verbose=False)
+    clf.fit(x_train, data_train[target])
+    return round(float(roc_auc_score(data_test[target], clf.predict_proba(x_test)[:, 1])), 5)
+
+
+def main():
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--precisions", type=int, nargs="+", default=[8, 10, 12, 14])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--raw-path", default=None,
+                        help="сырые логи для сравнения ROC AUC, без него - синтетические данные")
+    parser.add_argument("--output", default=None, help="путь до json с результатами")
+    args = parser.parse_args()
+
+    config = get_config(CONFIG_PATH)
+    preproc_config = config['preprocessing']
+    if args.raw_path:
+        raw_logs = get_data(args.raw_path, columns=list(preproc_config['change_col_types']),
+                            columns_types=preproc_config['change_col_types'])
+    else:
+        raw_logs = make_raw_logs(args.rows, args.users)
+    data = pipeline_raw_preprocessing(raw_logs, config)
+    del raw_logs
+
+    exact = measure(pipeline_feature_generation, data)
+    report = {
+        "params": vars(args),
+        "rows": len(data),
+        "users": len(exact["result"]),
+        "exact": {"wall_time_s": exact["wall_time_s"],
+                  "peak_mb": exact["peak_mb"],
+                  "state_mb": state_size_mb(data)},
+        "sketch": {},
+    }
+    if args.raw_path:
+        report["exact"]["roc_auc"] = model_auc(exact["result"], config)
+
+    for precision in args.precisions:
+        approx = measure(lambda frame: pipeline_feature_generation(frame, precision), data)
+        result = {"wall_time_s": approx["wall_time_s"],
+                  "peak_mb": approx["peak_mb"],
+                  "state_mb": state_size_mb(data, precision),
+                  "standard_error": round(1.04 / np.sqrt(1 << precision), 5),
+                  "relative_error": relative_errors(exact["result"], approx["result"])}
+        if args.raw_path:
+            result["roc_auc"] = model_auc(approx["result"], config)
+        report["sketch"][str(precision)] = result
+
+    print(f"rows={report['rows']} users={report['users']} exact: {report['exact']}")
+    for precision, result in report["sketch"].items():
+        errors = " ".join(f"{feature}={stats['mean']}"
+                          for feature, stats in result["relative_error"].items())
+        print(f"p={precision:>2} state={result['state_mb']}MB peak={result['peak_mb']}MB "
+              f"wall={result['wall_time_s']}s auc={result.get('roc_auc')} mean_error: {errors}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        output = os.path.join(REPORT_DIR, f"distinct_sketch_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"saved: {output}")
+
+
+if __name__ == "__main__":
+    main()
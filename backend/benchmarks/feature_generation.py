@@ -0,0 +1,85 @@
+"""
+Сравнение pipeline_feature_generation с реализацией через отдельные groupby и merge
+и с генерацией по шардам в нескольких процессах: время выполнения и пиковая память
+(для шардов - только основного процесса) на синтетических сырых логах.
+Запуск из папки backend: python -m benchmarks.feature_generation --rows 5000000 --shards 32
+Версия: 1.0
+"""
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from src.config.settings import get_config
+from src.preprocessing.preprocessing_data import (change_cols_type,
+                                                  pipeline_raw_preprocessing,
+                                                  pipeline_feature_generation,
+                                                  merge_feature_generation)
+from src.preprocessing.sharded_aggregation import pipeline_sharded_feature_generation
+from .synthetic import make_raw_logs
+
+CONFIG_PATH = "../config/parameters.yaml"
+
+
+def measure(function, data: pd.DataFrame) -> dict:
+    """
+    Время выполнения и пиковая память функции
+    :param function: функция генерации признаков
+    :param data: предобработанные сырые данные
+    :return: словарь с результатом и метриками
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(data)
+    wall_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"result": result, "wall_time_s": round(wall_time, 3), "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def main():
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--shards", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=0, help="0 - по числу ядер")
+    args = parser.parse_args()
+
+    config = get_config(CONFIG_PATH)
+
+    data = pipeline_raw_preprocessing(make_raw_logs(args.rows, args.users), config)
+
+    fused = measure(pipeline_feature_generation, data)
+    merged = measure(merge_feature_generation, data)
+    sharded = measure(lambda frame: pipeline_sharded_feature_generation(
+        frame, n_shards=args.shards, n_workers=args.workers), data)
+
+    # сравнение результатов после приведения к типам из конфига
+    agg_types = config['preprocessing']['agg_columns_type']
+    expected = change_cols_type(merged['result'], agg_types)
+    actual = change_cols_type(fused['result'][expected.columns], agg_types)
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_categorical=False)
+        same = True
+    except AssertionError:
+        same = False
+    # генерация по шардам должна совпадать с обработкой всех данных без приведения типов
+    try:
+        pd.testing.assert_frame_equal(fused['result'], sharded['result'])
+        sharded_same = True
+    except AssertionError:
+        sharded_same = False
+
+    print(f"rows={args.rows} users={args.users} shards={args.shards} workers={args.workers}")
+    for name, stats in [("pipeline_feature_generation", fused),
+                        ("merge_feature_generation", merged),
+                        ("sharded_feature_generation", sharded)]:
+        print(f"{name:30} wall={stats['wall_time_s']:>8}s peak={stats['peak_mb']:>8}MB")
+    print(f"results match: {same}")
+    print(f"sharded results match: {sharded_same}")
+
+
+if __name__ == "__main__":
+    main()
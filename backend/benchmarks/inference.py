@@ -0,0 +1,264 @@
+"""
+Бенчмарк инференса: предсказание по введенным данным (/predict_input),
+по файлу (/predict) и evaluate_pipeline в процессе, через TestClient и по HTTP (uvicorn).
+Результат сохраняется в json для сравнения между коммитами.
+Запуск из папки backend: python -m benchmarks.inference --mode all --compare old.json
+Версия: 1.0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+import joblib
+import numpy as np
+import requests
+import yaml
+
+from src.config.settings import get_config
+from src.evaluate.evaluate import evaluate_pipeline
+from src.preprocessing.preprocessing_input_fast import predict_records
+from .synthetic import make_raw_logs, make_agg_data, make_user_cookies
+
+CONFIG_PATH = "../config/parameters.yaml"
+REPORT_DIR = "../report/benchmarks"
+
+
+def summarize(latencies: list, wall_time: float) -> dict:
+    """
+    Пропускная способность и перцентили задержки
+    :param latencies: задержки запросов, сек
+    :param wall_time: общее время, сек
+    :return: словарь с метриками, время в мс
+    """
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall_time, 2),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def time_calls(function: Callable[[int], object], n_calls: int) -> dict:
+    """
+    Последовательные вызовы функции с замером задержки каждого вызова.
+    Первый вызов (холодный: загрузка, кэши) учитывается отдельно
+    :param function: функция, принимающая номер вызова
+    :param n_calls: кол-во вызовов после первого
+    :return: словарь с метриками
+    """
+    start = time.perf_counter()
+    function(0)
+    first_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(1, n_calls + 1):
+        call_start = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - call_start)
+    result = summarize(latencies, time.perf_counter() - start)
+    result["first_ms"] = first_ms
+    return result
+
+
+def bench_in_process(config: dict, users: list, files: dict, args) -> dict:
+    """
+    Вызовы функций предсказания без HTTP
+    :param config: словарь с данными из конфигурационного файла
+    :param users: введенные данные пользователей
+    :param files: пути до синтетических файлов (agg, raw) и конфига без кэша признаков
+    :param args: аргументы запуска
+    :return: метрики по каждой функции
+    """
+    model = joblib.load(config["train"]["model_path"])
+    columns_types = config["preprocessing"]["agg_columns_type"]
+    return {
+        "predict_records": time_calls(
+            lambda i: predict_records(model, [users[i % len(users)]], columns_types),
+            args.input_requests),
+        "evaluate_pipeline_agg": time_calls(
+            lambda i: evaluate_pipeline(config_path=files["config"],
+                                        data_path=files["agg"], model=model),
+            args.file_requests),
+        "evaluate_pipeline_raw": time_calls(
+            lambda i: evaluate_pipeline(config_path=files["config"],
+                                        data_path=files["raw"], model=model),
+            args.file_requests),
+    }
+
+
+def bench_endpoints(post: Callable, users: list, files: dict, args) -> dict:
+    """
+    Запросы к /predict_input и /predict. Для файлов повторные запросы
+    обслуживаются кэшем признаков сервиса, холодный запрос - first_ms
+    :param post: функция post(path, **kwargs) клиента
+    :param users: введенные данные пользователей
+    :param files: пути до синтетических файлов
+    :param args: аргументы запуска
+    :return: метрики по каждому endpoint
+    """
+    def upload(path: str) -> Callable[[int], object]:
+        def call(_: int):
+            with open(path, "rb") as file:
+                response = post("/predict", files={"file": (os.path.basename(path), file)})
+            response.raise_for_status()
+        return call
+
+    def predict_input(i: int):
+        post("/predict_input", json=users[i % len(users)]).raise_for_status()
+
+    return {
+        "predict_input": time_calls(predict_input, args.input_requests),
+        "predict_agg_csv": time_calls(upload(files["agg"]), args.file_requests),
+        "predict_raw_parquet": time_calls(upload(files["raw"]), args.file_requests),
+    }
+
+
+def bench_test_client(users: list, files: dict, args) -> dict:
+    """
+    Запросы к приложению через TestClient в том же процессе
+    """
+    from fastapi.testclient import TestClient  # pylint: disable=import-outside-toplevel
+    from main import app  # pylint: disable=import-outside-toplevel
+
+    with TestClient(app) as client:
+        return bench_endpoints(client.post, users, files, args)
+
+
+def bench_http(users: list, files: dict, args, timeout: float = 120) -> dict:
+    """
+    Запросы по HTTP к сервису, запущенному в отдельном процессе uvicorn
+    """
+    url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app",
+                                "--port", str(args.port), "--log-level", "warning"])
+    try:
+        finish = time.time() + timeout
+        while True:
+            try:
+                requests.get(f"{url}/model").raise_for_status()
+                break
+            except requests.ConnectionError:
+                if time.time() > finish:
+                    raise
+                time.sleep(0.5)
+        with requests.Session() as session:
+            return bench_endpoints(lambda path, **kwargs: session.post(f"{url}{path}", **kwargs),
+                                   users, files, args)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def make_files(config: dict, args, tmp_dir: str) -> dict:
+    """
+    Синтетические файлы для предсказания и конфиг с выключенным кэшем признаков
+    :param config: словарь с данными из конфигурационного файла
+    :param args: аргументы запуска
+    :param tmp_dir: временная папка
+    :return: пути до файлов
+    """
+    raw_logs = make_raw_logs(args.raw_rows, args.raw_users)
+    files = {
+        "agg": os.path.join(tmp_dir, "agg_data.csv"),
+        "raw": os.path.join(tmp_dir, "raw_logs.parquet"),
+        "config": os.path.join(tmp_dir, "parameters.yaml"),
+    }
+    make_agg_data(raw_logs, config).to_csv(files["agg"], index=False)
+    raw_logs.to_parquet(files["raw"], index=False)
+    # evaluate_pipeline в процессе замеряется без кэша признаков
+    no_cache_config = dict(config, feature_cache=dict(config["feature_cache"], enabled=False))
+    with open(files["config"], "w") as file:
+        yaml.dump(no_cache_config, file)
+    return files
+
+
+def git_commit() -> Optional[str]:
+    """Текущий коммит репозитория"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline_path: str) -> None:
+    """
+    Вывод изменения метрик относительно сохраненного ранее отчета
+    :param report: текущий отчет
+    :param baseline_path: путь до отчета для сравнения
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    print(f"\ncompare with {baseline.get('commit')} ({baseline_path})")
+    for mode, benches in report["results"].items():
+        for name, stats in benches.items():
+            old = baseline["results"].get(mode, {}).get(name)
+            if not old:
+                continue
+            changes = " ".join(
+                f"{key}={(stats[key] - old[key]) / old[key] * 100:+.1f}%"
+                for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms") if old.get(key))
+            print(f"{mode:12} {name:24} {changes}")
+
+
+def main():
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["in_process", "test_client", "http", "all"], default="all")
+    parser.add_argument("--input-requests", type=int, default=1000)
+    parser.add_argument("--file-requests", type=int, default=10)
+    parser.add_argument("--raw-rows", type=int, default=200_000)
+    parser.add_argument("--raw-users", type=int, default=5_000)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--output", default=None, help="путь до json с результатами")
+    parser.add_argument("--compare", default=None, help="json с результатами для сравнения")
+    args = parser.parse_args()
+
+    config = get_config(CONFIG_PATH)
+    users = make_user_cookies(min(args.input_requests + 1, 10_000))
+
+    modes = ["in_process", "test_client", "http"] if args.mode == "all" else [args.mode]
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": vars(args),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = make_files(config, args, tmp_dir)
+        for mode in modes:
+            if mode == "in_process":
+                report["results"][mode] = bench_in_process(config, users, files, args)
+            elif mode == "test_client":
+                report["results"][mode] = bench_test_client(users, files, args)
+            else:
+                report["results"][mode] = bench_http(users, files, args)
+
+    for mode, benches in report["results"].items():
+        for name, stats in benches.items():
+            print(f"{mode:12} {name:24} " + " ".join(f"{k}={v}" for k, v in stats.items()))
+
+    output = args.output
+    if output is None:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        output = os.path.join(REPORT_DIR, f"inference_{report['commit'] or 'local'}_"
+                                          f"{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"saved: {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
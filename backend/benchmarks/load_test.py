@@ -0,0 +1,124 @@
+"""
+Нагрузочный тест /predict_input: пропускная способность и задержки
+сервиса под gunicorn при разном кол-ве воркеров.
+Запуск из папки backend: python -m benchmarks.load_test --workers 1 2 4 --clients 16
+Версия: 1.0
+"""
+import argparse
+import os
+import subprocess
+import time
+import multiprocessing
+
+import numpy as np
+import requests
+
+USER = {
+    "part_of_day_day": 10,
+    "part_of_day_evening": 5,
+    "part_of_day_morning": 3,
+    "part_of_day_night": 1,
+    "act_days": 12,
+    "request_cnt": 40,
+    "period_days": 30,
+    "cpe_type_cd": "smartphone",
+    "cpe_manufacturer_name": "Apple",
+    "price": 50000.0,
+    "region_cnt": 2,
+    "city_cnt": 3,
+    "url_host_cnt": 25,
+}
+
+
+def run_client(args: tuple) -> list:
+    """
+    Последовательные запросы одного клиента в течение заданного времени
+    :param args: url и длительность теста, сек
+    :return: список задержек успешных запросов, сек
+    """
+    url, duration = args
+    latencies = []
+    with requests.Session() as session:
+        finish = time.perf_counter() + duration
+        while time.perf_counter() < finish:
+            start = time.perf_counter()
+            response = session.post(url, json=USER)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_load(url: str, clients: int, duration: float) -> dict:
+    """
+    Нагрузка сервиса несколькими клиентами в отдельных процессах
+    :param url: адрес /predict_input
+    :param clients: кол-во одновременных клиентов
+    :param duration: длительность теста, сек
+    :return: пропускная способность и перцентили задержки
+    """
+    with multiprocessing.Pool(clients) as pool:
+        latencies = np.concatenate([np.asarray(result) for result in
+                                    pool.map(run_client, [(url, duration)] * clients)])
+    if not len(latencies):
+        return {"requests": 0, "rps": 0.0}
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(np.percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(np.percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(np.percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def start_server(workers: int, port: int, timeout: float = 120) -> subprocess.Popen:
+    """
+    Запуск gunicorn с заданным кол-вом воркеров и ожидание готовности
+    :param workers: кол-во воркеров
+    :param port: порт
+    :param timeout: максимальное время ожидания, сек
+    :return: процесс сервера
+    """
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}")
+    process = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "main:app"], env=env)
+    finish = time.time() + timeout
+    while time.time() < finish:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/model").status_code == 200:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise TimeoutError("Сервис не запустился")
+
+
+def main():
+    """Запуск нагрузочного теста"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="кол-во воркеров gunicorn для сравнения")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--url", default=None,
+                        help="адрес уже запущенного сервиса, тогда --workers не используется")
+    args = parser.parse_args()
+
+    if args.url:
+        print(run_load(f"{args.url}/predict_input", args.clients, args.duration))
+        return
+
+    print(f"cores={multiprocessing.cpu_count()} clients={args.clients} duration={args.duration}s")
+    for workers in args.workers:
+        process = start_server(workers, args.port)
+        try:
+            stats = run_load(f"http://127.0.0.1:{args.port}/predict_input",
+                             args.clients, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"workers={workers:<3} " + " ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
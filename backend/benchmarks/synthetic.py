@@ -0,0 +1,94 @@
+"""
+Генерация синтетических данных для бенчмарков
+Версия: 1.0
+"""
+import numpy as np
+import pandas as pd
+
+MANUFACTURERS = ['Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Nokia', 'Sony', 'Realme', 'Motorola']
+DEVICE_TYPES = ['smartphone', 'tablet', 'phablet', 'plain']
+PARTS_OF_DAY = ['day', 'evening', 'morning', 'night']
+
+
+def make_raw_logs(n_rows: int,
+                  n_users: int,
+                  n_urls: int = 20000,
+                  n_regions: int = 80,
+                  n_cities: int = 900,
+                  random_state: int = 10) -> pd.DataFrame:
+    """
+    Сырые логи с колонками из change_col_types (до предобработки)
+    :param n_rows: кол-во событий
+    :param n_users: кол-во пользователей
+    :param n_urls: кол-во уникальных url
+    :param n_regions: кол-во регионов
+    :param n_cities: кол-во городов
+    :param random_state: random state
+    :return: датасет с сырыми данными
+    """
+    rng = np.random.default_rng(random_state)
+    user_id = rng.integers(0, n_users, n_rows).astype(np.int32)
+    # устройство закреплено за пользователем, чтобы мода была осмысленной
+    user_manufacturer = rng.integers(0, len(MANUFACTURERS), n_users)
+    user_type = rng.integers(0, len(DEVICE_TYPES), n_users)
+    manufacturer = np.array(MANUFACTURERS)[user_manufacturer[user_id]]
+    return pd.DataFrame({
+        'region_name': np.char.add('region_', rng.integers(0, n_regions, n_rows).astype(str)),
+        'city_name': np.char.add('city_', rng.integers(0, n_cities, n_rows).astype(str)),
+        'cpe_manufacturer_name': manufacturer,
+        'cpe_model_name': np.char.add('model_', user_manufacturer[user_id].astype(str)),
+        'url_host': np.char.add('url_', rng.zipf(1.3, n_rows).clip(max=n_urls).astype(str)),
+        'cpe_type_cd': np.array(DEVICE_TYPES)[user_type[user_id]],
+        'cpe_model_os_type': np.where(manufacturer == 'Apple', 'iOS', 'Android'),
+        'date': (np.datetime64('2022-01-01')
+                 + rng.integers(0, 90, n_rows).astype('timedelta64[D]')).astype(str),
+        'price': np.where(rng.random(n_rows) < 0.05, np.nan,
+                          rng.integers(5000, 120000, n_users)[user_id].astype(float)),
+        'part_of_day': np.array(PARTS_OF_DAY)[rng.integers(0, 4, n_rows)],
+        'request_cnt': rng.integers(1, 20, n_rows),
+        'user_id': user_id,
+    })
+
+
+def make_user_cookies(n_users: int, random_state: int = 10) -> list:
+    """
+    Введенные данные пользователей в формате UserCookies
+    :param n_users: кол-во пользователей
+    :param random_state: random state
+    :return: список словарей с признаками
+    """
+    rng = np.random.default_rng(random_state)
+    users = []
+    for _ in range(n_users):
+        period_days = int(rng.integers(1, 90))
+        users.append({
+            'part_of_day_day': int(rng.integers(0, 500)),
+            'part_of_day_evening': int(rng.integers(0, 500)),
+            'part_of_day_morning': int(rng.integers(0, 500)),
+            'part_of_day_night': int(rng.integers(0, 200)),
+            'act_days': int(rng.integers(1, period_days + 1)),
+            'request_cnt': int(rng.integers(1, 5000)),
+            'period_days': period_days,
+            'cpe_type_cd': str(rng.choice(DEVICE_TYPES)),
+            'cpe_manufacturer_name': str(rng.choice(MANUFACTURERS)),
+            'price': float(rng.integers(5000, 120000)),
+            'region_cnt': int(rng.integers(1, 10)),
+            'city_cnt': int(rng.integers(1, 20)),
+            'url_host_cnt': int(rng.integers(1, 300)),
+        })
+    return users
+
+
+def make_agg_data(raw_logs: pd.DataFrame, cfg: dict) -> pd.DataFrame:
+    """
+    Аггрегированные данные с колонками из agg_columns_type,
+    полученные из синтетических сырых логов
+    :param raw_logs: сырые логи (make_raw_logs)
+    :param cfg: словарь с данными из конфигурационного файла
+    :return: аггрегированный датасет
+    """
+    # импорт внутри функции, чтобы генерация логов не требовала пакета src
+    from src.preprocessing.preprocessing_data import (  # pylint: disable=import-outside-toplevel
+        pipeline_raw_preprocessing, pipeline_feature_generation)
+    data = pipeline_raw_preprocessing(raw_logs.copy(), cfg)
+    return pipeline_feature_generation(data)[list(cfg['preprocessing']['agg_columns_type'])]
@@ -0,0 +1,65 @@
+"""
+Настройки gunicorn для запуска сервиса несколькими воркерами uvicorn.
+Приложение (модель и словари уникальных значений) загружается в мастер-процессе
+до fork, воркеры разделяют эту память. При появлении новой версии модели
+мастер загружает ее и плавно перезапускает воркеры (SIGHUP).
+Запуск из папки backend: gunicorn -c gunicorn.conf.py main:app
+Версия: 1.0
+"""
+import gc
+import os
+import signal
+import threading
+import time
+import multiprocessing
+
+from src.config.settings import get_config, get_unique_values
+
+CONFIG_PATH = "../config/parameters.yaml"
+
+serving_config = get_config(CONFIG_PATH)["serving"]
+
+# воркеры не проверяют файл модели сами, это делает мастер
+os.environ["MODEL_RELOAD"] = "master"
+
+bind = os.environ.get("BIND", serving_config["bind"])
+# кол-во воркеров: WEB_CONCURRENCY, затем конфиг, 0 - по числу ядер
+workers = int(os.environ.get("WEB_CONCURRENCY", serving_config["workers"])) \
+    or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = serving_config["worker_timeout"]
+graceful_timeout = serving_config["graceful_timeout"]
+
+
+def watch_model(server) -> None:
+    """
+    Проверка файла модели в мастер-процессе: новая модель загружается
+    в память мастера, после чего воркеры перезапускаются и получают ее через fork
+    :param server: arbiter gunicorn
+    """
+    import main  # pylint: disable=import-outside-toplevel
+
+    while True:
+        time.sleep(serving_config["model_check_interval"])
+        try:
+            reloaded = main.registry.reload()
+        except Exception as error:  # pylint: disable=broad-except
+            server.log.error("Не удалось загрузить модель: %r", error)
+            continue
+        if reloaded:
+            # словарь уникальных значений перечитывается до fork новых воркеров
+            get_unique_values(get_config(CONFIG_PATH)["preprocessing"]["unique_values_path"])
+            gc.freeze()
+            server.log.info("Новая версия модели %s, перезапуск воркеров", main.registry.version)
+            os.kill(os.getpid(), signal.SIGHUP)
+
+
+def when_ready(server) -> None:
+    """
+    Запуск проверки файла модели после загрузки приложения в мастере
+    """
+    # объекты приложения переносятся в постоянное поколение gc, чтобы сборщик
+    # мусора в воркерах не трогал их страницы и не копировал память
+    gc.freeze()
+    threading.Thread(target=watch_model, args=(server,), daemon=True).start()
@@ -2,18 +2,31 @@
 Модель для предсказания пола пользователя по информации из его cookie-файлов
 Версия: 1.0
 """
+import os
+import json
+import asyncio
 import warnings
+from typing import Dict, List, Optional
 
 import optuna
 import uvicorn
+import orjson
 import pandas as pd
-from fastapi import FastAPI, UploadFile, File, Response
+from fastapi import FastAPI, UploadFile, File, Response, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from src.preprocessing.preprocessing_input_data import preprocessing_input
-from src.train.metrics import load_metrics
-from src.pipeline.pipeline import pipeline_train
-from src.evaluate.evaluate import evaluate_pipeline
+from src.config.settings import get_config, get_unique_values
+from src.data.get_data import detect_data_format
+from src.data.feature_cache import FeatureCache
+from src.preprocessing.preprocessing_input_fast import predict_records
+from src.evaluate.evaluate import evaluate_pipeline, evaluate_input_batch
+from src.pipeline.pipeline import pipeline_update_aggregates
+from src.serving.model_registry import ModelRegistry
+from src.serving.batcher import MicroBatcher
+from src.serving.prediction_cache import PredictionCache, MISSING
+from src.serving.training_jobs import TrainingJobs, ACTIVE_STATES
+from src.monitoring.instrumentation import configure, render_prometheus
 
 warnings.filterwarnings("ignore")
 optuna.logging.set_verbosity(optuna.logging.WARNING)
@@ -21,6 +34,24 @@ optuna.logging.set_verbosity(optuna.logging.WARNING)
 app = FastAPI()
 CONFIG_PATH = "../config/parameters.yaml"
 
+# настройки читаются один раз и перечитываются только при изменении файла,
+# обработчики получают актуальные через get_config
+config = get_config(CONFIG_PATH)
+configure(**config["instrumentation"])
+
+# под gunicorn файл модели проверяет только мастер-процесс и при новой версии
+# перезапускает воркеры (см. gunicorn.conf.py)
+MASTER_RELOAD = os.environ.get("MODEL_RELOAD") == "master"
+registry = ModelRegistry(
+    model_path=config["train"]["model_path"],
+    check_interval=None if MASTER_RELOAD else config["serving"]["model_check_interval"],
+)
+# модель и словарь уникальных значений загружаются при импорте: с preload_app
+# это происходит до fork, и воркеры разделяют их память (copy-on-write)
+registry.reload()
+
+get_unique_values(config["preprocessing"]["unique_values_path"])
+
 
 class UserCookies(BaseModel):
     """
@@ -41,67 +72,215 @@ class UserCookies(BaseModel):
     url_host_cnt: int
 
 
+class UserCookiesRecord(UserCookies):
+    """
+    Признаки пользователя с его id для пакетного предсказания
+    """
+    user_id: int = 0
+
+
+class UserCookiesBatch(BaseModel):
+    """
+    Пакет пользователей: список записей или словарь колонок с массивами значений
+    """
+    records: Optional[List[UserCookiesRecord]] = None
+    columns: Optional[Dict[str, list]] = None
+
+
+def predict_users(users: List[UserCookies]) -> list:
+    """
+    Предсказание модели для списка пользователей одним вызовом
+    :param users: список введенных данных пользователей
+    :return: список предсказаний в порядке пользователей
+    """
+    return predict_records(model=registry.get(),
+                           records=[user.dict() for user in users],
+                           columns_types=get_config(CONFIG_PATH)["preprocessing"]["agg_columns_type"])
+
+
+training_jobs = TrainingJobs(config_path=CONFIG_PATH, jobs_dir=config["train"]["jobs_dir"])
+
+batcher = MicroBatcher(
+    predict_fn=predict_users,
+    max_batch_size=config["serving"]["batch_max_size"],
+    max_wait_ms=config["serving"]["batch_max_wait_ms"],
+)
+
+# повторные запросы с теми же данными для той же версии модели берутся из кэша
+prediction_cache = PredictionCache(
+    max_size=config["serving"]["prediction_cache_size"],
+    ttl_seconds=config["serving"]["prediction_cache_ttl"],
+)
+
+
+@app.on_event("startup")
+async def startup():
+    """
+    Загрузка модели и запуск очереди микро-батчинга при старте сервиса
+    """
+    registry.reload()
+    batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Остановка очереди микро-батчинга
+    """
+    await batcher.stop()
+
+
+@app.get("/model")
+def model_info():
+    """
+    Информация о загруженной модели
+    """
+    return registry.info()
+
+
+@app.get("/unique_values")
+def unique_values():
+    """
+    Уникальные значения и диапазоны признаков из обучающих данных
+    """
+    values = get_unique_values(get_config(CONFIG_PATH)["preprocessing"]["unique_values_path"])
+    if values is None:
+        raise HTTPException(status_code=404, detail="Файл с уникальными значениями не найден")
+    return values
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Время, процессорное время, память и кол-во строк по этапам в формате Prometheus.
+    Значения накапливаются в каждом воркере отдельно
+    """
+    return Response(content=render_prometheus() + prediction_cache.render_prometheus(),
+                    media_type="text/plain; version=0.0.4")
+
+
+@app.get("/features/cache")
+def feature_cache_stats():
+    """
+    Статистика кэша предобработанных признаков
+    """
+    return FeatureCache(**get_config(CONFIG_PATH)["feature_cache"]).stats()
+
+
 @app.post("/train")
 def train():
     """
-    Обучение модели и логирование метрик
+    Запуск обучения модели в фоновом процессе.
+    Если обучение уже идет, возвращается текущая задача
     """
-    pipeline_train(config_path=CONFIG_PATH)
-    metrics = load_metrics(config_path=CONFIG_PATH)
-    return {"metrics": metrics}
+    status, created = training_jobs.submit()
+    return {"job_id": status["job_id"], "created": created, "status": status}
+
+
+@app.get("/train/{job_id}")
+def train_status(job_id: str):
+    """
+    Статус обучения: этап, прогресс подбора параметров, оценка оставшегося времени и метрики
+    """
+    status = training_jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return status
+
+
+@app.get("/train/{job_id}/events")
+async def train_events(job_id: str, interval: float = 1.0):
+    """
+    Поток статусов обучения в формате server-sent events
+    """
+    if training_jobs.status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+
+    async def events():
+        last = None
+        while True:
+            status = training_jobs.status(job_id)
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+            if status["state"] not in ACTIVE_STATES:
+                break
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 @app.post("/predict")
 def predict_from_file(file: UploadFile = File(...)):
     """
-    Предсказание модели из файла
+    Предсказание модели из файла в формате csv, parquet или arrow.
+    Формат определяется по content-type, расширению или содержимому файла
     """
-    predictions = evaluate_pipeline(config_path=CONFIG_PATH, data_path=file.file)
+    data_format = detect_data_format(file.file,
+                                     content_type=file.content_type,
+                                     filename=file.filename)
+    predictions = evaluate_pipeline(config_path=CONFIG_PATH,
+                                    data_path=file.file,
+                                    model=registry.get(),
+                                    data_format=data_format)
     return {"predictions": predictions.to_dict()}
 
 
+@app.post("/aggregates/update")
+def update_aggregates(file: UploadFile = File(...)):
+    """
+    Добавление новых сырых логов в хранилище аггрегатов по пользователям
+    и пересборка агрегированных данных для обучения
+    """
+    try:
+        return pipeline_update_aggregates(config_path=CONFIG_PATH, delta_path=file.file)
+    except RuntimeError as error:
+        raise HTTPException(status_code=409, detail=str(error)) from error
+
+
+@app.post("/predict_batch", response_class=ORJSONResponse)
+def predict_batch(batch: UserCookiesBatch, stream: bool = False):
+    """
+    Пакетное предсказание модели по списку записей или колонкам.
+    Возвращает только user_id, метку и вероятность в колоночном виде,
+    при stream=True - построчно в формате NDJSON
+    """
+    if batch.columns is not None:
+        missing = set(UserCookies.__fields__) - set(batch.columns)
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Нет признаков: {sorted(missing)}")
+        data = pd.DataFrame(batch.columns)
+    elif batch.records is not None:
+        data = pd.DataFrame([record.dict() for record in batch.records])
+    else:
+        raise HTTPException(status_code=422, detail="Нужно передать records или columns")
+
+    columns_types = get_config(CONFIG_PATH)["preprocessing"]["agg_columns_type"]
+    predictions = evaluate_input_batch(data=data, model=registry.get(), columns_types=columns_types)
+
+    if stream:
+        def ndjson_lines(chunk_size: int = 10000):
+            for start in range(0, len(predictions), chunk_size):
+                chunk = predictions.iloc[start:start + chunk_size].to_dict('records')
+                yield b"".join(orjson.dumps(row) + b"\n" for row in chunk)
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    return ORJSONResponse({col: predictions[col].to_numpy() for col in predictions.columns})
+
+
 @app.post("/predict_input")
-def predict_input(user: UserCookies):
+async def predict_input(user: UserCookies):
     """
     Предсказание модели по введенным данным
     """
-    features = [
-        [
-            user.part_of_day_day,
-            user.part_of_day_evening,
-            user.part_of_day_morning,
-            user.part_of_day_night,
-            user.act_days,
-            user.request_cnt,
-            user.period_days,
-            user.cpe_type_cd,
-            user.cpe_manufacturer_name,
-            user.price,
-            user.region_cnt,
-            user.city_cnt,
-            user.url_host_cnt,
-        ]
-    ]
-
-    cols = [
-        'part_of_day_day',
-        'part_of_day_evening',
-        'part_of_day_morning',
-        'part_of_day_night',
-        'act_days',
-        'request_cnt',
-        'period_days',
-        'cpe_type_cd',
-        'cpe_manufacturer_name',
-        'price',
-        'region_cnt',
-        'city_cnt',
-        'url_host_cnt'
-    ]
-
-    data = pd.DataFrame(features, columns=cols)
-    data = preprocessing_input(data)
-    predictions = evaluate_pipeline(config_path=CONFIG_PATH, data=data).iloc[0, -1]
+    # проверка файла модели до расчета ключа, чтобы ключ содержал актуальную версию
+    registry.get()
+    cache_key = prediction_cache.key(user.dict(), registry.version)
+    predictions = prediction_cache.get(cache_key)
+    if predictions is MISSING:
+        predictions = await batcher.submit(user)
+        prediction_cache.put(cache_key, predictions)
     result = (
         {"Пользователь мужчина"}
         if predictions == 1
@@ -112,5 +291,13 @@ def predict_input(user: UserCookies):
     return result
 
 
+@app.get("/predict_input/stats")
+def predict_input_stats():
+    """
+    Метрики микро-батчинга (размер батча и время ожидания в очереди) и кэша предсказаний
+    """
+    return dict(batcher.stats(), cache=prediction_cache.stats())
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=80)
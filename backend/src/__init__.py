@@ -1,7 +1,22 @@
+from .config.settings import *
 from .data.get_data import *
 from .data.train_test_split import *
+from .data.feature_cache import *
+from .preprocessing.derived_features import *
+from .preprocessing.distinct_sketch import *
 from .preprocessing.preprocessing_data import *
+from .preprocessing.preprocessing_input_fast import *
+from .preprocessing.streaming_aggregation import *
+from .preprocessing.sharded_aggregation import *
+from .preprocessing.aggregate_store import *
 from .train.metrics import *
+from .train.pool_cache import *
 from .train.train import *
+from .train.export import *
 from .pipeline.pipeline import *
-from .evaluate.evaluate import *
\ No newline at end of file
+from .evaluate.evaluate import *
+from .serving.model_registry import *
+from .serving.batcher import *
+from .serving.prediction_cache import *
+from .serving.oblivious_trees import *
+from .monitoring.instrumentation import *
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Настройки из parameters.yaml и словарь уникальных значений: файлы читаются
+один раз на процесс, проверяются pydantic-моделью и перечитываются при изменении
+Версия: 1.0
+"""
+import os
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Union
+
+import yaml
+from pydantic import BaseModel, Extra
+
+
+class Section(BaseModel):
+    """Секция конфига: неописанные параметры сохраняются как есть"""
+
+    class Config:
+        extra = Extra.allow
+
+
+class PreprocessingSettings(Section):
+    """Параметры предобработки"""
+    raw_data_extension: str
+    streaming_aggregation: bool = False
+    chunk_size: int = 1_000_000
+    distinct_sketch: bool = False
+    hll_precision: int = 12
+    sharded_aggregation: bool = False
+    n_shards: int = 32
+    n_workers: int = 0
+    change_col_types: Dict[str, str]
+    agg_columns_type: Dict[str, str]
+    columns_fill_na: Dict[str, Union[int, float, str]]
+    replace_values: Dict[str, Dict[str, str]]
+    columns_save_min_max: List[str]
+    columns_save_unique: List[str]
+    raw_data_path: str
+    agg_data_path: str
+    unique_values_path: str
+    aggregate_store_path: Optional[str] = None
+    aggregate_history_path: Optional[str] = None
+    memory_report_path: Optional[str] = None
+    skew_report_path: Optional[str] = None
+    skew_check_rows: int = 10000
+    shard_report_path: Optional[str] = None
+    submit_path: str
+
+
+class TrainSettings(Section):
+    """Параметры подбора гиперпараметров и обучения"""
+    target: str
+    train_test_size: float
+    train_val_size: float
+    random_state: int
+    k_folds: int
+    n_trials: int
+    n_jobs: int = -1
+    fold_jobs: int = 1
+    study_storage_timeout: float = 60
+    pool_cache_max_size_mb: float = 4096
+    columns_to_drop: Union[str, List[str]]
+    target_type: Dict[str, str]
+    target_data_path: str
+    train_data_path: str
+    model_path: str
+    study_path: str
+    metrics_path: str
+    best_params_path: str
+
+
+class FeatureCacheSettings(Section):
+    """Параметры кэша признаков"""
+    cache_dir: str
+    max_size_mb: float = 2048
+    enabled: bool = True
+
+
+class ServingSettings(Section):
+    """Параметры сервиса"""
+    model_check_interval: float = 1.0
+    batch_max_size: int = 64
+    batch_max_wait_ms: float = 3
+    prediction_cache_size: int = 10000
+    prediction_cache_ttl: Optional[float] = 600
+
+
+class InstrumentationSettings(Section):
+    """Параметры замера этапов"""
+    enabled: bool = False
+    report_dir: Optional[str] = None
+
+
+class Settings(Section):
+    """Конфигурационный файл целиком"""
+    preprocessing: PreprocessingSettings
+    train: TrainSettings
+    evaluate: Section = Section()
+    feature_cache: FeatureCacheSettings
+    serving: ServingSettings = ServingSettings()
+    instrumentation: InstrumentationSettings = InstrumentationSettings()
+    endpoints: Dict[str, str] = {}
+
+
+class _FileCache:
+    """
+    Значения, прочитанные из файлов: файл перечитывается,
+    только если изменились его mtime или размер
+    """
+
+    def __init__(self, loader: Callable[[str], object]):
+        """
+        :param loader: функция чтения файла по пути
+        """
+        self.loader = loader
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        """
+        Значение из файла
+        :param path: путь до файла
+        :return: результат loader
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != version:
+                entry = (version, self.loader(path))
+                self._entries[path] = entry
+        return entry[1]
+
+
+def _load_settings(path: str) -> tuple:
+    """
+    Чтение и проверка конфигурационного файла
+    :param path: путь до parameters.yaml
+    :return: объект настроек и словарь с проверенными значениями
+    """
+    with open(path) as file:
+        settings = Settings.parse_obj(yaml.safe_load(file))
+    return settings, settings.dict()
+
+
+def _load_json(path: str) -> dict:
+    """Чтение json-файла"""
+    with open(path) as file:
+        return json.load(file)
+
+
+_settings_cache = _FileCache(_load_settings)
+_json_cache = _FileCache(_load_json)
+
+
+def get_settings(config_path: str) -> Settings:
+    """
+    Типизированные настройки из конфигурационного файла
+    :param config_path: путь до parameters.yaml
+    :return: объект Settings
+    """
+    return _settings_cache.get(config_path)[0]
+
+
+def get_config(config_path: str) -> dict:
+    """
+    Настройки в виде словаря, как при чтении yaml. Словарь общий
+    для всех вызовов в процессе, изменять его нельзя
+    :param config_path: путь до parameters.yaml
+    :return: словарь с настройками
+    """
+    return _settings_cache.get(config_path)[1]
+
+
+def get_unique_values(unique_values_path: str) -> Optional[dict]:
+    """
+    Уникальные значения и диапазоны признаков из обучающих данных
+    :param unique_values_path: путь до unique_values.json
+    :return: словарь или None, если файла еще нет (модель не обучалась)
+    """
+    try:
+        return _json_cache.get(unique_values_path)
+    except FileNotFoundError:
+        return None
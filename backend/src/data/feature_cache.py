@@ -0,0 +1,182 @@
+"""
+Кэш предобработанных признаков по хэшу входных данных и конфигурации
+Версия: 1.0
+"""
+import os
+import json
+import uuid
+import fcntl
+import hashlib
+import threading
+from typing import IO, Optional, Union
+
+import pandas as pd
+
+
+def file_hash(data: Union[str, IO], chunk_size: int = 1 << 20) -> str:
+    """
+    Хэш содержимого файла
+    :param data: путь до файла или файловый объект
+    :param chunk_size: размер читаемого блока, байт
+    :return: hex-строка хэша
+    """
+    hasher = hashlib.sha1()
+    if isinstance(data, str):
+        with open(data, 'rb') as file:
+            for block in iter(lambda: file.read(chunk_size), b''):
+                hasher.update(block)
+    else:
+        position = data.tell()
+        for block in iter(lambda: data.read(chunk_size), b''):
+            hasher.update(block)
+        data.seek(position)
+    return hasher.hexdigest()
+
+
+def config_hash(section: dict) -> str:
+    """
+    Хэш секции конфигурационного файла
+    :param section: словарь с параметрами
+    :return: hex-строка хэша
+    """
+    return hashlib.sha1(json.dumps(section, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FeatureCache:
+    """
+    Кэш аггрегированных и приведенных к типам признаков в формате feather.
+    Ключ - хэш содержимого входных файлов и конфигурации предобработки.
+    При превышении размера удаляются давно не использованные записи (LRU).
+    Кэш общий для воркеров сервиса: временные файлы у каждого процесса свои,
+    статистика обновляется под блокировкой файла
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, max_size_mb: float = 2048, enabled: bool = True):
+        """
+        :param cache_dir: папка кэша
+        :param max_size_mb: максимальный размер кэша, Мб
+        :param enabled: если False, кэш не используется
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 2 ** 20
+        self.enabled = enabled
+        self.stats_path = os.path.join(cache_dir, "stats.json")
+        self.lock_path = os.path.join(cache_dir, "stats.lock")
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """
+        Ключ записи из хэшей входных данных и конфигурации
+        :param parts: составные части ключа
+        :return: ключ
+        """
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        """Путь до файла записи"""
+        return os.path.join(self.cache_dir, f"{key}.feather")
+
+    @staticmethod
+    def _tmp_path(path: str) -> str:
+        """Путь до временного файла, уникальный для процесса и вызова"""
+        return f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+    def _count(self, name: str, value: int = 1) -> None:
+        """
+        Обновление счетчика статистики кэша под блокировкой потоков и процессов
+        :param name: hits, misses, puts или evictions
+        :param value: приращение
+        """
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                stats = self.stats()
+                stats.pop("hit_rate")
+                stats[name] = stats.get(name, 0) + value
+                tmp_path = self._tmp_path(self.stats_path)
+                with open(tmp_path, "w") as file:
+                    json.dump(stats, file)
+                os.replace(tmp_path, self.stats_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Получение признаков из кэша
+        :param key: ключ записи
+        :return: датасет или None, если записи нет
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            data = pd.read_feather(path)
+        except (FileNotFoundError, OSError):
+            self._count("misses")
+            return None
+        # время изменения файла используется как время последнего обращения
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # запись удалил другой воркер после чтения
+            pass
+        self._count("hits")
+        return data
+
+    def put(self, key: str, data: pd.DataFrame) -> None:
+        """
+        Сохранение признаков в кэш и удаление старых записей при превышении размера
+        :param key: ключ записи
+        :param data: датасет
+        """
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = self._tmp_path(path)
+        data.reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, path)
+        self._count("puts")
+        self._evict()
+
+    def _evict(self) -> None:
+        """Удаление давно не использованных записей сверх максимального размера"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".feather"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            total -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                evicted += 1
+            except FileNotFoundError:
+                # запись уже удалил другой воркер
+                pass
+        if evicted:
+            self._count("evictions", evicted)
+
+    def stats(self) -> dict:
+        """
+        Статистика кэша: попадания, промахи, записи и удаления
+        :return: словарь со статистикой
+        """
+        try:
+            with open(self.stats_path) as file:
+                stats = json.load(file)
+        except (FileNotFoundError, ValueError):
+            stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+        requests_cnt = stats.get("hits", 0) + stats.get("misses", 0)
+        stats["hit_rate"] = round(stats.get("hits", 0) / requests_cnt, 4) if requests_cnt else None
+        return stats
@@ -2,13 +2,310 @@
 Получение данных из файла
 Версия: 1.0
 """
+import io
+import os
+import glob
+import mmap
+import hashlib
+from typing import IO, Iterator, List, Optional, Union
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# соответствие content-type и формата данных
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+    'application/parquet': 'parquet',
+    'application/vnd.apache.arrow.file': 'arrow',
+    'application/vnd.apache.arrow.stream': 'arrow_stream',
+}
+
+# соответствие расширения файла и формата данных
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pqt': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.arrows': 'arrow_stream',
+}
+
+
+def detect_data_format(data: Union[str, IO],
+                       content_type: Optional[str] = None,
+                       filename: Optional[str] = None) -> str:
+    """
+    Определение формата данных: по content-type, по расширению файла,
+    затем по первым байтам содержимого
+    :param data: путь до файла или файловый объект
+    :param content_type: content-type загруженного файла
+    :param filename: имя загруженного файла
+    :return: csv, parquet, arrow или arrow_stream
+    """
+    if content_type:
+        data_format = CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+        if data_format:
+            return data_format
+
+    if filename is None and isinstance(data, str):
+        filename = data
+    if filename:
+        data_format = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+        if data_format:
+            return data_format
+
+    # сигнатуры форматов в начале файла
+    if isinstance(data, str):
+        with open(data, 'rb') as file:
+            head = file.read(8)
+    else:
+        position = data.tell()
+        head = data.read(8)
+        data.seek(position)
+    if head[:4] == b'PAR1':
+        return 'parquet'
+    if head[:6] == b'ARROW1':
+        return 'arrow'
+    if head[:4] == b'\xff\xff\xff\xff':
+        return 'arrow_stream'
+    return 'csv'
+
+
+def _csv_dtypes(columns_types: Optional[dict]) -> Optional[dict]:
+    """
+    Типы колонок, применяемые при чтении csv: только категории и float,
+    целые типы и даты приводятся после чтения, чтобы не падать на пропусках и переполнении
+    :param columns_types: словарь с признаками и типами данных
+    :return: словарь для параметра dtype в pd.read_csv
+    """
+    if not columns_types:
+        return None
+    return {col: col_type for col, col_type in columns_types.items()
+            if col_type == 'category' or str(col_type).startswith('float')}
+
+
+def _category_columns(columns_types: Optional[dict]) -> List[str]:
+    """
+    Колонки, которые читаются сразу как категории (словарные массивы arrow)
+    :param columns_types: словарь с признаками и типами данных
+    :return: список колонок
+    """
+    return [col for col, col_type in (columns_types or {}).items() if col_type == 'category']
+
+
+def _dictionary_encode(table: pa.Table, columns: List[str]) -> pa.Table:
+    """
+    Перевод строковых колонок в словарные массивы, чтобы в pandas они
+    сразу стали категориями без создания python-строк для каждой строки
+    :param table: таблица pyarrow
+    :param columns: колонки для кодирования
+    :return: таблица pyarrow
+    """
+    for col in columns:
+        index = table.schema.get_field_index(col)
+        if index >= 0 and pa.types.is_string(table.schema.field(index).type):
+            table = table.set_column(index, col, table.column(index).dictionary_encode())
+    return table
+
+
+def _file_source(data: IO) -> pa.BufferReader:
+    """
+    Источник pyarrow для файлового объекта с текущей позиции. Файлы с дескриптором
+    (в т.ч. загруженные SpooledTemporaryFile, записанные на диск) отображаются
+    в память через mmap без копирования, остальные читаются в буфер
+    :param data: файловый объект
+    :return: источник для чтения
+    """
+    position = data.tell()
+    if isinstance(data, io.BytesIO):
+        return pa.BufferReader(pa.py_buffer(data.getbuffer()).slice(position))
+    try:
+        # у SpooledTemporaryFile в памяти fileno() сначала сбрасывает данные на диск
+        mapped = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # нет дескриптора (io.UnsupportedOperation - подкласс OSError) или пустой файл
+        return pa.BufferReader(pa.py_buffer(data.read()))
+    return pa.BufferReader(pa.py_buffer(mapped).slice(position))
+
+
+def read_arrow_table(data: Union[str, IO],
+                     data_format: str,
+                     columns: Optional[List[str]] = None,
+                     columns_types: Optional[dict] = None) -> pa.Table:
+    """
+    Чтение parquet/arrow в pyarrow.Table. Файлы на диске и загруженные файлы
+    с дескриптором читаются через memory map, остальные файловые объекты
+    копируются в буфер
+    :param data: путь до файла или файловый объект
+    :param data_format: parquet, arrow или arrow_stream
+    :param columns: список колонок для чтения, если None - все колонки
+    :param columns_types: типы колонок, категориальные читаются как словарные массивы
+    :return: таблица pyarrow
+    """
+    if isinstance(data, str):
+        source = pa.memory_map(data)
+    else:
+        source = _file_source(data)
+
+    category_columns = _category_columns(columns_types)
+    if data_format == 'parquet':
+        names = pq.ParquetFile(source).schema_arrow.names
+        table = pq.read_table(source, columns=columns, memory_map=True,
+                              read_dictionary=[col for col in category_columns if col in names])
+    elif data_format == 'arrow':
+        table = pa.ipc.open_file(source).read_all()
+    else:
+        table = pa.ipc.open_stream(source).read_all()
+    if columns is not None and data_format != 'parquet':
+        table = table.select(columns)
+    return _dictionary_encode(table, category_columns)
+
+
+def list_data_files(data_path: str, extension: Optional[str] = None) -> List[str]:
+    """
+    Файлы набора данных, записанного частями (например, part-*.parquet из Spark)
+    :param data_path: папка, шаблон glob или путь до одного файла
+    :param extension: расширение файлов в папке, если None - все известные форматы
+    :return: отсортированный список путей
+    """
+    if os.path.isdir(data_path):
+        extensions = (extension,) if extension else tuple(EXTENSIONS)
+        return sorted(os.path.join(data_path, name) for name in os.listdir(data_path)
+                      if name.lower().endswith(extensions))
+    return sorted(glob.glob(data_path))
 
 
-def get_data(data_path: str) -> pd.DataFrame:
+def resolve_data_path(data_path: str) -> str:
+    """
+    Путь до существующего файла: если файла в колоночном формате нет,
+    используется csv-файл с тем же именем (данные, сохраненные ранее)
+    :param data_path: путь из конфига
+    :return: путь до существующего файла
+    """
+    legacy_path = f"{os.path.splitext(data_path)[0]}.csv"
+    if not os.path.exists(data_path) and os.path.exists(legacy_path):
+        return legacy_path
+    return data_path
+
+
+def get_data(data_path: Union[str, IO],
+             data_format: Optional[str] = None,
+             columns: Optional[List[str]] = None,
+             columns_types: Optional[dict] = None) -> pd.DataFrame:
     """
     Чтение данных по заданному пути
-    :param data_path: путь до csv файла
+    :param data_path: путь до файла или файловый объект (csv, parquet, arrow/feather)
+    :param data_format: формат данных, если None - определяется автоматически
+    :param columns: список колонок для чтения, если None - все колонки
+    :param columns_types: типы колонок, применяемые при чтении
     :return: датасет
     """
-    return pd.read_csv(data_path)
+    if isinstance(data_path, str):
+        data_path = resolve_data_path(data_path)
+    if data_format is None:
+        data_format = detect_data_format(data_path)
+    if data_format == 'csv':
+        return pd.read_csv(data_path, usecols=columns, dtype=_csv_dtypes(columns_types))
+    table = read_arrow_table(data_path, data_format, columns, columns_types)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def save_data(data: pd.DataFrame, data_path: str) -> None:
+    """
+    Сохранение датасета с сохранением типов колонок.
+    Формат определяется по расширению: parquet/pqt, feather/arrow или csv
+    :param data: датасет
+    :param data_path: путь до файла
+    """
+    data_format = EXTENSIONS.get(os.path.splitext(data_path)[1].lower(), 'csv')
+    if data_format == 'parquet':
+        data.to_parquet(data_path, index=False)
+    elif data_format == 'arrow':
+        data.reset_index(drop=True).to_feather(data_path)
+    else:
+        data.to_csv(data_path, index=False)
+
+
+def get_data_columns(data_path: Union[str, IO], data_format: Optional[str] = None) -> list:
+    """
+    Получение списка колонок без чтения всего файла
+    :param data_path: путь до файла или файловый объект
+    :param data_format: формат данных, если None - определяется автоматически
+    :return: список колонок
+    """
+    if data_format is None:
+        data_format = detect_data_format(data_path)
+    if data_format == 'csv':
+        columns = pd.read_csv(data_path, nrows=0).columns.tolist()
+    elif data_format == 'parquet':
+        columns = pq.ParquetFile(data_path).schema_arrow.names
+    elif data_format == 'arrow':
+        source = pa.memory_map(data_path) if isinstance(data_path, str) else data_path
+        columns = pa.ipc.open_file(source).schema.names
+    else:
+        source = pa.memory_map(data_path) if isinstance(data_path, str) else data_path
+        columns = pa.ipc.open_stream(source).schema.names
+    if not isinstance(data_path, str):
+        data_path.seek(0)
+    return columns
+
+
+def iter_data_chunks(data_path: Union[str, IO],
+                     data_format: Optional[str] = None,
+                     chunk_size: int = 1_000_000,
+                     columns: Optional[list] = None,
+                     columns_types: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """
+    Чтение файла частями, не загружая его в память целиком
+    :param data_path: путь до файла или файловый объект
+    :param data_format: формат данных, если None - определяется автоматически
+    :param chunk_size: кол-во строк в одной части
+    :param columns: список колонок для чтения, если None - все колонки
+    :param columns_types: типы колонок, применяемые при чтении
+    :return: итератор по частям датасета
+    """
+    if data_format is None:
+        data_format = detect_data_format(data_path)
+    category_columns = _category_columns(columns_types)
+    if data_format == 'csv':
+        yield from pd.read_csv(data_path, chunksize=chunk_size, usecols=columns,
+                               dtype=_csv_dtypes(columns_types))
+    elif data_format == 'parquet':
+        names = pq.ParquetFile(data_path).schema_arrow.names
+        if not isinstance(data_path, str):
+            data_path.seek(0)
+        parquet_file = pq.ParquetFile(data_path,
+                                      read_dictionary=[col for col in category_columns
+                                                       if col in names])
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        source = pa.memory_map(data_path) if isinstance(data_path, str) else data_path
+        if data_format == 'arrow':
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            batches = pa.ipc.open_stream(source)
+        for batch in batches:
+            table = pa.Table.from_batches([batch])
+            if columns is not None:
+                table = table.select(columns)
+            table = _dictionary_encode(table, category_columns)
+            for start in range(0, table.num_rows, chunk_size):
+                yield table.slice(start, chunk_size).to_pandas()
+
+
+def get_data_hash(data: pd.DataFrame) -> str:
+    """
+    Хэш содержимого датасета (значения, индекс и колонки)
+    :param data: датасет
+    :return: hex-строка хэша
+    """
+    hasher = hashlib.sha1(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    hasher.update(str(list(zip(data.columns, data.dtypes.astype(str)))).encode())
+    return hasher.hexdigest()[:16]
@@ -6,6 +6,8 @@ from typing import Tuple
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
+from .get_data import save_data
+
 
 def split_data(data: pd.DataFrame, **kwargs) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
@@ -19,8 +21,8 @@ def split_data(data: pd.DataFrame, **kwargs) -> Tuple[pd.DataFrame, pd.DataFrame
         test_size=kwargs['train_test_size'],
         random_state=kwargs['random_state']
     )
-    data_train.to_csv(kwargs['train_split_path'], index_label=False)
-    data_test.to_csv(kwargs['test_split_path'], index_label=False)
+    save_data(data_train, kwargs['train_split_path'])
+    save_data(data_test, kwargs['test_split_path'])
     return data_train, data_test
 
 
@@ -3,54 +3,125 @@
 Версия: 1.0
 """
 import os
-import yaml
 import joblib
 
+import numpy as np
 import pandas as pd
 from catboost import Pool
 import catboost
 
-from ..data.get_data import get_data
-from ..preprocessing.preprocessing_data import pipeline_preprocessing
+from ..config.settings import get_config
+from ..data.get_data import get_data, get_data_columns
+from ..data.feature_cache import FeatureCache, file_hash, config_hash
+from ..preprocessing.preprocessing_data import pipeline_preprocessing, change_cols_type
+from ..preprocessing.preprocessing_input_data import preprocessing_input
+from ..preprocessing.streaming_aggregation import pipeline_streaming_feature_generation
+from ..monitoring.instrumentation import configure, stage, RunReport
 
 
 def evaluate_pipeline(config_path: str,
                       data: pd.DataFrame = None,
                       data_path: str = None,
-                      flag_raw: bool = False):
+                      flag_raw: bool = False,
+                      model: object = None,
+                      data_format: str = None):
     """
     Предобработка данных и получение предсказаний
     :param config_path: путь к конфигурационному файлу
     :param data: датасет
     :param data_path: путь до датасета
     :param flag_raw: если True, то данные предобрабатываются, как сырые
+    :param model: загруженная модель, если None - модель читается с диска
+    :param data_format: формат файла (csv, parquet, arrow), если None - определяется автоматически
     """
     # чтение конфигурационного файла
-    with open(config_path) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(config_path)
 
     train_config = config['train']
+    configure(**config['instrumentation'])
 
-    if data_path:
-        data = get_data(data_path=data_path)
+    # этапы предсказания сохраняются в report/stages_evaluate.jsonl
+    with RunReport("evaluate"), stage("evaluate_pipeline"):
+        # признаки загруженного файла берутся из кэша, если файл уже обрабатывался
+        feature_cache = FeatureCache(**config['feature_cache'])
+        cache_key = None
+        if data_path:
+            cache_key = feature_cache.key(file_hash(data_path),
+                                          config_hash(config['preprocessing']))
+            cached_data = feature_cache.get(cache_key)
+        else:
+            cached_data = None
 
-    # проверка на наличие признака из сырых данных
-    # если он есть, то данные будут предобработаны, как сырые
-    if 'region_name' in data.columns:
-        flag_raw = True
+        if cached_data is not None:
+            data = cached_data
+        else:
+            if data_path and config['preprocessing']['streaming_aggregation'] \
+                    and 'region_name' in get_data_columns(data_path, data_format=data_format):
+                # сырые данные аггрегируются частями, не загружая файл в память целиком
+                data = pipeline_streaming_feature_generation(data_path=data_path,
+                                                             cfg=config,
+                                                             data_format=data_format)
+            elif data_path:
+                # категории и float применяются при чтении, без последующих копий
+                with stage("read") as record:
+                    data = get_data(data_path=data_path,
+                                    data_format=data_format,
+                                    columns_types=config['preprocessing']['change_col_types'])
+                    record.rows_out = len(data)
 
-    # обработка данных
-    data = pipeline_preprocessing(data=data,
-                                  cfg=config,
-                                  flag_raw=flag_raw,
-                                  flag_train=False)
+            # проверка на наличие признака из сырых данных
+            # если он есть, то данные будут предобработаны, как сырые
+            if 'region_name' in data.columns:
+                flag_raw = True
+
+            # обработка данных
+            data = pipeline_preprocessing(data=data,
+                                          cfg=config,
+                                          flag_raw=flag_raw,
+                                          flag_train=False)
+            if cache_key:
+                feature_cache.put(cache_key, data)
+
+        if model is None:
+            model = joblib.load(os.path.join(train_config["model_path"]))
+        with stage("predict", rows_in=len(data)):
+            if type(model) == catboost.core.CatBoostClassifier:
+                category_features = data.select_dtypes('category').columns.tolist()
+                data_pool = Pool(data, cat_features=category_features)
+                prediction = model.predict(data_pool).tolist()
+            else:
+                prediction = model.predict(data).tolist()
+        data['predict'] = prediction
+        return data
+
+
+def evaluate_input_batch(data: pd.DataFrame,
+                         model: object,
+                         columns_types: dict) -> pd.DataFrame:
+    """
+    Предсказание для батча введенных данных одним вызовом модели
+    :param data: датасет с введенными признаками и, опционально, user_id
+    :param model: обученная модель
+    :param columns_types: словарь с признаками и типами (agg_columns_type)
+    :return: датасет с колонками user_id, predict, probability
+    """
+    if 'user_id' in data.columns:
+        user_ids = data['user_id'].to_numpy()
+        data = data.drop(columns='user_id')
+    else:
+        user_ids = np.zeros(len(data), dtype=np.int64)
+
+    data = preprocessing_input(data)
+    # порядок признаков берется из модели, если она его хранит
+    columns = list(getattr(model, 'feature_names_', None) or columns_types)
+    data = change_cols_type(data[columns], {col: columns_types[col] for col in columns})
 
-    model = joblib.load(os.path.join(train_config["model_path"]))
     if type(model) == catboost.core.CatBoostClassifier:
         category_features = data.select_dtypes('category').columns.tolist()
-        data_pool = Pool(data, cat_features=category_features)
-        prediction = model.predict(data_pool).tolist()
-    else:
-        prediction = model.predict(data).tolist()
-    data['predict'] = prediction
-    return data
+        data = Pool(data, cat_features=category_features)
+    probabilities = model.predict_proba(data)
+    labels = np.asarray(model.classes_)[probabilities.argmax(axis=1)]
+
+    return pd.DataFrame({'user_id': user_ids,
+                         'predict': labels,
+                         'probability': probabilities[:, 1]})
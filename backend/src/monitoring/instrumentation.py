@@ -0,0 +1,264 @@
+"""
+Замер этапов обработки данных, обучения и предсказания: время, процессорное время,
+пиковая память процесса и кол-во строк. Накопленные значения отдаются в формате
+Prometheus, записи каждого запуска дописываются строкой в jsonl-отчет.
+При выключенном замере этапы не создают объектов и не вызывают системных функций
+Версия: 1.0
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import warnings
+import resource
+import threading
+import functools
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+_settings = {"enabled": False, "report_dir": None}
+_lock = threading.Lock()
+_local = threading.local()
+# накопленные значения по этапам для /metrics
+_totals: Dict[str, dict] = {}
+
+
+def configure(enabled: bool = True, report_dir: Optional[str] = None) -> None:
+    """
+    Включение замеров и папка для json-отчетов
+    :param enabled: если False, этапы не замеряются
+    :param report_dir: папка для отчетов по запускам, если None - отчеты не сохраняются
+    """
+    _settings["enabled"] = enabled
+    _settings["report_dir"] = report_dir
+
+
+def _peak_rss_mb() -> float:
+    """Пиковая память процесса, Мб (ru_maxrss в Linux - в Кб)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def _count_rows(value) -> Optional[int]:
+    """Кол-во строк датафрейма или None для остальных объектов"""
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+
+
+class StageRecord:
+    """
+    Результат замера этапа
+    """
+    __slots__ = ("name", "rows_in", "rows_out", "wall_s", "cpu_s", "peak_rss_mb", "rss_growth_mb")
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        """
+        :param name: полное название этапа (вложенные этапы через /)
+        :param rows_in: кол-во строк на входе
+        """
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_rss_mb = None
+        self.rss_growth_mb = None
+
+    def as_dict(self) -> dict:
+        """Запись в виде словаря"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _NullStage:
+    """Этап при выключенном замере: ничего не делает"""
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """
+    Контекстный менеджер замера этапа
+    """
+
+    def __init__(self, name: str, rows_in: Optional[int]):
+        self.name = name
+        self.rows_in = rows_in
+        self.record = None
+        self._start = None
+
+    def __enter__(self) -> StageRecord:
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.record = StageRecord("/".join(stack + [self.name]), self.rows_in)
+        stack.append(self.name)
+        self._start = (time.perf_counter(), time.process_time(), _peak_rss_mb())
+        return self.record
+
+    def __exit__(self, *exc) -> bool:
+        wall_start, cpu_start, rss_start = self._start
+        record = self.record
+        record.wall_s = round(time.perf_counter() - wall_start, 6)
+        record.cpu_s = round(time.process_time() - cpu_start, 6)
+        record.peak_rss_mb = round(_peak_rss_mb(), 1)
+        record.rss_growth_mb = round(record.peak_rss_mb - rss_start, 1)
+        _local.stack.pop()
+        _add_record(record)
+        return False
+
+
+def _add_record(record: StageRecord) -> None:
+    """
+    Добавление записи в накопленные значения и в текущий запуск потока
+    :param record: запись этапа
+    """
+    with _lock:
+        totals = _totals.setdefault(record.name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                                  "rows": 0, "peak_rss_mb": 0.0,
+                                                  "last_wall_s": 0.0})
+        totals["calls"] += 1
+        totals["wall_s"] += record.wall_s
+        totals["cpu_s"] += record.cpu_s
+        totals["rows"] += record.rows_in or 0
+        totals["peak_rss_mb"] = max(totals["peak_rss_mb"], record.peak_rss_mb)
+        totals["last_wall_s"] = record.wall_s
+    run_records = getattr(_local, "run", None)
+    if run_records is not None:
+        run_records.append(record)
+
+
+def stage(name: str, rows_in: Optional[int] = None):
+    """
+    Замер этапа: with stage("read", rows_in=len(data)) as record: ...
+    В record можно записать rows_out
+    :param name: название этапа
+    :param rows_in: кол-во строк на входе
+    :return: контекстный менеджер
+    """
+    if not _settings["enabled"]:
+        return _NULL_STAGE
+    return _Stage(name, rows_in)
+
+
+def instrument(name: Optional[str] = None) -> Callable:
+    """
+    Декоратор замера функции как этапа. Кол-во строк берется из первого
+    аргумента-датафрейма и из результата, если он датафрейм
+    :param name: название этапа, по умолчанию - имя функции
+    :return: декоратор
+    """
+    def decorator(function: Callable) -> Callable:
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _settings["enabled"]:
+                return function(*args, **kwargs)
+            rows_in = next((rows for rows in map(_count_rows, list(args) + list(kwargs.values()))
+                            if rows is not None), None)
+            with _Stage(stage_name, rows_in) as record:
+                result = function(*args, **kwargs)
+                record.rows_out = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+class RunReport:
+    """
+    Запуск (обучение, предсказание по файлу): записи этапов в потоке
+    собираются и дописываются строкой с id запуска в report_dir/stages_<name>.jsonl.
+    Запись под блокировкой файла, поэтому параллельные запросы и воркеры
+    не перезаписывают отчеты друг друга. Ошибка записи отчета не прерывает запуск
+    """
+
+    def __init__(self, name: str):
+        """
+        :param name: название запуска
+        """
+        self.name = name
+        self.run_id = uuid.uuid4().hex
+        self.records: List[StageRecord] = []
+        self._started_at = None
+
+    def __enter__(self) -> 'RunReport':
+        if _settings["enabled"]:
+            self._started_at = time.time()
+            _local.run = self.records
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self._started_at is None:
+            return False
+        _local.run = None
+        if _settings["report_dir"]:
+            report = {
+                "run": self.name,
+                "run_id": self.run_id,
+                "pid": os.getpid(),
+                "started_at": self._started_at,
+                "wall_s": round(time.time() - self._started_at, 3),
+                "failed": exc[0] is not None,
+                "stages": [record.as_dict() for record in self.records],
+            }
+            try:
+                self._append(report)
+            except Exception as error:  # pylint: disable=broad-except
+                warnings.warn(f"Не удалось сохранить отчет {self.name}: {error!r}")
+        return False
+
+    def _append(self, report: dict) -> None:
+        """
+        Добавление отчета запуска строкой в jsonl-файл
+        :param report: отчет запуска
+        """
+        os.makedirs(_settings["report_dir"], exist_ok=True)
+        path = os.path.join(_settings["report_dir"], f"stages_{self.name}.jsonl")
+        line = json.dumps(report, ensure_ascii=False) + "\n"
+        with open(path, "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.write(line)
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def stage_totals() -> Dict[str, dict]:
+    """
+    Накопленные значения по этапам в текущем процессе
+    :return: словарь этап -> значения
+    """
+    with _lock:
+        return {name: dict(values) for name, values in _totals.items()}
+
+
+def render_prometheus() -> str:
+    """
+    Накопленные значения этапов в текстовом формате Prometheus
+    :return: текст для /metrics
+    """
+    metrics = [
+        ("stage_calls_total", "counter", "Кол-во выполнений этапа", "calls", 1),
+        ("stage_wall_seconds_total", "counter", "Суммарное время этапа", "wall_s", 1),
+        ("stage_cpu_seconds_total", "counter", "Суммарное процессорное время процесса", "cpu_s", 1),
+        ("stage_rows_total", "counter", "Суммарное кол-во строк на входе", "rows", 1),
+        ("stage_last_wall_seconds", "gauge", "Время последнего выполнения этапа", "last_wall_s", 1),
+        ("stage_peak_rss_bytes", "gauge", "Пиковая память процесса после этапа", "peak_rss_mb", 2 ** 20),
+    ]
+    totals = stage_totals()
+    lines = []
+    for metric, metric_type, description, key, scale in metrics:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for name, values in sorted(totals.items()):
+            lines.append(f'{metric}{{stage="{name}"}} {values[key] * scale:g}')
+    return "\n".join(lines) + "\n"
@@ -3,47 +3,185 @@
 Версия: 1.0
 """
 import os
-import yaml
+import json
+from typing import Callable
+
 import joblib
 
-from ..data.get_data import get_data
+from ..config.settings import get_config
+from ..data.get_data import get_data, save_data, resolve_data_path
+from ..data.feature_cache import FeatureCache, file_hash, config_hash
 from ..preprocessing.preprocessing_data import pipeline_preprocessing
+from ..preprocessing.aggregate_store import UserAggregateStore
+from ..preprocessing.preprocessing_input_fast import check_feature_skew
 from ..data.train_test_split import split_data
-from ..train.train import find_optimal_params, train_model
+from ..train.train import find_optimal_params, train_model, to_inmemory_study
+from ..train.export import export_model, validate_export
+from ..monitoring.instrumentation import configure, stage, RunReport
 
 
-def pipeline_train(config_path: str) -> None:
+def pipeline_train(config_path: str,
+                   progress: Callable[[str], None] = None,
+                   callbacks: list = None) -> None:
     """
     Функция считывает конфиг, получает и обрабатывает данные, ищет лучшие параметры,
     обучает на них модель и сохраняет ее
     :param config_path: путь до конфигурационного файла
+    :param progress: функция, получающая название текущего этапа
+    :param callbacks: callbacks optuna, вызываемые после каждого trial
     :return: None
     """
+    if progress is None:
+        progress = lambda name: None
+
     # чтение конфигурационного файла
-    with open(config_path) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(config_path)
     preproc_config = config['preprocessing']
     train_config = config['train']
+    configure(**config['instrumentation'])
+
+    # этапы обучения замеряются и сохраняются в report/stages_train.jsonl
+    with RunReport("train"), stage("pipeline_train"):
+        # признаки берутся из кэша, если агрегированные данные, таргет
+        # и параметры предобработки не изменились
+        agg_data_path = resolve_data_path(preproc_config['agg_data_path'])
+        feature_cache = FeatureCache(**config['feature_cache'])
+        cache_key = feature_cache.key(
+            file_hash(agg_data_path),
+            file_hash(train_config['target_data_path']),
+            config_hash({'preprocessing': preproc_config,
+                         'target': train_config['target'],
+                         'target_type': train_config['target_type']})
+        )
+        train_data = None
+        if os.path.exists(preproc_config['unique_values_path']):
+            train_data = feature_cache.get(cache_key)
+
+        if train_data is None:
+            # получение данных
+            progress("preprocessing")
+            data = get_data(data_path=agg_data_path,
+                            columns_types=preproc_config['agg_columns_type'])
+
+            # обработка данных
+            train_data = pipeline_preprocessing(data=data, cfg=config,
+                                                flag_raw=False, flag_train=True)
+            feature_cache.put(cache_key, train_data)
+
+        # признаки, которые сервис строит по введенным данным, сверяются с обучающими
+        if preproc_config['skew_report_path']:
+            with stage("feature_skew"):
+                skew = check_feature_skew(train_data.head(preproc_config['skew_check_rows']),
+                                          preproc_config['agg_columns_type'])
+            with open(preproc_config['skew_report_path'], 'w') as file:
+                json.dump(skew, file, indent=2)
 
-    # получение данных
-    data = get_data(data_path=preproc_config['agg_data_path'])
+        # сплит данных на train/test
+        df_train, df_test = split_data(train_data, **train_config)
 
-    # обработка данных
-    train_data = pipeline_preprocessing(data=data, cfg=config, flag_raw=False, flag_train=True)
+        # поиск лучших параметров
+        progress("tuning")
+        study = find_optimal_params(data_train=df_train,
+                                    data_test=df_test,
+                                    callbacks=callbacks,
+                                    **train_config)
 
-    # сплит данных на train/test
-    df_train, df_test = split_data(train_data, **train_config)
+        # обучаем модель на лучших найденных параметрах
+        progress("fitting")
+        cat_clf = train_model(data_train=df_train,
+                              data_test=df_test,
+                              study=study,
+                              target=train_config['target'],
+                              metric_path=train_config['metrics_path'],
+                              pool_cache_dir=train_config['pool_cache_dir'],
+                              best_params_path=train_config['best_params_path'],
+                              pool_cache_max_size_mb=train_config['pool_cache_max_size_mb'])
+
+        # сохраняем модель и study
+        progress("saving")
+        # модель пишется во временный файл и подменяется атомарно,
+        # чтобы реестр моделей не прочитал недописанный файл
+        model_path = os.path.join(train_config["model_path"])
+        joblib.dump(cat_clf, f"{model_path}.tmp")
+        os.replace(f"{model_path}.tmp", model_path)
+        joblib.dump(to_inmemory_study(study), os.path.join(train_config["study_path"]))
+
+        # переносимая выгрузка модели и сверка numpy-применения с CatBoost на тесте
+        x_test = df_test.drop(columns=[train_config['target']])
+        meta = export_model(model=cat_clf, data=x_test, export_dir=train_config['export_dir'])
+        if meta['json_exported']:
+            validate_export(model=cat_clf,
+                            data=x_test.head(train_config['export_validation_rows']),
+                            export_dir=train_config['export_dir'],
+                            tolerance=train_config['export_tolerance'])
+
+
+def _materialize_aggregates(store: UserAggregateStore, agg_data_path: str) -> None:
+    """
+    Пересборка агрегированных данных из хранилища. Файл подменяется атомарно,
+    чтобы обучение не прочитало недописанные данные
+    :param store: хранилище аггрегатов
+    :param agg_data_path: путь до агрегированных данных
+    """
+    with stage("materialize"):
+        root, extension = os.path.splitext(agg_data_path)
+        tmp_path = f"{root}.tmp{extension}"
+        save_data(store.materialize(), tmp_path)
+        os.replace(tmp_path, agg_data_path)
 
-    # поиск лучших параметров
-    study = find_optimal_params(data_train=df_train, data_test=df_test, **train_config)
 
-    # обучаем модель на лучших найденных параметрах
-    cat_clf = train_model(data_train=df_train,
-                          data_test=df_test,
-                          study=study,
-                          target=train_config['target'],
-                          metric_path=train_config['metrics_path'])
+def pipeline_seed_aggregates(config_path: str, history_path: str = None) -> dict:
+    """
+    Заполнение хранилища аггрегатов всей историей сырых логов и сборка
+    агрегированных данных. Долгая операция, запускается отдельно от сервиса
+    (python -m src.pipeline.seed_aggregates), прерванную загрузку можно повторить
+    :param config_path: путь до конфигурационного файла
+    :param history_path: папка, шаблон glob или файл с историей логов,
+    если None - aggregate_history_path из конфига
+    :return: статистика загрузки и размер хранилища
+    """
+    config = get_config(config_path)
+    preproc_config = config['preprocessing']
+    configure(**config['instrumentation'])
+
+    history_path = history_path or preproc_config['aggregate_history_path']
+    if not history_path:
+        raise ValueError("Не задан путь до истории логов aggregate_history_path")
+    with stage("pipeline_seed_aggregates"):
+        store = UserAggregateStore(preproc_config['aggregate_store_path'], config)
+        with stage("seed_store"):
+            result = store.seed(history_path)
+        _materialize_aggregates(store, preproc_config['agg_data_path'])
+        result['store'] = store.stats()
+    return result
+
+
+def pipeline_update_aggregates(config_path: str, delta_path) -> dict:
+    """
+    Добавление новых сырых логов в хранилище аггрегатов и пересборка
+    агрегированных данных (agg_data_path) без пересчета всей истории.
+    Хранилище должно быть заранее заполнено всей историей логов
+    (pipeline_seed_aggregates), иначе обновление не выполняется
+    :param config_path: путь до конфигурационного файла
+    :param delta_path: путь до файла или файловый объект с новыми логами
+    :return: статистика обновления и размер хранилища
+    """
+    config = get_config(config_path)
+    preproc_config = config['preprocessing']
+    configure(**config['instrumentation'])
 
-    # сохраняем модель и study
-    joblib.dump(cat_clf, os.path.join(train_config["model_path"]))
-    joblib.dump(study, os.path.join(train_config["study_path"]))
+    with stage("pipeline_update_aggregates"):
+        store = UserAggregateStore(preproc_config['aggregate_store_path'], config)
+        if not store.seeded:
+            # загрузка всей истории не укладывается в таймаут запроса
+            raise RuntimeError("Хранилище аггрегатов не заполнено историей логов: "
+                               "запустите python -m src.pipeline.seed_aggregates")
+        with stage("read_delta"):
+            delta = get_data(data_path=delta_path,
+                             columns_types=preproc_config['change_col_types'])
+        with stage("update_store"):
+            result = store.update(delta)
+        if result['applied']:
+            _materialize_aggregates(store, preproc_config['agg_data_path'])
+        result['store'] = store.stats()
+    return result
@@ -0,0 +1,28 @@
+"""
+Заполнение хранилища аггрегатов всей историей сырых логов (выполняется один раз
+до обновлений через /aggregates/update, в сервисе не укладывается в таймаут запроса).
+Запуск из папки backend: python -m src.pipeline.seed_aggregates [--history-path <папка или glob>]
+Версия: 1.0
+"""
+import argparse
+import json
+
+from .pipeline import pipeline_seed_aggregates
+
+CONFIG_PATH = "../config/parameters.yaml"
+
+
+def main():
+    """Запуск загрузки истории"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default=CONFIG_PATH, help="путь до конфигурационного файла")
+    parser.add_argument("--history-path", default=None,
+                        help="папка, шаблон glob или файл с историей логов, "
+                             "без него - aggregate_history_path из конфига")
+    args = parser.parse_args()
+    result = pipeline_seed_aggregates(config_path=args.config, history_path=args.history_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Хранилище промежуточных аггрегатов по пользователям (SQLite): новые логи
+добавляются инкрементально, итоговые признаки собираются без пересчета всей истории
+Версия: 1.0
+"""
+import os
+import time
+import sqlite3
+from contextlib import closing
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from ..data.get_data import get_data_hash, iter_data_chunks, list_data_files
+from .preprocessing_data import pipeline_raw_preprocessing, change_cols_type
+from .streaming_aggregation import UserAggregates, MODE_COLUMNS, DISTINCT_COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vocab (
+    feature TEXT NOT NULL, value TEXT NOT NULL, code INTEGER NOT NULL,
+    PRIMARY KEY (feature, value)) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS vocab_code ON vocab (feature, code);
+CREATE TABLE IF NOT EXISTS scalars (
+    user_id INTEGER PRIMARY KEY, request_cnt INTEGER NOT NULL,
+    price_sum REAL NOT NULL, price_count INTEGER NOT NULL,
+    date_min INTEGER NOT NULL, date_max INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS counters (
+    feature TEXT NOT NULL, pair_key INTEGER NOT NULL, value_count INTEGER NOT NULL,
+    PRIMARY KEY (feature, pair_key)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS distinct_keys (
+    feature TEXT NOT NULL, pair_key INTEGER NOT NULL,
+    PRIMARY KEY (feature, pair_key)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS deltas (
+    delta_hash TEXT PRIMARY KEY, rows INTEGER NOT NULL, applied_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _to_days(dates: pd.Series) -> np.ndarray:
+    """Даты в кол-во дней от 1970-01-01"""
+    return dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+class UserAggregateStore:
+    """
+    Аггрегаты UserAggregates, сохраненные в SQLite: суммы и даты по пользователю,
+    счетчики частей суток и значений устройства, множества дат, регионов, городов и url.
+    Обновление стоит O(размер новых логов), повторно переданные логи не учитываются.
+    Итоговые признаки собираются только после загрузки всей истории логов (seed),
+    иначе они содержали бы лишь пользователей из переданных изменений
+    """
+
+    def __init__(self, db_path: str, cfg: dict):
+        """
+        :param db_path: путь до файла SQLite
+        :param cfg: словарь с данными из конфигурационного файла
+        """
+        self.db_path = db_path
+        self.cfg = cfg
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Соединение с хранилищем. Транзакции открываются явно (BEGIN IMMEDIATE),
+        иначе sqlite3 берет блокировку на запись только перед первым INSERT
+        """
+        connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    @staticmethod
+    def _load_vocab(connection: sqlite3.Connection) -> Dict[str, dict]:
+        """
+        Словари значений в порядке кодов, как в UserAggregates.vocab
+        """
+        vocab = {}
+        for column, value, code in connection.execute(
+                "SELECT feature, value, code FROM vocab ORDER BY feature, code"):
+            vocab.setdefault(column, {})[value] = code
+        return vocab
+
+    @property
+    def seeded(self) -> bool:
+        """Загружена ли в хранилище вся история логов"""
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT value FROM meta WHERE name = 'seeded_at'").fetchone()
+        return row is not None
+
+    def seed(self, history_path: str) -> dict:
+        """
+        Загрузка всей истории сырых логов по файлам и частям. Уже загруженные
+        части пропускаются, поэтому прерванную загрузку можно повторить
+        :param history_path: папка (файлы с расширением raw_data_extension), шаблон glob
+        или путь до файла со всей историей логов
+        :return: статистика загрузки
+        """
+        preproc_config = self.cfg['preprocessing']
+        paths = list_data_files(history_path, preproc_config['raw_data_extension'])
+        if not paths:
+            raise FileNotFoundError(f"Не найдены файлы истории логов: {history_path}")
+        chunks, applied = 0, 0
+        for path in paths:
+            for chunk in iter_data_chunks(path,
+                                          chunk_size=preproc_config['chunk_size'],
+                                          columns=list(preproc_config['change_col_types']),
+                                          columns_types=preproc_config['change_col_types']):
+                chunks += 1
+                applied += self.update(chunk)['applied']
+        with closing(self._connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('seeded_at', ?)",
+                               (str(time.time()),))
+        return {"files": len(paths), "chunks": chunks, "applied": applied}
+
+    def update(self, delta: pd.DataFrame) -> dict:
+        """
+        Добавление новых сырых логов
+        :param delta: сырые логи с колонками из change_col_types
+        :return: статистика обновления
+        """
+        delta_hash = get_data_hash(delta)
+        rows = len(delta)
+        delta_aggregates = UserAggregates().update(pipeline_raw_preprocessing(delta, self.cfg))
+        # значения словарей хранятся строками (в том числе даты)
+        delta_aggregates.vocab = {column: {str(value): code for value, code in values.items()}
+                                  for column, values in delta_aggregates.vocab.items()}
+
+        with closing(self._connect()) as connection, connection:
+            # блокировка на запись берется до проверки повторов и чтения словарей:
+            # параллельные обновления (воркеры сервиса, загрузка истории) выполняются
+            # по очереди и не выдают одинаковые коды разным значениям
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("SELECT 1 FROM deltas WHERE delta_hash = ?",
+                                  (delta_hash,)).fetchone():
+                return {"delta_hash": delta_hash, "rows": rows, "applied": False}
+
+            # коды значений новых логов переводятся в коды хранилища
+            store = UserAggregates()
+            store.vocab = self._load_vocab(connection)
+            vocab_sizes = {column: len(values) for column, values in store.vocab.items()}
+
+            scalars = delta_aggregates.scalars
+            connection.executemany(
+                "INSERT INTO scalars VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                "request_cnt = request_cnt + excluded.request_cnt, "
+                "price_sum = price_sum + excluded.price_sum, "
+                "price_count = price_count + excluded.price_count, "
+                "date_min = MIN(date_min, excluded.date_min), "
+                "date_max = MAX(date_max, excluded.date_max)",
+                zip(scalars.index.tolist(),
+                    scalars['request_cnt'].tolist(),
+                    scalars['price_sum'].tolist(),
+                    scalars['price_count'].tolist(),
+                    _to_days(scalars['date_min']).tolist(),
+                    _to_days(scalars['date_max']).tolist()))
+
+            for column, counts in delta_aggregates.counters.items():
+                keys = store._recode(column, delta_aggregates, counts.index.to_numpy())
+                connection.executemany(
+                    "INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT(feature, pair_key) "
+                    "DO UPDATE SET value_count = value_count + excluded.value_count",
+                    zip([column] * len(keys), keys.tolist(), counts.tolist()))
+
+            new_keys = 0
+            for column, keys in delta_aggregates.distinct.items():
+                keys = store._recode(column, delta_aggregates, keys)
+                changes = connection.total_changes
+                connection.executemany("INSERT OR IGNORE INTO distinct_keys VALUES (?, ?)",
+                                       zip([column] * len(keys), keys.tolist()))
+                new_keys += connection.total_changes - changes
+
+            # новые значения словарей получили коды при перекодировании
+            for column, values in store.vocab.items():
+                start = vocab_sizes.get(column, 0)
+                connection.executemany("INSERT INTO vocab VALUES (?, ?, ?)",
+                                       ((column, value, code) for value, code in values.items()
+                                        if code >= start))
+            connection.execute("INSERT INTO deltas VALUES (?, ?, ?)",
+                               (delta_hash, rows, time.time()))
+
+        return {"delta_hash": delta_hash,
+                "rows": rows,
+                "applied": True,
+                "users": len(scalars),
+                "new_distinct_keys": new_keys}
+
+    def materialize(self) -> pd.DataFrame:
+        """
+        Итоговые признаки по всем пользователям с типами из agg_columns_type,
+        совпадающие с pipeline_feature_generation по всей истории логов
+        :return: аггрегированный датафрейм
+        """
+        if not self.seeded:
+            raise RuntimeError("Хранилище аггрегатов не заполнено историей логов (seed)")
+        aggregates = UserAggregates()
+        with closing(self._connect()) as connection, connection:
+            # все таблицы читаются из одного снимка базы
+            connection.execute("BEGIN")
+            aggregates.vocab = self._load_vocab(connection)
+            scalars = pd.read_sql_query("SELECT * FROM scalars", connection, index_col='user_id')
+            if scalars.empty:
+                raise ValueError("Хранилище аггрегатов пустое")
+            for column in ['date_min', 'date_max']:
+                scalars[column] = pd.to_datetime(scalars[column], unit='D')
+            aggregates.scalars = scalars
+
+            for column in ['part_of_day'] + MODE_COLUMNS:
+                counts = pd.read_sql_query("SELECT pair_key, value_count FROM counters "
+                                           "WHERE feature = ?", connection, params=(column,))
+                aggregates.counters[column] = pd.Series(counts['value_count'].to_numpy(np.int64),
+                                                        index=counts['pair_key'].to_numpy(np.int64))
+            for column in DISTINCT_COLUMNS:
+                keys = pd.read_sql_query("SELECT pair_key FROM distinct_keys WHERE feature = ? "
+                                         "ORDER BY pair_key", connection, params=(column,))
+                aggregates.distinct[column] = keys['pair_key'].to_numpy(np.int64)
+
+        return change_cols_type(aggregates.finalize(), self.cfg['preprocessing']['agg_columns_type'])
+
+    def stats(self) -> dict:
+        """
+        Размер хранилища
+        :return: кол-во пользователей, примененных логов и размер файла
+        """
+        with closing(self._connect()) as connection, connection:
+            users = connection.execute("SELECT COUNT(*) FROM scalars").fetchone()[0]
+            deltas, rows = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM deltas").fetchone()
+        return {"seeded": self.seeded,
+                "users": users,
+                "deltas": deltas,
+                "rows": rows,
+                "size_mb": round(os.path.getsize(self.db_path) / 2 ** 20, 1)}
@@ -0,0 +1,84 @@
+"""
+Описание производных признаков (доли визитов, запросы в день, доля активных дней).
+Признаки считаются векторно по массивам numpy одинаково для сырых логов,
+аггрегированных данных и введенных пользователем значений
+Версия: 1.0
+"""
+from typing import Callable, Dict, Iterable, List, MutableMapping, Tuple
+
+import numpy as np
+
+PARTS_OF_DAY = ['day', 'evening', 'morning', 'night']
+
+# признаки, которые вводит пользователь (UserCookies), остальные считаются из них
+INPUT_COLUMNS = ['part_of_day_day', 'part_of_day_evening', 'part_of_day_morning',
+                 'part_of_day_night', 'act_days', 'request_cnt', 'period_days',
+                 'cpe_type_cd', 'cpe_manufacturer_name', 'price',
+                 'region_cnt', 'city_cnt', 'url_host_cnt']
+
+
+def _sum(*values: np.ndarray) -> np.ndarray:
+    """Сумма массивов"""
+    return np.sum(values, axis=0)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """
+    Деление массивов, при нулевом знаменателе - nan/inf без предупреждений
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.true_divide(numerator, denominator)
+
+
+def _os_type(manufacturer: np.ndarray) -> np.ndarray:
+    """Операционная система по производителю устройства"""
+    return np.where(manufacturer.astype(str) == 'Apple', 'iOS', 'Android').astype(object)
+
+
+# признак -> (функция, входные признаки); порядок важен: признак может
+# использовать рассчитанные выше
+DERIVED_FEATURES: Dict[str, Tuple[Callable, List[str]]] = {
+    # общее кол-во визитов
+    'sum_visits': (_sum, [f'part_of_day_{part}' for part in PARTS_OF_DAY]),
+    # доля визитов в разное время суток
+    **{f'{part}_pct': (_ratio, [f'part_of_day_{part}', 'sum_visits']) for part in PARTS_OF_DAY},
+    # среднее кол-во запросов в дни визита
+    'avg_req_per_day': (_ratio, ['request_cnt', 'act_days']),
+    # доля дней с визитами между первым и последним заходом
+    'act_days_pct': (_ratio, ['act_days', 'period_days']),
+}
+
+# признаки, которые для введенных данных восстанавливаются приближенно
+INPUT_FEATURES: Dict[str, Tuple[Callable, List[str]]] = {
+    'cpe_model_os_type': (_os_type, ['cpe_manufacturer_name']),
+}
+
+PART_OF_DAY_FEATURES = ['sum_visits'] + [f'{part}_pct' for part in PARTS_OF_DAY]
+
+
+def derive_features(columns: MutableMapping,
+                    features: Iterable[str] = None) -> MutableMapping:
+    """
+    Расчет производных признаков по колонкам
+    :param columns: датафрейм или словарь с массивами входных признаков, дополняется на месте
+    :param features: признаки из DERIVED_FEATURES/INPUT_FEATURES для расчета,
+        по умолчанию - все DERIVED_FEATURES
+    :return: columns с добавленными признаками
+    """
+    if features is None:
+        features = DERIVED_FEATURES
+    for feature in features:
+        function, inputs = DERIVED_FEATURES.get(feature) or INPUT_FEATURES[feature]
+        columns[feature] = function(*(np.asarray(columns[column]) for column in inputs))
+    return columns
+
+
+def derive_input_features(columns: MutableMapping) -> MutableMapping:
+    """
+    Все признаки модели по введенным пользователем данным
+    :param columns: датафрейм или словарь с массивами INPUT_COLUMNS, дополняется на месте
+    :return: columns с добавленными признаками и нулевым user_id
+    """
+    derive_features(columns, list(DERIVED_FEATURES) + list(INPUT_FEATURES))
+    columns['user_id'] = np.zeros(len(np.asarray(columns[INPUT_COLUMNS[0]])), dtype=np.int64)
+    return columns
@@ -0,0 +1,195 @@
+"""
+Приближенный подсчет кол-ва уникальных значений по пользователям (HyperLogLog).
+Скетч пользователя хранится разреженно: только ненулевые регистры в виде
+int64 ключа (пользователь, номер регистра) и uint8 ранга. Скетчи объединяются
+поэлементным максимумом и не зависят от словарей значений, поэтому их можно
+считать по частям данных и в разных процессах
+Версия: 1.0
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# в ключе (пользователь, регистр) на номер регистра отводится 32 бита
+REGISTER_BITS = 32
+REGISTER_MASK = (1 << REGISTER_BITS) - 1
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def check_precision(precision: int) -> int:
+    """
+    Проверка точности скетча
+    :param precision: кол-во бит номера регистра, регистров 2 ** precision
+    :return: precision
+    """
+    if not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValueError(f"Точность HLL должна быть от {MIN_PRECISION} до {MAX_PRECISION}")
+    return precision
+
+
+def sketch_precision(cfg: dict) -> Optional[int]:
+    """
+    Точность скетчей из конфига
+    :param cfg: словарь с данными из конфигурационного файла
+    :return: precision или None, если считаются точные значения
+    """
+    preproc_config = cfg['preprocessing']
+    if not preproc_config.get('distinct_sketch'):
+        return None
+    return check_precision(preproc_config['hll_precision'])
+
+
+def hash_values(values: pd.Series) -> np.ndarray:
+    """
+    64-битные хэши значений, одинаковые для категорий и строк и между процессами
+    :param values: колонка датафрейма
+    :return: массив uint64, для пропусков - хэш пропуска
+    """
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """
+    Кол-во значащих бит uint64 (точно: старшая и младшая половины считаются отдельно)
+    """
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+def sketch_registers(group_codes: np.ndarray,
+                     hashes: np.ndarray,
+                     precision: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ненулевые регистры скетчей групп
+    :param group_codes: коды групп (пользователей), неотрицательные
+    :param hashes: хэши значений
+    :param precision: точность скетча
+    :return: отсортированные уникальные ключи (группа, регистр) и ранги регистров
+    """
+    shift = np.uint64(64 - precision)
+    registers = (hashes >> shift).astype(np.int64)
+    # ранг - позиция первой единицы в оставшихся битах хэша
+    ranks = 65 - _bit_length(hashes << np.uint64(precision))
+    ranks = np.minimum(ranks, 65 - precision).astype(np.uint8)
+    keys = (group_codes.astype(np.int64) << REGISTER_BITS) | registers
+    return reduce_registers(keys, ranks)
+
+
+def reduce_registers(keys: np.ndarray, ranks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Максимальный ранг по каждому ключу (объединение скетчей)
+    :param keys: ключи (группа, регистр), могут повторяться
+    :param ranks: ранги
+    :return: отсортированные уникальные ключи и их ранги
+    """
+    order = np.lexsort((ranks, keys))
+    keys, ranks = keys[order], ranks[order]
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    return keys[last], ranks[last]
+
+
+def estimate_counts(groups: np.ndarray,
+                    ranks: np.ndarray,
+                    n_groups: int,
+                    precision: int) -> np.ndarray:
+    """
+    Оценка кол-ва уникальных значений по регистрам групп
+    с линейным подсчетом для малых кол-в
+    :param groups: коды групп ненулевых регистров
+    :param ranks: ранги регистров
+    :param n_groups: кол-во групп
+    :param precision: точность скетча
+    :return: оценка для каждой группы, int64
+    """
+    n_registers = 1 << precision
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(n_registers, 0.7213 / (1 + 1.079 / n_registers))
+    filled = np.bincount(groups, minlength=n_groups)
+    zeros = n_registers - filled
+    harmonic = np.bincount(groups, weights=np.exp2(-ranks.astype(np.float64)),
+                           minlength=n_groups) + zeros
+    estimate = alpha * n_registers ** 2 / harmonic
+    with np.errstate(divide='ignore'):
+        linear = n_registers * np.log(n_registers / np.maximum(zeros, 1))
+    estimate = np.where((estimate <= 2.5 * n_registers) & (zeros > 0), linear, estimate)
+    return np.rint(estimate).astype(np.int64)
+
+
+def group_distinct_count(group_codes: np.ndarray,
+                         values: pd.Series,
+                         n_groups: int,
+                         precision: int) -> np.ndarray:
+    """
+    Приближенное кол-во уникальных значений в каждой группе, пропуски не учитываются
+    :param group_codes: коды групп
+    :param values: колонка датафрейма
+    :param n_groups: кол-во групп
+    :param precision: точность скетча
+    :return: оценка для каждой группы
+    """
+    mask = values.notna().to_numpy()
+    keys, ranks = sketch_registers(group_codes[mask], hash_values(values[mask]), precision)
+    return estimate_counts(keys >> REGISTER_BITS, ranks, n_groups, precision)
+
+
+class DistinctSketch:
+    """
+    Скетчи HyperLogLog по пользователям для одной колонки
+    """
+
+    def __init__(self, precision: int):
+        """
+        :param precision: кол-во бит номера регистра, регистров 2 ** precision
+        """
+        self.precision = check_precision(precision)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.ranks = np.empty(0, dtype=np.uint8)
+
+    def update(self, user_ids: np.ndarray, values: pd.Series) -> 'DistinctSketch':
+        """
+        Добавление значений
+        :param user_ids: id пользователей
+        :param values: значения колонки, пропуски не учитываются
+        :return: self
+        """
+        mask = values.notna().to_numpy()
+        keys, ranks = sketch_registers(np.asarray(user_ids)[mask],
+                                       hash_values(values[mask]), self.precision)
+        return self._add(keys, ranks)
+
+    def merge(self, other: 'DistinctSketch') -> 'DistinctSketch':
+        """
+        Объединение со скетчем, посчитанным по другой части данных
+        :param other: скетч с той же точностью
+        :return: self
+        """
+        if other.precision != self.precision:
+            raise ValueError("Объединяются скетчи с разной точностью")
+        return self._add(other.keys, other.ranks)
+
+    def _add(self, keys: np.ndarray, ranks: np.ndarray) -> 'DistinctSketch':
+        """
+        Поэлементный максимум регистров
+        """
+        self.keys, self.ranks = reduce_registers(np.concatenate([self.keys, keys]),
+                                                 np.concatenate([self.ranks, ranks]))
+        return self
+
+    def estimate(self, users: pd.Index) -> pd.Series:
+        """
+        Оценка кол-ва уникальных значений для каждого пользователя
+        :param users: id пользователей
+        :return: оценки в порядке users
+        """
+        groups = users.get_indexer(self.keys >> REGISTER_BITS)
+        mask = groups >= 0
+        return pd.Series(estimate_counts(groups[mask], self.ranks[mask], len(users),
+                                         self.precision), index=users)
+
+    @property
+    def nbytes(self) -> int:
+        """Размер скетча в памяти, байт"""
+        return self.keys.nbytes + self.ranks.nbytes
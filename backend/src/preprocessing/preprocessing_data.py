@@ -2,13 +2,20 @@
 Предобработка данных
 Версия: 1.0
 """
+import os
+import uuid
 import warnings
 import math
 import json
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+from ..monitoring.instrumentation import instrument, stage
+from .derived_features import derive_features, PART_OF_DAY_FEATURES
+from .distinct_sketch import group_distinct_count, sketch_precision
+
 warnings.filterwarnings('ignore')
 
 
@@ -33,6 +40,20 @@ def change_cols_type(data: pd.DataFrame, col_types_dict: dict) -> pd.DataFrame:
     return data.astype(col_types_dict)
 
 
+def cast_columns(data: pd.DataFrame, col_types_dict: dict) -> pd.DataFrame:
+    """
+    Изменение типа столбцов по одному без копирования всего датафрейма.
+    Столбцы, уже имеющие нужный тип (например, прочитанные как категории), не меняются
+    :param data: датафрейм
+    :param col_types_dict: словарь с признаками и типами данных
+    :return: датафрейм
+    """
+    for col, col_type in col_types_dict.items():
+        if str(data[col].dtype) != str(col_type):
+            data[col] = data[col].astype(col_type)
+    return data
+
+
 def fill_na_values(data: pd.DataFrame, fill_na_val: dict) -> pd.DataFrame:
     """
     Заполнение пропусков заданными значениями
@@ -40,18 +61,40 @@ def fill_na_values(data: pd.DataFrame, fill_na_val: dict) -> pd.DataFrame:
     :param fill_na_val: словарь с названиями признаков и значением, которым нужно заполнить пропуки
     :return: датафрейм
     """
-    return data.fillna(fill_na_val)
+    for col, value in fill_na_val.items():
+        if not data[col].hasnans:
+            continue
+        if pd.api.types.is_categorical_dtype(data[col]) and value not in data[col].cat.categories:
+            data[col] = data[col].cat.add_categories([value])
+        data[col] = data[col].fillna(value)
+    return data
 
 
 def replace_model_mistakes(data: pd.DataFrame,
                            replace_val: dict) -> pd.DataFrame:
     """
-    Функция исправляет неточности в данных
+    Функция исправляет неточности в данных.
+    Для категорий замена выполняется в словаре категорий, а не в каждой строке
     :param data: датафрейм с данными
     :param replace_val: словарь с признаками и значениями
     :return: датафрейм
     """
-    return data.replace(replace_val)
+    for col, mapping in replace_val.items():
+        values = data[col]
+        if not pd.api.types.is_categorical_dtype(values):
+            data[col] = values.replace(mapping)
+            continue
+        renamed = pd.Index([mapping.get(value, value) for value in values.cat.categories])
+        if not renamed.has_duplicates:
+            data[col] = values.cat.rename_categories(renamed)
+        else:
+            # несколько категорий переходят в одну: перекодирование кодов
+            categories = renamed.unique()
+            code_map = categories.get_indexer(renamed)
+            codes = values.cat.codes.to_numpy()
+            data[col] = pd.Categorical.from_codes(np.where(codes >= 0, code_map[codes], -1),
+                                                  categories=categories)
+    return data
 
 
 def replace_nokia_type(data: pd.DataFrame) -> pd.DataFrame:
@@ -60,12 +103,152 @@ def replace_nokia_type(data: pd.DataFrame) -> pd.DataFrame:
     :param data: датафрейм с данными
     :return: датафрейм с исправленными неточностями
     """
-    data['cpe_type_cd'] = np.where((data['cpe_manufacturer_name'] == 'Nokia') &
-                                   (data['cpe_model_name'] == '3 Dual'),
-                                   'plain', data['cpe_type_cd'])
+    mask = ((data['cpe_manufacturer_name'] == 'Nokia') &
+            (data['cpe_model_name'] == '3 Dual')).to_numpy()
+    if not mask.any():
+        return data
+    if pd.api.types.is_categorical_dtype(data['cpe_type_cd']):
+        # замена кода категории без перевода колонки в object
+        if 'plain' not in data['cpe_type_cd'].cat.categories:
+            data['cpe_type_cd'] = data['cpe_type_cd'].cat.add_categories(['plain'])
+        codes = data['cpe_type_cd'].cat.codes.to_numpy().copy()
+        codes[mask] = data['cpe_type_cd'].cat.categories.get_loc('plain')
+        data['cpe_type_cd'] = pd.Categorical.from_codes(codes,
+                                                        categories=data['cpe_type_cd'].cat.categories)
+    else:
+        data.loc[mask, 'cpe_type_cd'] = 'plain'
     return data
 
 
+def _stage_memory(data: pd.DataFrame, record=None) -> dict:
+    """
+    Память датафрейма после этапа и прирост пиковой памяти процесса за этап
+    из замера этапа (stage), если замеры включены
+    :param data: датафрейм
+    :param record: запись замера этапа
+    :return: словарь с памятью в Мб
+    """
+    return {
+        "frame_mb": round(data.memory_usage(deep=True).sum() / 2 ** 20, 1),
+        "rss_growth_mb": getattr(record, "rss_growth_mb", None),
+    }
+
+
+def save_memory_report(memory_report: dict, memory_report_path: str) -> None:
+    """
+    Атомарное сохранение отчета о памяти по этапам предобработки сырых данных
+    (файл общий для воркеров сервиса)
+    :param memory_report: словарь этап -> память
+    :param memory_report_path: путь до json-файла, если пустой - отчет не сохраняется
+    """
+    if not memory_report_path:
+        return
+    tmp_path = f"{memory_report_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(memory_report, file, indent=2)
+    os.replace(tmp_path, memory_report_path)
+
+
+# векторные функции для аггрегации по кодам
+def _value_codes(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Коды значений колонки (пропуски кодируются -1) и массив значений в порядке кодов.
+    Для категорий используются уже готовые коды
+    :param values: колонка датафрейма
+    :return: коды, значения
+    """
+    if pd.api.types.is_categorical_dtype(values):
+        return values.cat.codes.to_numpy(), values.cat.categories.to_numpy()
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, np.asarray(uniques)
+
+
+def _unique_pairs(group_codes: np.ndarray,
+                  value_codes: np.ndarray,
+                  n_values: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Уникальные пары (группа, значение) без пропусков, отсортированные по группе и значению
+    :param group_codes: коды групп
+    :param value_codes: коды значений
+    :param n_values: кол-во возможных значений
+    :return: группы пар, значения пар, кол-во строк в каждой паре
+    """
+    mask = value_codes >= 0
+    keys = group_codes[mask].astype(np.int64) * n_values + value_codes[mask]
+    keys, counts = np.unique(keys, return_counts=True)
+    return keys // n_values, keys % n_values, counts
+
+
+def value_ranks(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Порядок значений после сортировки и ранг каждого значения.
+    Коды категорий зависят от способа чтения данных (словарь parquet строится
+    в порядке появления значений, в csv - по сортировке), ранг от него не зависит
+    :param values: массив значений в порядке их кодов
+    :return: индексы значений в отсортированном порядке, ранг значения по его коду
+    """
+    order = np.argsort(values.astype(str), kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return order, rank
+
+
+def group_mode(group_codes: np.ndarray,
+               value_codes: np.ndarray,
+               n_groups: int,
+               n_values: int,
+               counts: np.ndarray = None) -> np.ndarray:
+    """
+    Самое частое значение в каждой группе по кодам значений,
+    при равенстве частот выбирается значение с меньшим кодом
+    :param group_codes: коды групп
+    :param value_codes: коды значений, пропуски кодируются -1
+    :param n_groups: кол-во групп
+    :param n_values: кол-во возможных значений
+    :param counts: частоты пар (группа, значение), если данные уже посчитаны
+    :return: код моды для каждой группы, -1 если значений нет
+    """
+    if counts is None:
+        groups, values, counts = _unique_pairs(group_codes, value_codes, max(n_values, 1))
+    else:
+        mask = value_codes >= 0
+        keys = group_codes[mask].astype(np.int64) * max(n_values, 1) + value_codes[mask]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts[mask])
+        groups, values = keys // max(n_values, 1), keys % max(n_values, 1)
+    # сортировка по группе, убыванию частоты и возрастанию кода значения
+    order = np.lexsort((values, -counts, groups))
+    groups, values = groups[order], values[order]
+    first = np.ones(len(groups), dtype=bool)
+    first[1:] = groups[1:] != groups[:-1]
+    mode = np.full(n_groups, -1, dtype=np.int64)
+    mode[groups[first]] = values[first]
+    return mode
+
+
+def group_mode_values(group_codes: np.ndarray,
+                      values: pd.Series,
+                      n_groups: int,
+                      fill_value: object = -999) -> np.ndarray:
+    """
+    Самое частое значение колонки в каждой группе в виде скаляра
+    (в отличие от pd.Series.mode, который при равенстве частот возвращает массив)
+    :param group_codes: коды групп
+    :param values: колонка датафрейма
+    :param n_groups: кол-во групп
+    :param fill_value: значение для групп без значений
+    :return: массив значений моды
+    """
+    codes, categories = _value_codes(values)
+    # при равенстве частот выбирается наименьшее значение, а не наименьший код категории
+    order, rank = value_ranks(categories)
+    rank_codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1) if len(rank) else codes
+    mode = group_mode(group_codes, rank_codes, n_groups, len(categories))
+    result = np.full(n_groups, fill_value, dtype=object)
+    result[mode >= 0] = categories[order[mode[mode >= 0]]]
+    return result
+
+
 # функции для генерации признаков
 def get_data_part_day(data: pd.DataFrame) -> pd.DataFrame:
     """
@@ -83,21 +266,8 @@ def get_data_part_day(data: pd.DataFrame) -> pd.DataFrame:
         'part_of_day_night': 'sum'
     }))
 
-    # общее кол-во визитов пользователя
-    df_part_day['sum_visits'] = (df_part_day.part_of_day_day +
-                                 df_part_day.part_of_day_evening +
-                                 df_part_day.part_of_day_morning +
-                                 df_part_day.part_of_day_night)
-
-    # доля визитов в разные части дня
-    df_part_day['day_pct'] = df_part_day.part_of_day_day / \
-                             df_part_day.sum_visits
-    df_part_day['evening_pct'] = df_part_day.part_of_day_evening / \
-                                 df_part_day.sum_visits
-    df_part_day['morning_pct'] = df_part_day.part_of_day_morning / \
-                                 df_part_day.sum_visits
-    df_part_day['night_pct'] = df_part_day.part_of_day_night / \
-                               df_part_day.sum_visits
+    # общее кол-во визитов и доля визитов в разные части дня
+    derive_features(df_part_day, PART_OF_DAY_FEATURES)
     return df_part_day
 
 
@@ -122,8 +292,7 @@ def get_data_days(data: pd.DataFrame) -> pd.DataFrame:
     }).rename(columns={'date': 'act_days'}))
 
     # среднее кол-во запросов в дни визита
-    df_active_days['avg_req_per_day'] = (df_active_days.request_cnt /
-                                         df_active_days.act_days)
+    derive_features(df_active_days, ['avg_req_per_day'])
 
     # первая и последняя дата визита
     df_dates_period = (data.groupby('user_id', as_index=False).agg(
@@ -139,7 +308,7 @@ def get_data_days(data: pd.DataFrame) -> pd.DataFrame:
 
     df_days = df_active_days.merge(df_dates_period, on='user_id')
     # доля дней, когда пользователь совершал визит
-    df_days['act_days_pct'] = df_days.act_days / df_days.period_days
+    derive_features(df_days, ['act_days_pct'])
 
     return df_days
 
@@ -155,12 +324,12 @@ def get_user_model_price(data: pd.DataFrame) -> pd.DataFrame:
     :param data: датафрейм с данными
     :return: аггрегированный датафрейм
     """
-    df_model = data.groupby('user_id', as_index=False).agg({
-        'cpe_type_cd': pd.Series.mode,
-        'cpe_manufacturer_name': pd.Series.mode,
-        'cpe_model_os_type': pd.Series.mode,
-        'price': 'mean'
-    })
+    user_codes, users = pd.factorize(data['user_id'], sort=True)
+    df_model = pd.DataFrame({'user_id': np.asarray(users)})
+    # мода по рангам значений, при равенстве частот - наименьшее значение
+    for column in ['cpe_type_cd', 'cpe_manufacturer_name', 'cpe_model_os_type']:
+        df_model[column] = group_mode_values(user_codes, data[column], len(users))
+    df_model['price'] = data.groupby('user_id')['price'].mean().to_numpy()
     return df_model.fillna(-999)
 
 
@@ -234,29 +403,44 @@ def save_unique_train_data(data: pd.DataFrame,
 
 
 # пайплайны
-def pipeline_raw_preprocessing(data: pd.DataFrame, cfg: dict) -> pd.DataFrame:
+@instrument("raw_preprocessing")
+def pipeline_raw_preprocessing(data: pd.DataFrame,
+                               cfg: dict,
+                               memory_report: dict = None) -> pd.DataFrame:
     """
-    Функция обрабатывает сырые данные
+    Функция обрабатывает сырые данные. Все этапы меняют колонки по одной,
+    без копий всего датафрейма
     :param data: датасет с сырыми данными
     :param cfg: словарь с данными из конфигурационного файла
+    :param memory_report: словарь, в который записывается память после каждого этапа
     :return: датасет
     """
+    if memory_report is None:
+        memory_report = {}
+    memory_report['read'] = _stage_memory(data)
     # проверка на соответствие признаков
     check_columns(data, cfg['preprocessing']['change_col_types'])
     # преобразование типов
-    data = change_cols_type(data, cfg['preprocessing']['change_col_types'])
+    with stage("cast", rows_in=len(data)) as record:
+        data = cast_columns(data, cfg['preprocessing']['change_col_types'])
+    memory_report['cast'] = _stage_memory(data, record)
     # заполнение пропусков
-    data = fill_na_values(data, cfg['preprocessing']['columns_fill_na'])
+    with stage("fill_na", rows_in=len(data)) as record:
+        data = fill_na_values(data, cfg['preprocessing']['columns_fill_na'])
+    memory_report['fill_na'] = _stage_memory(data, record)
     # замена ошибок в данных
-    data = replace_model_mistakes(data, cfg['preprocessing']['replace_values'])
-    data = replace_nokia_type(data)
+    with stage("replace", rows_in=len(data)) as record:
+        data = replace_model_mistakes(data, cfg['preprocessing']['replace_values'])
+        data = replace_nokia_type(data)
+    memory_report['replace'] = _stage_memory(data, record)
 
     return data
 
 
-def pipeline_feature_generation(data: pd.DataFrame) -> pd.DataFrame:
+def merge_feature_generation(data: pd.DataFrame) -> pd.DataFrame:
     """
-    Функция аггрегирует сырые данные и создает необходимые признаки
+    Функция аггрегирует сырые данные отдельными groupby и объединяет результаты
+    (эталонная реализация для сравнения с pipeline_feature_generation)
     """
     # кол-во визитов пользователя в разное время суток
     data_part_day = get_data_part_day(data)
@@ -278,7 +462,89 @@ def pipeline_feature_generation(data: pd.DataFrame) -> pd.DataFrame:
     return data_final
 
 
+@instrument("feature_generation")
+def pipeline_feature_generation(data: pd.DataFrame,
+                                hll_precision: Optional[int] = None) -> pd.DataFrame:
+    """
+    Функция аггрегирует сырые данные и создает необходимые признаки.
+    user_id кодируется один раз, все признаки считаются векторно
+    по кодам пользователей без отдельных groupby и merge
+    :param data: датафрейм с предобработанными сырыми данными
+    :param hll_precision: если задана - кол-во дней с визитами, регионов, городов
+        и url оценивается скетчами HyperLogLog с этой точностью
+    :return: аггрегированный датафрейм
+    """
+    user_codes, users = pd.factorize(data['user_id'], sort=True)
+    n_users = len(users)
+    result = {'user_id': np.asarray(users)}
+
+    # кол-во визитов пользователя в разные части дня
+    part_codes, part_values = _value_codes(data['part_of_day'])
+    groups, values, counts = _unique_pairs(user_codes, part_codes, max(len(part_values), 1))
+    for part in ['day', 'evening', 'morning', 'night']:
+        part_counts = np.zeros(n_users, dtype=np.int64)
+        part_mask = part_values[values] == part if len(part_values) else values < 0
+        part_counts[groups[part_mask]] = counts[part_mask]
+        result[f'part_of_day_{part}'] = part_counts
+
+    # общее кол-во визитов и доля визитов в разные части дня
+    derive_features(result, PART_OF_DAY_FEATURES)
+
+    # кол-во дней с визитами, первая и последняя дата визита
+    date_codes, date_values = _value_codes(data['date'])
+    groups, values, _ = _unique_pairs(user_codes, date_codes, max(len(date_values), 1))
+    if hll_precision:
+        result['act_days'] = group_distinct_count(user_codes, data['date'], n_users, hll_precision)
+    else:
+        result['act_days'] = np.bincount(groups, minlength=n_users)
+    # пары отсортированы по пользователю и дате: первая пара - минимальная дата, последняя - максимальная
+    first = np.ones(len(groups), dtype=bool)
+    first[1:] = groups[1:] != groups[:-1]
+    last = np.ones(len(groups), dtype=bool)
+    last[:-1] = groups[1:] != groups[:-1]
+    date_min = np.full(n_users, np.datetime64('NaT'), dtype='datetime64[ns]')
+    date_max = date_min.copy()
+    date_min[groups[first]] = date_values[values[first]]
+    date_max[groups[last]] = date_values[values[last]]
+
+    # кол-во запросов и среднее кол-во запросов в дни визита
+    result['request_cnt'] = np.bincount(user_codes,
+                                        weights=data['request_cnt'].to_numpy(dtype=np.float64),
+                                        minlength=n_users).astype(np.int64)
+    derive_features(result, ['avg_req_per_day'])
+    # кол-во дней между первым и последним заходом и доля дней с визитами
+    result['period_days'] = (date_max - date_min) // np.timedelta64(1, 'D') + 1
+    derive_features(result, ['act_days_pct'])
+
+    # данные об устройстве: самое частое значение
+    for column in ['cpe_type_cd', 'cpe_manufacturer_name', 'cpe_model_os_type']:
+        result[column] = group_mode_values(user_codes, data[column], n_users)
+
+    # средняя цена устройства
+    price = data['price'].to_numpy(dtype=np.float64)
+    price_mask = ~np.isnan(price)
+    price_sum = np.bincount(user_codes[price_mask], weights=price[price_mask], minlength=n_users)
+    price_cnt = np.bincount(user_codes[price_mask], minlength=n_users)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['price'] = np.where(price_cnt > 0, price_sum / price_cnt, -999)
+
+    # кол-во уникальных регионов, городов и url
+    for column, feature in [('region_name', 'region_cnt'),
+                            ('city_name', 'city_cnt'),
+                            ('url_host', 'url_host_cnt')]:
+        if hll_precision:
+            result[feature] = group_distinct_count(user_codes, data[column], n_users,
+                                                   hll_precision)
+            continue
+        codes, categories = _value_codes(data[column])
+        groups, _, _ = _unique_pairs(user_codes, codes, max(len(categories), 1))
+        result[feature] = np.bincount(groups, minlength=n_users)
+
+    return pd.DataFrame(result)
+
+
 # итоговый пайплайн
+@instrument("preprocessing")
 def pipeline_preprocessing(data: pd.DataFrame,
                            cfg: dict,
                            flag_raw: bool = False,
@@ -295,14 +561,28 @@ def pipeline_preprocessing(data: pd.DataFrame,
     # если данные сырые
     if flag_raw:
         # обработка сырых данных
-        data = pipeline_raw_preprocessing(data, cfg)
-        # генерация признаков
-        data = pipeline_feature_generation(data)
+        memory_report = {}
+        data = pipeline_raw_preprocessing(data, cfg, memory_report=memory_report)
+        save_memory_report(memory_report, cfg['preprocessing']['memory_report_path'])
+        # генерация признаков, при sharded_aggregation - по шардам в нескольких процессах
+        preproc_config = cfg['preprocessing']
+        if preproc_config['sharded_aggregation']:
+            # pylint: disable=import-outside-toplevel
+            from .sharded_aggregation import pipeline_sharded_feature_generation
+            data = pipeline_sharded_feature_generation(
+                data,
+                n_shards=preproc_config['n_shards'],
+                n_workers=preproc_config['n_workers'],
+                hll_precision=sketch_precision(cfg),
+                report_path=preproc_config['shard_report_path'])
+        else:
+            data = pipeline_feature_generation(data, hll_precision=sketch_precision(cfg))
 
     # проверка столбцов аггрегированных данных
     check_columns(data, cfg['preprocessing']['agg_columns_type'])
     # изменение типов колонок на нужные
-    data = change_cols_type(data, cfg['preprocessing']['agg_columns_type'])
+    with stage("change_types", rows_in=len(data)):
+        data = change_cols_type(data, cfg['preprocessing']['agg_columns_type'])
 
     # если данные для тренировки
     if flag_train:
@@ -313,13 +593,15 @@ def pipeline_preprocessing(data: pd.DataFrame,
             columns_save_min_max=cfg['preprocessing']['columns_save_min_max'],
             unique_values_path=cfg['preprocessing']['unique_values_path'])
 
-        # загрузим таргет и удалим пропуски
-        targets = pd.read_parquet(cfg['train']['target_data_path'])
-        targets = targets[['user_id', cfg['train']['target']]]
-        targets = targets[targets[cfg['train']['target']] != 'NA'].dropna()
-        # объединим признаки и таргет
-        data = data.merge(targets, on='user_id')
-        # изменим тип колонки для таргета
-        data = change_cols_type(data, cfg['train']['target_type'])
+        with stage("merge_target", rows_in=len(data)) as record:
+            # загрузим таргет и удалим пропуски
+            targets = pd.read_parquet(cfg['train']['target_data_path'])
+            targets = targets[['user_id', cfg['train']['target']]]
+            targets = targets[targets[cfg['train']['target']] != 'NA'].dropna()
+            # объединим признаки и таргет
+            data = data.merge(targets, on='user_id')
+            # изменим тип колонки для таргета
+            data = change_cols_type(data, cfg['train']['target_type'])
+            record.rows_out = len(data)
 
     return data
@@ -0,0 +1,116 @@
+"""
+Быстрое построение признаков для введенных записей без создания датафрейма
+Версия: 1.0
+"""
+from typing import Dict, List, Mapping
+
+import numpy as np
+import pandas as pd
+
+from .derived_features import INPUT_COLUMNS, DERIVED_FEATURES, derive_input_features
+
+
+def records_to_columns(records: List[Mapping]) -> Dict[str, np.ndarray]:
+    """
+    Введенные данные в виде массивов по признакам со всеми производными признаками
+    :param records: список введенных пользователем данных
+    :return: словарь признак -> массив значений
+    """
+    columns = {col: np.asarray([record[col] for record in records]) for col in INPUT_COLUMNS}
+    return derive_input_features(columns)
+
+
+def cast_column(values: np.ndarray, col_type: str) -> list:
+    """
+    Приведение массива значений к типу из конфига, как при change_cols_type
+    :param values: массив значений признака
+    :param col_type: тип признака (category, int16, float32 ...)
+    :return: список значений
+    """
+    if col_type == 'category':
+        return [str(value) for value in values.tolist()]
+    return values.astype(col_type).tolist()
+
+
+def input_features(record: Mapping) -> dict:
+    """
+    Все признаки для одной записи
+    :param record: введенные пользователем данные
+    :return: словарь со всеми признаками
+    """
+    return {col: values[0] for col, values in records_to_columns([record]).items()}
+
+
+def records_to_vectors(records: List[Mapping],
+                       columns_types: dict,
+                       columns: List[str] = None) -> list:
+    """
+    Преобразование введенных данных в векторы признаков с типами из конфига
+    :param records: список введенных пользователем данных
+    :param columns_types: словарь с признаками и типами (agg_columns_type)
+    :param columns: порядок признаков, по умолчанию - порядок из columns_types
+    :return: список векторов признаков
+    """
+    if columns is None:
+        columns = list(columns_types)
+    features = records_to_columns(records)
+    values = [cast_column(features[col], columns_types[col]) for col in columns]
+    return [list(vector) for vector in zip(*values)]
+
+
+def input_to_vector(record: Mapping,
+                    columns_types: dict,
+                    columns: List[str] = None) -> list:
+    """
+    Преобразование введенных данных в вектор признаков с типами из конфига
+    :param record: введенные пользователем данные
+    :param columns_types: словарь с признаками и типами (agg_columns_type)
+    :param columns: порядок признаков, по умолчанию - порядок из columns_types
+    :return: вектор признаков
+    """
+    return records_to_vectors([record], columns_types, columns)[0]
+
+
+def predict_records(model: object,
+                    records: List[Mapping],
+                    columns_types: dict) -> list:
+    """
+    Предсказание модели по списку записей без создания датафрейма
+    :param model: обученная модель
+    :param records: список введенных пользователем данных
+    :param columns_types: словарь с признаками и типами (agg_columns_type)
+    :return: список предсказаний
+    """
+    # порядок признаков берется из модели, если она его хранит
+    columns = list(getattr(model, 'feature_names_', None) or columns_types)
+    return model.predict(records_to_vectors(records, columns_types, columns)).tolist()
+
+
+def check_feature_skew(data: pd.DataFrame, columns_types: dict) -> dict:
+    """
+    Проверка расхождения признаков обучения и сервиса: признаки, посчитанные
+    по сырым логам, сравниваются с признаками, которые сервис восстанавливает
+    из введенных значений (INPUT_COLUMNS) тех же пользователей
+    :param data: аггрегированные данные с типами из columns_types
+    :param columns_types: словарь с признаками и типами (agg_columns_type)
+    :return: доля расхождений по признакам и результат проверки
+    """
+    columns = [col for col in columns_types if col != 'user_id']
+    vectors = records_to_vectors(data[INPUT_COLUMNS].to_dict('records'), columns_types, columns)
+    served = pd.DataFrame(vectors, columns=columns)
+
+    mismatch = {}
+    for col in columns:
+        expected = data[col].reset_index(drop=True)
+        if columns_types[col] == 'category':
+            equal = expected.astype(str).to_numpy() == served[col].to_numpy()
+        else:
+            equal = np.isclose(expected.to_numpy(dtype=np.float64),
+                               served[col].to_numpy(dtype=np.float64), equal_nan=True)
+        mismatch[col] = round(float(1 - equal.mean()), 6) if len(equal) else 0.0
+
+    # признаки из INPUT_FEATURES восстанавливаются приближенно и не влияют на результат
+    derived = [col for col in columns if col in DERIVED_FEATURES]
+    return {'n_rows': len(data),
+            'mismatch_rate': mismatch,
+            'passed': all(mismatch[col] == 0 for col in derived)}
@@ -0,0 +1,136 @@
+"""
+Параллельная генерация признаков: предобработанные сырые данные разбиваются
+на шарды по хэшу user_id, каждый шард аггрегируется в отдельном процессе.
+Шарды передаются файлами Arrow IPC (воркеры читают их через memory map),
+в процессы передаются только пути, а обратно - небольшие таблицы по пользователям
+Версия: 1.0
+"""
+import os
+import json
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ..data.get_data import read_arrow_table
+from ..monitoring.instrumentation import instrument, stage
+from .preprocessing_data import pipeline_feature_generation
+
+
+def shard_codes(user_ids: np.ndarray, n_shards: int) -> np.ndarray:
+    """
+    Номер шарда для каждой строки по хэшу user_id:
+    все события пользователя попадают в один шард
+    :param user_ids: id пользователей
+    :param n_shards: кол-во шардов
+    :return: номера шардов
+    """
+    hashes = pd.util.hash_array(np.asarray(user_ids, dtype=np.int64))
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+def write_shards(data: pd.DataFrame, n_shards: int, shard_dir: str) -> List[Tuple[str, int]]:
+    """
+    Разбиение данных на шарды и запись каждого в файл Arrow IPC без сжатия.
+    Датафрейм переводится в Arrow один раз, строки шарда выбираются из таблицы
+    по индексам, поэтому в памяти кроме таблицы находится только текущий шард.
+    Категории остаются словарными массивами с общим словарем
+    :param data: предобработанные сырые данные
+    :param n_shards: кол-во шардов
+    :param shard_dir: папка для файлов шардов
+    :return: пути до файлов и кол-во строк в каждом шарде (пустые шарды пропускаются)
+    """
+    shards = shard_codes(data['user_id'].to_numpy(), n_shards)
+    order = np.argsort(shards, kind='stable')
+    sizes = np.bincount(shards, minlength=n_shards)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+
+    paths = []
+    offset = 0
+    for shard, size in enumerate(sizes.tolist()):
+        if size:
+            path = os.path.join(shard_dir, f"shard_{shard:04d}.arrow")
+            with pa.OSFile(path, 'wb') as sink, \
+                    pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table.take(pa.array(order[offset:offset + size])))
+            paths.append((path, size))
+        offset += size
+    return paths
+
+
+def aggregate_shard(shard_path: str, hll_precision: Optional[int] = None) -> Tuple[pd.DataFrame, dict]:
+    """
+    Генерация признаков по одному шарду (выполняется в процессе пула)
+    :param shard_path: путь до файла шарда
+    :param hll_precision: точность скетчей HyperLogLog, None - точный подсчет
+    :return: аггрегированный датафрейм шарда и замеры времени
+    """
+    start = time.perf_counter()
+    data = read_arrow_table(shard_path, 'arrow').to_pandas()
+    read_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = pipeline_feature_generation(data, hll_precision=hll_precision)
+    timings = {'shard': os.path.basename(shard_path),
+               'pid': os.getpid(),
+               'rows': len(data),
+               'users': len(result),
+               'read_s': round(read_s, 4),
+               'aggregate_s': round(time.perf_counter() - start, 4)}
+    return result, timings
+
+
+@instrument("sharded_feature_generation")
+def pipeline_sharded_feature_generation(data: pd.DataFrame,
+                                        n_shards: int,
+                                        n_workers: int = 0,
+                                        hll_precision: Optional[int] = None,
+                                        report_path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Генерация признаков по шардам в пуле процессов.
+    Результат совпадает с pipeline_feature_generation по всем данным
+    :param data: датафрейм с предобработанными сырыми данными
+    :param n_shards: кол-во шардов
+    :param n_workers: кол-во процессов, 0 - по числу ядер
+    :param hll_precision: точность скетчей HyperLogLog, None - точный подсчет
+    :param report_path: путь до json с замерами по шардам, None - не сохранять
+    :return: аггрегированный датафрейм
+    """
+    n_workers = min(n_workers or multiprocessing.cpu_count(), n_shards)
+    report = {'n_shards': n_shards, 'n_workers': n_workers, 'rows': len(data)}
+
+    with tempfile.TemporaryDirectory(prefix="shards_") as shard_dir:
+        start = time.perf_counter()
+        with stage("write_shards", rows_in=len(data)):
+            shards = write_shards(data, n_shards, shard_dir)
+        report['write_s'] = round(time.perf_counter() - start, 4)
+
+        start = time.perf_counter()
+        # spawn: воркеры не наследуют память родителя с исходными данными
+        # и потоки, запущенные в процессе сервиса
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(aggregate_shard, path, hll_precision)
+                       for path, _ in shards]
+            results = [future.result() for future in futures]
+        report['aggregate_s'] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    with stage("concat_shards") as record:
+        # пользователи каждого шарда отсортированы, после объединения
+        # порядок восстанавливается, как при обработке всех данных сразу
+        result = pd.concat([frame for frame, _ in results], ignore_index=True)
+        result = result.sort_values('user_id', kind='stable', ignore_index=True)
+        record.rows_out = len(result)
+    report['concat_s'] = round(time.perf_counter() - start, 4)
+    report['shards'] = [timings for _, timings in results]
+
+    if report_path:
+        with open(report_path, 'w') as file:
+            json.dump(report, file, indent=2)
+    return result
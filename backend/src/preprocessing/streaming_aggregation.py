@@ -0,0 +1,288 @@
+"""
+Потоковая аггрегация сырых данных частями с объединяемыми
+промежуточными аггрегатами по пользователям
+Версия: 1.0
+"""
+from typing import IO, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ..data.get_data import iter_data_chunks
+from ..monitoring.instrumentation import instrument
+from .preprocessing_data import (pipeline_raw_preprocessing, group_mode, value_ranks,
+                                 save_memory_report)
+from .derived_features import derive_features, PARTS_OF_DAY, PART_OF_DAY_FEATURES
+from .distinct_sketch import DistinctSketch, sketch_precision
+
+# признаки, для которых считается кол-во уникальных значений
+DISTINCT_COLUMNS = {
+    'date': 'act_days',
+    'region_name': 'region_cnt',
+    'city_name': 'city_cnt',
+    'url_host': 'url_host_cnt',
+}
+# признаки, для которых считается мода
+MODE_COLUMNS = ['cpe_type_cd', 'cpe_manufacturer_name', 'cpe_model_os_type']
+
+# в ключе пары (пользователь, значение) на код значения отводится 32 бита
+CODE_BITS = 32
+CODE_MASK = (1 << CODE_BITS) - 1
+
+
+def _pair_keys(user_ids: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Упаковка пар (user_id, код значения) в int64 ключ
+    :param user_ids: id пользователей
+    :param codes: коды значений
+    :return: массив ключей
+    """
+    return (user_ids.astype(np.int64) << CODE_BITS) | codes.astype(np.int64)
+
+
+def _add_counts(counts: pd.Series, other: pd.Series) -> pd.Series:
+    """
+    Сложение счетчиков, индексированных ключами
+    """
+    if counts is None:
+        return other
+    return counts.add(other, fill_value=0).astype(np.int64)
+
+
+class UserAggregates:
+    """
+    Промежуточные аггрегаты по пользователям, которые можно дополнять
+    частями сырых данных и объединять между собой:
+    - суммы запросов и цены, первая и последняя дата визита
+    - счетчики визитов по частям суток и значений устройства
+    - множества уникальных дат, регионов, городов и url
+      (или скетчи HyperLogLog, если задана точность)
+    """
+
+    def __init__(self, hll_precision: Optional[int] = None):
+        """
+        :param hll_precision: если задана - вместо множеств уникальных значений
+            хранятся скетчи HyperLogLog с этой точностью
+        """
+        self.hll_precision = hll_precision
+        # словари значений: значение -> код, общий для всех частей
+        self.vocab: Dict[str, dict] = {}
+        self.scalars: Optional[pd.DataFrame] = None
+        self.counters: Dict[str, pd.Series] = {}
+        self.distinct: Dict[str, np.ndarray] = {}
+        self.sketches: Dict[str, DistinctSketch] = {}
+
+    def _encode(self, column: str, values: pd.Series) -> np.ndarray:
+        """
+        Кодирование значений колонки общим словарем, пропуски кодируются -1
+        :param column: название колонки
+        :param values: значения
+        :return: коды значений
+        """
+        codes, uniques = pd.factorize(values)
+        vocab = self.vocab.setdefault(column, {})
+        mapping = np.fromiter((vocab.setdefault(value, len(vocab)) for value in uniques),
+                              dtype=np.int64, count=len(uniques))
+        if not len(mapping):
+            return np.full(len(codes), -1, dtype=np.int64)
+        return np.where(codes >= 0, mapping[codes], -1)
+
+    def _merge_scalars(self, scalars: pd.DataFrame) -> None:
+        """
+        Объединение сумм и дат с уже накопленными
+        """
+        if self.scalars is not None:
+            scalars = pd.concat([self.scalars, scalars]).groupby(level=0).agg({
+                'request_cnt': 'sum',
+                'price_sum': 'sum',
+                'price_count': 'sum',
+                'date_min': 'min',
+                'date_max': 'max',
+            })
+        self.scalars = scalars
+
+    def update(self, data: pd.DataFrame) -> 'UserAggregates':
+        """
+        Добавление части предобработанных сырых данных
+        :param data: часть датасета после pipeline_raw_preprocessing
+        :return: self
+        """
+        user_ids = data['user_id'].to_numpy()
+        grouped = data.groupby('user_id')
+        scalars = pd.DataFrame({
+            'request_cnt': grouped['request_cnt'].sum().astype(np.int64),
+            'price_sum': grouped['price'].sum().astype(np.float64),
+            'price_count': grouped['price'].count(),
+            'date_min': grouped['date'].min(),
+            'date_max': grouped['date'].max(),
+        })
+        self._merge_scalars(scalars)
+
+        for column in ['part_of_day'] + MODE_COLUMNS:
+            codes = self._encode(column, data[column])
+            keys = _pair_keys(user_ids[codes >= 0], codes[codes >= 0])
+            self.counters[column] = _add_counts(self.counters.get(column),
+                                                pd.Series(keys).value_counts())
+
+        for column in DISTINCT_COLUMNS:
+            if self.hll_precision:
+                # скетчи строятся по хэшам значений, словарь для них не нужен
+                sketch = self.sketches.setdefault(column, DistinctSketch(self.hll_precision))
+                sketch.update(user_ids, data[column])
+                continue
+            codes = self._encode(column, data[column])
+            keys = np.unique(_pair_keys(user_ids[codes >= 0], codes[codes >= 0]))
+            if column in self.distinct:
+                keys = np.union1d(self.distinct[column], keys)
+            self.distinct[column] = keys
+        return self
+
+    def _recode(self, column: str, other: 'UserAggregates', keys: np.ndarray) -> np.ndarray:
+        """
+        Перекодирование ключей другого аггрегата в словарь текущего
+        """
+        values = list(other.vocab.get(column, {}))
+        vocab = self.vocab.setdefault(column, {})
+        mapping = np.fromiter((vocab.setdefault(value, len(vocab)) for value in values),
+                              dtype=np.int64, count=len(values))
+        if not len(keys):
+            return keys
+        return _pair_keys(keys >> CODE_BITS, mapping[keys & CODE_MASK])
+
+    def merge(self, other: 'UserAggregates') -> 'UserAggregates':
+        """
+        Объединение с аггрегатами, посчитанными по другой части данных
+        :param other: другой объект UserAggregates
+        :return: self
+        """
+        if other.scalars is not None:
+            self._merge_scalars(other.scalars)
+        for column, counts in other.counters.items():
+            counts = pd.Series(counts.to_numpy(),
+                               index=self._recode(column, other, counts.index.to_numpy()))
+            self.counters[column] = _add_counts(self.counters.get(column),
+                                                counts.groupby(level=0).sum())
+        for column, keys in other.distinct.items():
+            keys = np.unique(self._recode(column, other, keys))
+            if column in self.distinct:
+                keys = np.union1d(self.distinct[column], keys)
+            self.distinct[column] = keys
+        for column, sketch in other.sketches.items():
+            if column in self.sketches:
+                self.sketches[column].merge(sketch)
+            else:
+                self.sketches[column] = DistinctSketch(sketch.precision).merge(sketch)
+        return self
+
+    def _decode(self, column: str) -> np.ndarray:
+        """
+        Массив значений колонки в порядке их кодов
+        """
+        values = np.empty(len(self.vocab.get(column, {})), dtype=object)
+        values[:] = list(self.vocab.get(column, {}))
+        return values
+
+    def _mode(self, column: str, users: pd.Index) -> pd.Series:
+        """
+        Самое частое значение колонки для каждого пользователя,
+        при равенстве частот выбирается наименьшее значение
+        """
+        counts = self.counters.get(column, pd.Series(dtype=np.int64))
+        keys = counts.index.to_numpy(dtype=np.int64)
+        values = self._decode(column)
+        # коды словаря идут в порядке появления, поэтому мода ищется по рангу значения
+        order, rank = value_ranks(values)
+        mode = group_mode(group_codes=users.get_indexer(keys >> CODE_BITS),
+                          value_codes=rank[keys & CODE_MASK] if len(rank) else keys,
+                          n_groups=len(users),
+                          n_values=len(values),
+                          counts=counts.to_numpy())
+        result = np.full(len(users), -999, dtype=object)
+        result[mode >= 0] = values[order[mode[mode >= 0]]]
+        return pd.Series(result, index=users)
+
+    def _distinct_count(self, column: str, users: pd.Index) -> pd.Series:
+        """
+        Кол-во уникальных значений колонки для каждого пользователя
+        """
+        if column in self.sketches:
+            return self.sketches[column].estimate(users)
+        keys = self.distinct.get(column, np.empty(0, dtype=np.int64))
+        return (pd.Series(keys >> CODE_BITS).value_counts()
+                .reindex(users, fill_value=0).astype(np.int64))
+
+    def finalize(self) -> pd.DataFrame:
+        """
+        Расчет итоговых признаков, совпадающих с результатом pipeline_feature_generation
+        :return: аггрегированный датафрейм
+        """
+        scalars = self.scalars.sort_index()
+        users = scalars.index
+
+        result = pd.DataFrame({'user_id': users.to_numpy()})
+        part_counts = self.counters['part_of_day']
+        part_values = self._decode('part_of_day')
+        part_keys = part_counts.index.to_numpy(dtype=np.int64)
+        part_frame = pd.DataFrame({
+            'user_id': part_keys >> CODE_BITS,
+            'part': part_values[part_keys & CODE_MASK],
+            'count': part_counts.to_numpy(),
+        }).pivot_table(index='user_id', columns='part', values='count',
+                       aggfunc='sum', fill_value=0)
+        part_frame = part_frame.reindex(index=users, columns=PARTS_OF_DAY, fill_value=0)
+        for part in PARTS_OF_DAY:
+            result[f'part_of_day_{part}'] = part_frame[part].to_numpy(dtype=np.int64)
+
+        derive_features(result, PART_OF_DAY_FEATURES)
+
+        result['act_days'] = self._distinct_count('date', users).to_numpy()
+        result['request_cnt'] = scalars['request_cnt'].to_numpy()
+        derive_features(result, ['avg_req_per_day'])
+        period = scalars['date_max'] - scalars['date_min']
+        result['period_days'] = period.dt.days.to_numpy() + 1
+        derive_features(result, ['act_days_pct'])
+
+        for column in MODE_COLUMNS:
+            result[column] = self._mode(column, users).to_numpy()
+        result['price'] = (scalars['price_sum'] / scalars['price_count']).fillna(-999).to_numpy()
+
+        for column, feature in DISTINCT_COLUMNS.items():
+            if column != 'date':
+                result[feature] = self._distinct_count(column, users).to_numpy()
+        return result
+
+
+@instrument("streaming_feature_generation")
+def pipeline_streaming_feature_generation(data_path: Union[str, IO],
+                                          cfg: dict,
+                                          data_format: Optional[str] = None,
+                                          columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Аггрегация сырых данных, не помещающихся в память: файл читается частями,
+    каждая часть предобрабатывается и добавляется в промежуточные аггрегаты
+    :param data_path: путь до файла или файловый объект с сырыми данными
+    :param cfg: словарь с данными из конфигурационного файла
+    :param data_format: формат данных, если None - определяется автоматически
+    :param columns: колонки для чтения, по умолчанию - колонки из change_col_types
+    :return: аггрегированный датафрейм, как у pipeline_feature_generation
+    """
+    if columns is None:
+        columns = list(cfg['preprocessing']['change_col_types'])
+    aggregates = UserAggregates(hll_precision=sketch_precision(cfg))
+    # по каждому этапу сохраняется максимум памяти среди частей
+    memory_report = {}
+    for chunk in iter_data_chunks(data_path,
+                                  data_format=data_format,
+                                  chunk_size=cfg['preprocessing']['chunk_size'],
+                                  columns=columns,
+                                  columns_types=cfg['preprocessing']['change_col_types']):
+        chunk_report = {}
+        aggregates.update(pipeline_raw_preprocessing(chunk, cfg, memory_report=chunk_report))
+        for stage, memory in chunk_report.items():
+            stage_report = memory_report.setdefault(stage, memory)
+            for name, value in memory.items():
+                # прирост памяти есть только при включенных замерах этапов
+                if value is not None and (stage_report[name] is None or value > stage_report[name]):
+                    stage_report[name] = value
+    save_memory_report(memory_report, cfg['preprocessing']['memory_report_path'])
+    return aggregates.finalize()
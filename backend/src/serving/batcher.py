@@ -0,0 +1,148 @@
+"""
+Микро-батчинг запросов на предсказание: одиночные запросы, пришедшие
+в пределах короткого окна, обрабатываются одним вызовом модели
+Версия: 1.0
+"""
+import time
+import asyncio
+from collections import deque
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Асинхронная очередь, собирающая одиночные запросы в батчи.
+    Батч отправляется в обработку по достижении max_batch_size записей
+    или по истечении max_wait_ms с момента прихода первой записи
+    """
+
+    def __init__(self,
+                 predict_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 3.0,
+                 stats_window: int = 1000):
+        """
+        :param predict_fn: функция, получающая список записей и
+            возвращающая список предсказаний в том же порядке
+        :param max_batch_size: максимальный размер батча
+        :param max_wait_ms: максимальное время ожидания сбора батча, мс
+        :param stats_window: кол-во последних батчей для расчета статистик
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # метрики
+        self.n_requests = 0
+        self.n_batches = 0
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._queue_waits = deque(maxlen=stats_window)
+        self._predict_times = deque(maxlen=stats_window)
+
+    def start(self) -> None:
+        """Запуск фонового обработчика очереди в текущем event loop"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фонового обработчика"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, record: Any) -> Any:
+        """
+        Постановка записи в очередь и ожидание предсказания
+        :param record: запись для предсказания
+        :return: предсказание для записи
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list:
+        """
+        Сбор батча из очереди
+        :return: список элементов (запись, future, время постановки)
+        """
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        """Цикл обработки батчей"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            start = time.perf_counter()
+            records = [item[0] for item in batch]
+            try:
+                # модель вызывается в пуле потоков, чтобы не блокировать event loop
+                predictions = await loop.run_in_executor(None, self.predict_fn, records)
+            except Exception as error:  # pylint: disable=broad-except
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            finish = time.perf_counter()
+
+            self.n_requests += len(batch)
+            self.n_batches += 1
+            self._batch_sizes.append(len(batch))
+            self._queue_waits.extend(start - enqueued for _, _, enqueued in batch)
+            self._predict_times.append(finish - start)
+
+            for (_, future, _), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+    @staticmethod
+    def _percentiles(values: deque) -> dict:
+        """
+        Перцентили значений в миллисекундах
+        :param values: значения в секундах
+        :return: словарь с p50/p95/p99/max
+        """
+        if not values:
+            return {"p50": None, "p95": None, "p99": None, "max": None}
+        ordered = sorted(values)
+        last = len(ordered) - 1
+        result = {
+            f"p{q}": round(ordered[round(last * q / 100)] * 1000, 3)
+            for q in (50, 95, 99)
+        }
+        result["max"] = round(ordered[-1] * 1000, 3)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Метрики батчинга для подбора параметров окна
+        :return: словарь с метриками
+        """
+        sizes = list(self._batch_sizes)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self.n_requests,
+            "batches": self.n_batches,
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": {
+                "mean": round(sum(sizes) / len(sizes), 3) if sizes else None,
+                "max": max(sizes) if sizes else None,
+            },
+            "queue_wait_ms": self._percentiles(self._queue_waits),
+            "predict_ms": self._percentiles(self._predict_times),
+        }
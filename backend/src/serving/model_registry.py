@@ -0,0 +1,92 @@
+"""
+Реестр загруженной модели: модель загружается один раз и
+подменяется при появлении новой версии файла
+Версия: 1.0
+"""
+import os
+import time
+import threading
+from typing import Optional
+
+import joblib
+
+
+class ModelRegistry:
+    """
+    Хранит модель в памяти процесса и перезагружает ее,
+    если файл модели изменился (по mtime и размеру)
+    """
+
+    def __init__(self, model_path: str, check_interval: Optional[float] = 1.0):
+        """
+        :param model_path: путь до сохраненной модели
+        :param check_interval: минимальный интервал (сек) между проверками файла,
+            если None - файл не проверяется (модель обновляет мастер-процесс gunicorn)
+        """
+        self.model_path = model_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._version: Optional[str] = None
+        self._loaded_at: Optional[float] = None
+        self._last_check = 0.0
+
+    def _file_version(self) -> Optional[str]:
+        """
+        Версия файла модели на диске
+        :return: строка вида '<mtime_ns>-<size>' или None, если файла нет
+        """
+        try:
+            stat = os.stat(self.model_path)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Загрузка модели с диска, если версия файла изменилась
+        :param force: загрузить модель независимо от версии
+        :return: True, если модель была (пере)загружена
+        """
+        version = self._file_version()
+        if version is None or (version == self._version and not force):
+            return False
+        with self._lock:
+            if version == self._version and not force:
+                return False
+            model = joblib.load(self.model_path)
+            # подмена ссылки атомарна: запросы используют либо старую, либо новую модель
+            self._model, self._version = model, version
+            self._loaded_at = time.time()
+        return True
+
+    def get(self):
+        """
+        Получение актуальной модели
+        :return: модель
+        """
+        now = time.monotonic()
+        if self._model is None or (self.check_interval is not None
+                                   and now - self._last_check >= self.check_interval):
+            self._last_check = now
+            self.reload()
+        if self._model is None:
+            raise FileNotFoundError(f"Модель не найдена: {self.model_path}")
+        return self._model
+
+    @property
+    def version(self) -> Optional[str]:
+        """Версия загруженной модели"""
+        return self._version
+
+    def info(self) -> dict:
+        """
+        Информация о загруженной модели
+        :return: словарь с путем, версией и временем загрузки
+        """
+        return {
+            "model_path": self.model_path,
+            "version": self._version,
+            "loaded_at": self._loaded_at,
+            "model_type": type(self._model).__name__ if self._model is not None else None,
+        }
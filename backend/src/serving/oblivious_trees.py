@@ -0,0 +1,250 @@
+"""
+Применение модели CatBoost (SymmetricTree) по JSON-выгрузке без пакета catboost и pandas:
+бинаризация признаков, CTR по категориальным признакам и сумма значений листьев на numpy
+Версия: 1.0
+"""
+import os
+import json
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# множитель хэша комбинаций признаков CatBoost
+MAGIC_MULT = np.uint64(0x4906BA494954CB65)
+# хэш категории, которой не было при обучении: вне диапазона 32-битных хэшей CatBoost
+UNKNOWN_HASH = np.uint64(1 << 32)
+
+
+def _calc_hash(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Хэш пары значений, как в CatBoost (арифметика по модулю 2^64)
+    :param left: накопленный хэш
+    :param right: добавляемое значение
+    :return: новый хэш
+    """
+    with np.errstate(over='ignore'):
+        return MAGIC_MULT * (left + MAGIC_MULT * right)
+
+
+class ObliviousTreesModel:
+    """
+    Модель из симметричных деревьев, загруженная из JSON-выгрузки CatBoost.
+    Повторяет CatBoostClassifier.predict_proba/predict для бинарной классификации
+    """
+
+    def __init__(self,
+                 model_json: dict,
+                 cat_hashes: Dict[str, int],
+                 feature_names: List[str],
+                 class_names: list):
+        """
+        :param model_json: модель в формате JSON CatBoost
+        :param cat_hashes: словарь значение категории -> хэш CatBoost
+        :param feature_names: порядок признаков во входных векторах
+        :param class_names: метки классов
+        """
+        if 'oblivious_trees' not in model_json:
+            raise ValueError("Поддерживаются только модели с grow_policy=SymmetricTree")
+        self.feature_names_ = list(feature_names)
+        self.classes_ = np.array(class_names)
+        self.cat_hashes = {value: np.uint64(code & 0xFFFFFFFF) for value, code in cat_hashes.items()}
+
+        info = model_json['features_info']
+        self.float_features = {feature['feature_index']: feature
+                               for feature in info.get('float_features', [])}
+        self.cat_features = {feature['feature_index']: feature
+                             for feature in info.get('categorical_features', [])}
+        self.ctrs = info.get('ctrs', [])
+        self.ctr_data = {key: self._parse_ctr_data(value)
+                         for key, value in model_json.get('ctr_data', {}).items()}
+        # начало CTR в общей нумерации бинарных признаков: float, one-hot, CTR.
+        # значения one-hot хранятся в categorical_features[*].values
+        self.ctr_offset = (sum(len(feature.get('borders') or [])
+                               for feature in info.get('float_features', []))
+                           + sum(len(feature.get('values') or [])
+                                 for feature in info.get('categorical_features', [])))
+        self.ctr_splits = []
+        for ctr_idx, ctr in enumerate(self.ctrs):
+            self.ctr_splits.extend((ctr_idx, border) for border in ctr['borders'])
+
+        self.trees = [(tree['splits'], np.asarray(tree['leaf_values'], dtype=np.float64))
+                      for tree in model_json['oblivious_trees']]
+        scale, bias = model_json.get('scale_and_bias', [1, [0]])
+        self.scale = float(scale)
+        self.bias = float(bias[0] if isinstance(bias, list) else bias)
+
+    @classmethod
+    def load(cls, export_dir: str) -> 'ObliviousTreesModel':
+        """
+        Загрузка модели из папки выгрузки (см. export_model)
+        :param export_dir: папка с model.json, cat_hashes.json и meta.json
+        :return: модель
+        """
+        with open(os.path.join(export_dir, 'model.json')) as file:
+            model_json = json.load(file)
+        with open(os.path.join(export_dir, 'cat_hashes.json')) as file:
+            cat_hashes = json.load(file)
+        with open(os.path.join(export_dir, 'meta.json')) as file:
+            meta = json.load(file)
+        return cls(model_json=model_json,
+                   cat_hashes=cat_hashes,
+                   feature_names=meta['feature_names'],
+                   class_names=meta['class_names'])
+
+    @staticmethod
+    def _parse_ctr_data(ctr_data: dict) -> dict:
+        """
+        Таблица статистик CTR: отсортированные хэши и счетчики для поиска по хэшу
+        :param ctr_data: статистики CTR из JSON
+        :return: словарь с хэшами, счетчиками и знаменателем
+        """
+        stride = ctr_data['hash_stride']
+        hash_map = ctr_data['hash_map']
+        keys = np.array([int(key) for key in hash_map[::stride]], dtype=np.uint64)
+        values = np.array([hash_map[i + 1:i + stride] for i in range(0, len(hash_map), stride)],
+                          dtype=np.float64).reshape(len(keys), stride - 1)
+        order = np.argsort(keys)
+        return {
+            'keys': keys[order],
+            'values': values[order],
+            'counter_denominator': ctr_data.get('counter_denominator', 0),
+        }
+
+    def _columns(self, rows: Sequence[Sequence]) -> tuple:
+        """
+        Разделение входных векторов на числовые признаки и хэши категорий
+        :param rows: векторы признаков в порядке feature_names_
+        :return: массивы числовых признаков и хэшей категорий (объекты x признаки)
+        """
+        rows = list(rows)
+        floats = np.full((len(rows), len(self.float_features)), np.nan)
+        hashes = np.full((len(rows), len(self.cat_features)), UNKNOWN_HASH, dtype=np.uint64)
+        for index, feature in self.float_features.items():
+            column = [row[feature['flat_feature_index']] for row in rows]
+            floats[:, index] = np.asarray(column, dtype=np.float64)
+        for index, feature in self.cat_features.items():
+            column = np.asarray([str(row[feature['flat_feature_index']]) for row in rows])
+            uniques, inverse = np.unique(column, return_inverse=True)
+            codes = np.array([self.cat_hashes.get(value, UNKNOWN_HASH) for value in uniques],
+                             dtype=np.uint64)
+            hashes[:, index] = codes[inverse]
+        return floats, hashes
+
+    def _float_split(self, floats: np.ndarray, float_index: int, border: float) -> np.ndarray:
+        """
+        Бинаризация числового признака по границе с учетом обработки пропусков
+        """
+        values = floats[:, float_index]
+        result = values > border
+        if self.float_features[float_index].get('nan_value_treatment') == 'AsTrue':
+            result |= np.isnan(values)
+        return result
+
+    def _ctr_values(self, ctr: dict, floats: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+        """
+        Значения CTR для комбинации признаков
+        :param ctr: описание CTR из features_info
+        :param floats: числовые признаки
+        :param hashes: хэши категорий
+        :return: значения CTR
+        """
+        elements = ctr['elements']
+        projection = np.zeros(len(floats), dtype=np.uint64)
+        # порядок как в CatBoost: категории, затем бинаризованные числовые, затем one-hot
+        for element in elements:
+            if element['combination_element'] == 'cat_feature_value':
+                projection = _calc_hash(projection, hashes[:, element['cat_feature_index']])
+        for element in elements:
+            if element['combination_element'] == 'float_feature':
+                binary = self._float_split(floats, element['float_feature_index'], element['border'])
+                projection = _calc_hash(projection, binary.astype(np.uint64))
+        for element in elements:
+            if element['combination_element'] == 'cat_feature_exact_value':
+                value = np.uint64(element['value'] & 0xFFFFFFFF)
+                binary = hashes[:, element['cat_feature_index']] == value
+                projection = _calc_hash(projection, binary.astype(np.uint64))
+
+        data = self.ctr_data[ctr['identifier']]
+        keys, values = data['keys'], data['values']
+        position = np.minimum(np.searchsorted(keys, projection), max(len(keys) - 1, 0))
+        found = keys[position] == projection if len(keys) else np.zeros(len(projection), bool)
+        counts = np.where(found[:, None], values[position], 0.0) if len(keys) \
+            else np.zeros((len(projection), 1))
+
+        ctr_type = ctr.get('ctr_type', json.loads(ctr['identifier']).get('type'))
+        border_idx = ctr.get('target_border_idx', 0)
+        if ctr_type == 'Borders':
+            good = counts[:, border_idx + 1:].sum(axis=1)
+            total = counts.sum(axis=1)
+        elif ctr_type == 'Buckets':
+            good = counts[:, border_idx]
+            total = counts.sum(axis=1)
+        elif ctr_type in ('BinarizedTargetMeanValue', 'FloatTargetMeanValue'):
+            good, total = counts[:, 0], counts[:, 1]
+        elif ctr_type in ('Counter', 'FeatureFreq'):
+            good = counts[:, 0]
+            total = np.where(found, data['counter_denominator'], 0)
+        else:
+            raise ValueError(f"Неизвестный тип CTR: {ctr_type}")
+        value = (good + ctr['prior_numerator']) / (total + ctr['prior_denomerator'])
+        return (value + ctr['shift']) * ctr['scale']
+
+    def _split(self, split: dict, floats: np.ndarray, hashes: np.ndarray, cache: dict) -> np.ndarray:
+        """
+        Значение бинарного признака для разбиения дерева
+        :param split: разбиение из JSON
+        :param floats: числовые признаки
+        :param hashes: хэши категорий
+        :param cache: посчитанные значения CTR
+        :return: булев массив
+        """
+        split_type = split['split_type']
+        if split_type == 'FloatFeature':
+            return self._float_split(floats, split['float_feature_index'], split['border'])
+        if split_type == 'OneHotFeature':
+            return hashes[:, split['cat_feature_index']] == np.uint64(split['value'] & 0xFFFFFFFF)
+        if split_type == 'OnlineCtr':
+            ctr_idx, border = self.ctr_splits[split['split_index'] - self.ctr_offset]
+            if not np.isclose(border, split['border']):
+                raise ValueError(f"Граница CTR не совпадает для split_index={split['split_index']}")
+            if ctr_idx not in cache:
+                cache[ctr_idx] = self._ctr_values(self.ctrs[ctr_idx], floats, hashes)
+            return cache[ctr_idx] > split['border']
+        raise ValueError(f"Неизвестный тип разбиения: {split_type}")
+
+    def predict_raw(self, rows: Sequence[Sequence]) -> np.ndarray:
+        """
+        Сырое значение модели (логит) для каждого объекта
+        :param rows: векторы признаков в порядке feature_names_
+        :return: массив значений
+        """
+        floats, hashes = self._columns(rows)
+        cache = {}
+        binary_cache = {}
+        result = np.zeros(len(floats))
+        for splits, leaf_values in self.trees:
+            index = np.zeros(len(floats), dtype=np.int64)
+            for depth, split in enumerate(splits):
+                key = split['split_index']
+                if key not in binary_cache:
+                    binary_cache[key] = self._split(split, floats, hashes, cache)
+                index |= binary_cache[key].astype(np.int64) << depth
+            result += leaf_values[index]
+        return result * self.scale + self.bias
+
+    def predict_proba(self, rows: Sequence[Sequence]) -> np.ndarray:
+        """
+        Вероятности классов
+        :param rows: векторы признаков в порядке feature_names_
+        :return: массив объекты x 2
+        """
+        probability = 1 / (1 + np.exp(-self.predict_raw(rows)))
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, rows: Sequence[Sequence]) -> np.ndarray:
+        """
+        Метки классов
+        :param rows: векторы признаков в порядке feature_names_
+        :return: массив меток
+        """
+        return self.classes_[(self.predict_raw(rows) > 0).astype(np.int64)]
@@ -0,0 +1,138 @@
+"""
+Кэш предсказаний по введенным данным: одинаковые запросы (повторная отправка
+формы, повторы клиента) не проходят предобработку и модель повторно
+Версия: 1.0
+"""
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Mapping, Optional, Tuple
+
+MISSING = object()
+
+
+class PredictionCache:
+    """
+    LRU-кэш с ограничением времени жизни записей. Ключ - хэш признаков
+    и версии модели, при смене версии модели кэш очищается
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: Optional[float] = 600):
+        """
+        :param max_size: максимальное кол-во записей, 0 - кэш выключен
+        :param ttl_seconds: время жизни записи, сек, None - без ограничения
+        """
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_version: Optional[str] = None
+        # метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(features: Mapping, model_version: Optional[str]) -> Tuple[str, str]:
+        """
+        Канонический ключ записи: порядок полей не влияет на ключ
+        :param features: введенные данные
+        :param model_version: версия загруженной модели
+        :return: версия модели и хэш признаков
+        """
+        payload = json.dumps(features, sort_keys=True, separators=(',', ':'), default=str)
+        digest = hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+        return str(model_version), digest
+
+    def _check_version(self, model_version: str) -> None:
+        """
+        Очистка кэша при смене версии модели (вызывается под блокировкой)
+        """
+        if model_version != self._model_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._model_version = model_version
+
+    def get(self, key: Tuple[str, str]) -> Any:
+        """
+        Предсказание из кэша
+        :param key: ключ из PredictionCache.key
+        :return: предсказание или MISSING
+        """
+        if not self.max_size:
+            return MISSING
+        with self._lock:
+            self._check_version(key[0])
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None \
+                    and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[str, str], value: Any) -> None:
+        """
+        Сохранение предсказания, при переполнении удаляется давно не использованная запись
+        :param key: ключ из PredictionCache.key
+        :param value: предсказание
+        """
+        if not self.max_size:
+            return
+        with self._lock:
+            self._check_version(key[0])
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Метрики кэша
+        :return: словарь с размером, попаданиями и долей попаданий
+        """
+        requests = self.hits + self.misses
+        return {
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "size": len(self._entries),
+            "model_version": self._model_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def render_prometheus(self) -> str:
+        """
+        Метрики кэша в текстовом формате Prometheus
+        :return: текст для /metrics
+        """
+        metrics = [
+            ("prediction_cache_hits_total", "counter", "Кол-во попаданий в кэш", self.hits),
+            ("prediction_cache_misses_total", "counter", "Кол-во промахов кэша", self.misses),
+            ("prediction_cache_evictions_total", "counter",
+             "Кол-во записей, вытесненных при переполнении", self.evictions),
+            ("prediction_cache_invalidations_total", "counter",
+             "Кол-во очисток кэша при смене модели", self.invalidations),
+            ("prediction_cache_size", "gauge", "Кол-во записей в кэше", len(self._entries)),
+        ]
+        lines = []
+        for metric, metric_type, description, value in metrics:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,255 @@
+"""
+Фоновое обучение модели в отдельном процессе со статусом и прогрессом подбора параметров
+Версия: 1.0
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import multiprocessing
+from typing import Optional, Tuple
+
+from ..config.settings import get_config
+from ..pipeline.pipeline import pipeline_train
+from ..train.metrics import load_metrics
+
+ACTIVE_STATES = ("queued", "running")
+# lock без id или без статуса задачи считается занятым, пока он моложе этого срока, сек
+LOCK_GRACE_SECONDS = 60
+
+
+def write_status(status_path: str, status: dict) -> None:
+    """
+    Атомарная запись статуса задачи
+    :param status_path: путь до файла статуса
+    :param status: статус задачи
+    """
+    tmp_path = f"{status_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(status, file)
+    os.replace(tmp_path, status_path)
+
+
+def read_status(status_path: str) -> Optional[dict]:
+    """
+    Чтение статуса задачи
+    :param status_path: путь до файла статуса
+    :return: статус задачи или None, если задачи нет
+    """
+    try:
+        with open(status_path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def read_lock(lock_path: str) -> Optional[Tuple[str, float]]:
+    """
+    Чтение файла активной задачи
+    :param lock_path: путь до файла активной задачи
+    :return: id задачи и возраст файла в секундах или None, если файла нет
+    """
+    try:
+        with open(lock_path) as file:
+            job_id = file.read().strip()
+        return job_id, time.time() - os.stat(lock_path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def remove_lock(lock_path: str, job_id: str) -> None:
+    """
+    Удаление файла активной задачи, только если он все еще принадлежит этой задаче
+    :param lock_path: путь до файла активной задачи
+    :param job_id: id задачи
+    """
+    lock = read_lock(lock_path)
+    if lock is not None and lock[0] == job_id:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def run_training_job(config_path: str, status_path: str, lock_path: str) -> None:
+    """
+    Обучение модели в дочернем процессе с записью прогресса в файл статуса
+    :param config_path: путь до конфигурационного файла
+    :param status_path: путь до файла статуса задачи
+    :param lock_path: путь до файла активной задачи, удаляется по завершении
+    """
+    status = read_status(status_path)
+    # callbacks optuna вызываются из параллельных trials
+    lock = threading.Lock()
+
+    def update(**fields) -> None:
+        with lock:
+            status.update(fields)
+            write_status(status_path, status)
+
+    def on_stage(stage: str) -> None:
+        update(stage=stage, **{f"{stage}_started_at": time.time()})
+
+    def on_trial(study, trial) -> None:
+        states = [t.state.name for t in study.trials]
+        completed = states.count("COMPLETE")
+        finished_in_run = status["trials_finished_in_run"] + 1
+        # оценка оставшегося времени по средней длительности trial в этом запуске
+        elapsed = time.time() - status["tuning_started_at"]
+        remaining = max(status["n_trials"] - completed, 0)
+        update(trials_finished_in_run=finished_in_run,
+               trials_completed=completed,
+               trials_pruned=states.count("PRUNED"),
+               trials_failed=states.count("FAIL"),
+               best_value=study.best_value if completed else None,
+               last_trial={"number": trial.number,
+                           "state": trial.state.name,
+                           "value": trial.value},
+               eta_seconds=round(elapsed / finished_in_run * remaining, 1))
+
+    update(state="running", pid=os.getpid(), started_at=time.time())
+    try:
+        pipeline_train(config_path=config_path, progress=on_stage, callbacks=[on_trial])
+        update(state="finished",
+               stage=None,
+               eta_seconds=0,
+               finished_at=time.time(),
+               metrics=load_metrics(config_path=config_path))
+    except Exception as error:  # pylint: disable=broad-except
+        update(state="failed", finished_at=time.time(), error=repr(error))
+    finally:
+        remove_lock(lock_path, status["job_id"])
+
+
+class TrainingJobs:
+    """
+    Запуск обучения в отдельном процессе. Статус задач хранится в файлах,
+    поэтому доступен из любого воркера сервиса. Одновременно выполняется
+    только одна задача: повторный запрос возвращает уже запущенную
+    """
+
+    def __init__(self, config_path: str, jobs_dir: str):
+        """
+        :param config_path: путь до конфигурационного файла
+        :param jobs_dir: папка для файлов статуса задач
+        """
+        self.config_path = config_path
+        self.jobs_dir = jobs_dir
+        self.lock_path = os.path.join(jobs_dir, "active.lock")
+        self._context = multiprocessing.get_context("spawn")
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _status_path(self, job_id: str) -> str:
+        """Путь до файла статуса задачи"""
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    @staticmethod
+    def _is_alive(status: dict) -> bool:
+        """
+        Проверка, что задача еще выполняется
+        :param status: статус задачи
+        :return: True, если процесс задачи жив
+        """
+        if status["state"] not in ACTIVE_STATES:
+            return False
+        if status.get("pid") is None:
+            # процесс еще не успел запуститься
+            return time.time() - status["created_at"] < 60
+        try:
+            os.kill(status["pid"], 0)
+        except OSError:
+            return False
+        return True
+
+    def active_job(self) -> Optional[dict]:
+        """
+        Текущая выполняемая задача
+        :return: статус задачи или None
+        """
+        lock = read_lock(self.lock_path)
+        if lock is None:
+            return None
+        job_id, lock_age = lock
+        status = self.status(job_id) if job_id else None
+        if status is None:
+            # lock без id или статуса мог быть создан другим запросом только что
+            if lock_age < LOCK_GRACE_SECONDS:
+                return {"job_id": job_id or None, "state": "queued"}
+        elif self._is_alive(status):
+            return status
+        elif status["state"] in ACTIVE_STATES:
+            # задача завершилась аварийно и не удалила lock
+            status.update(state="failed", error="Процесс обучения был прерван")
+            write_status(self._status_path(job_id), status)
+        remove_lock(self.lock_path, job_id)
+        return None
+
+    def submit(self) -> Tuple[dict, bool]:
+        """
+        Запуск обучения, если нет уже выполняемой задачи
+        :return: статус задачи, True если задача создана этим запросом
+        """
+        # завершенные дочерние процессы собираются, чтобы не оставалось зомби
+        multiprocessing.active_children()
+        active = self.active_job()
+        if active is not None:
+            return active, False
+
+        job_id = uuid.uuid4().hex[:12]
+        config = get_config(self.config_path)
+        status = {
+            "job_id": job_id,
+            "state": "queued",
+            "pid": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "stage": None,
+            "n_trials": config["train"]["n_trials"],
+            "trials_finished_in_run": 0,
+            "trials_completed": 0,
+            "trials_pruned": 0,
+            "trials_failed": 0,
+            "best_value": None,
+            "last_trial": None,
+            "eta_seconds": None,
+            "metrics": None,
+            "error": None,
+        }
+        status_path = self._status_path(job_id)
+        write_status(status_path, status)
+
+        # статус записан до lock, а lock появляется сразу с id задачи:
+        # os.link атомарно создает файл из готового и не перезаписывает существующий
+        tmp_lock_path = f"{self.lock_path}.{os.getpid()}.{job_id}.tmp"
+        with open(tmp_lock_path, "w") as file:
+            file.write(job_id)
+        try:
+            os.link(tmp_lock_path, self.lock_path)
+        except FileExistsError:
+            # задачу одновременно запустил другой запрос
+            os.remove(status_path)
+            active = self.active_job()
+            if active is not None:
+                return active, False
+            return self.submit()
+        finally:
+            os.remove(tmp_lock_path)
+
+        process = self._context.Process(target=run_training_job,
+                                        args=(self.config_path, status_path, self.lock_path),
+                                        daemon=False)
+        process.start()
+        return status, True
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """
+        Статус задачи
+        :param job_id: id задачи
+        :return: статус задачи или None, если задачи нет
+        """
+        multiprocessing.active_children()
+        if not job_id.isalnum():
+            return None
+        return read_status(self._status_path(job_id))
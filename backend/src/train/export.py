@@ -0,0 +1,87 @@
+"""
+Выгрузка обученной модели в переносимом формате (CatBoost CBM и JSON
+со словарем хэшей категорий) и сверка numpy-применения с CatBoost
+Версия: 1.0
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier, Pool
+
+from ..serving.oblivious_trees import ObliviousTreesModel
+from ..monitoring.instrumentation import instrument
+
+
+@instrument("export_model")
+def export_model(model: CatBoostClassifier, data: pd.DataFrame, export_dir: str) -> dict:
+    """
+    Сохранение модели в форматах CBM и JSON, словаря хэшей категорий и описания признаков.
+    JSON и словарь хэшей сохраняются только для моделей с grow_policy=SymmetricTree
+    :param model: обученная модель
+    :param data: объект-признаки, по категориям которых строится словарь хэшей
+    :param export_dir: папка выгрузки
+    :return: описание выгрузки (meta.json)
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    feature_names = list(model.feature_names_)
+    cat_features = [feature_names[i] for i in model.get_cat_feature_indices()]
+    model.save_model(os.path.join(export_dir, 'model.cbm'), format='cbm')
+
+    meta = {
+        'feature_names': feature_names,
+        'cat_features': cat_features,
+        'class_names': np.asarray(model.classes_).tolist(),
+        'grow_policy': model.get_all_params().get('grow_policy', 'SymmetricTree'),
+        'json_exported': False,
+    }
+    if meta['grow_policy'] == 'SymmetricTree':
+        json_path = os.path.join(export_dir, 'model.json')
+        # pool нужен, чтобы в выгрузку попали хэши значений категорий
+        model.save_model(json_path, format='json',
+                         pool=Pool(data[feature_names], cat_features=cat_features))
+        with open(json_path) as file:
+            model_json = json.load(file)
+        cat_hashes = {item['value']: item['hash']
+                      for item in model_json.get('cat_features_hash', [])}
+        with open(os.path.join(export_dir, 'cat_hashes.json'), 'w') as file:
+            json.dump(cat_hashes, file)
+        meta['json_exported'] = True
+
+    with open(os.path.join(export_dir, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+    return meta
+
+
+@instrument("validate_export")
+def validate_export(model: CatBoostClassifier,
+                    data: pd.DataFrame,
+                    export_dir: str,
+                    tolerance: float = 1e-6) -> dict:
+    """
+    Сверка вероятностей ObliviousTreesModel с CatBoostClassifier.predict_proba.
+    Результат сохраняется в validation.json в папке выгрузки
+    :param model: обученная модель
+    :param data: объект-признаки для сверки
+    :param export_dir: папка выгрузки
+    :param tolerance: допустимое абсолютное расхождение вероятностей
+    :return: словарь с максимальным расхождением и результатом проверки
+    """
+    fast_model = ObliviousTreesModel.load(export_dir)
+    features = data[fast_model.feature_names_]
+    rows = features.astype(object).to_numpy().tolist()
+
+    expected = model.predict_proba(features)[:, 1]
+    actual = fast_model.predict_proba(rows)[:, 1]
+    max_abs_diff = float(np.max(np.abs(expected - actual))) if len(rows) else 0.0
+    result = {
+        'n_rows': len(rows),
+        'max_abs_diff': max_abs_diff,
+        'labels_match': bool((model.predict(features).ravel() == fast_model.predict(rows)).all()),
+        'tolerance': tolerance,
+    }
+    result['passed'] = max_abs_diff <= tolerance and result['labels_match']
+    with open(os.path.join(export_dir, 'validation.json'), 'w') as file:
+        json.dump(result, file, indent=2)
+    return result
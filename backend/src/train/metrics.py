@@ -3,12 +3,13 @@
 Версия: 1.0
 """
 import json
-import yaml
 
 import pandas as pd
 import numpy as np
 from sklearn.metrics import roc_auc_score, precision_score, recall_score, f1_score
 
+from ..config.settings import get_config
+
 
 def get_metrics_dict(y_test: pd.Series, y_pred: np.array, y_score: np.array) -> dict:
     """
@@ -53,8 +54,7 @@ def load_metrics(config_path: str) -> dict:
     :return: метрики
     """
     # get params
-    with open(config_path) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(config_path)
 
     with open(config["train"]["metrics_path"]) as json_file:
         metrics = json.load(json_file)
@@ -0,0 +1,128 @@
+"""
+Кэш квантованных CatBoost pools: границы признаков считаются один раз
+для каждого border_count и сохраняются на диск
+Версия: 1.0
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from catboost import Pool
+
+# файлы одной записи кэша: train pool удаляется первым, его наличие означает готовую запись
+SUFFIXES = ("train.bin", "eval.bin", "borders.tsv")
+
+
+class QuantizedPoolCache:
+    """
+    Квантованные pools хранятся на диске в формате CatBoost (quantized://)
+    под ключом из хэша данных, названия части данных и border_count,
+    и переиспользуются между trials и между запусками обучения.
+    При превышении размера удаляются давно не использованные записи (LRU),
+    кроме записей текущих данных
+    """
+
+    def __init__(self, cache_dir: str, data_hash: str, max_size_mb: float = 4096):
+        """
+        :param cache_dir: папка для квантованных pools
+        :param data_hash: хэш обучающих данных (и параметров разбиения)
+        :param max_size_mb: максимальный размер кэша, Мб
+        """
+        self.cache_dir = cache_dir
+        self.data_hash = data_hash
+        self.max_size = max_size_mb * 2 ** 20
+        self._pools: Dict[Tuple[str, int], Tuple[Pool, Pool]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name: str, border_count: int, suffix: str) -> str:
+        """Путь до файла кэша"""
+        return os.path.join(self.cache_dir,
+                            f"{self.data_hash}_{name}_b{border_count}.{suffix}")
+
+    def get(self,
+            name: str,
+            border_count: int,
+            x_train: pd.DataFrame,
+            y_train: pd.Series,
+            x_eval: Optional[pd.DataFrame] = None,
+            y_eval: Optional[pd.Series] = None) -> Tuple[Pool, Optional[Pool]]:
+        """
+        Получение квантованных train и eval pools. Eval pool квантуется
+        по границам train pool
+        :param name: название части данных (например, fold_0)
+        :param border_count: кол-во границ для числовых признаков
+        :param x_train: train объект-признаки
+        :param y_train: train таргет
+        :param x_eval: eval объект-признаки
+        :param y_eval: eval таргет
+        :return: квантованные train pool и eval pool (или None)
+        """
+        key = (name, border_count)
+        if key in self._pools:
+            return self._pools[key]
+
+        with self._lock:
+            if key in self._pools:
+                return self._pools[key]
+
+            train_path = self._path(name, border_count, "train.bin")
+            eval_path = self._path(name, border_count, "eval.bin")
+            borders_path = self._path(name, border_count, "borders.tsv")
+            has_eval = x_eval is not None
+
+            if not os.path.exists(train_path) or (has_eval and not os.path.exists(eval_path)):
+                cat_features = x_train.select_dtypes('category').columns.tolist()
+                train_pool = Pool(x_train, y_train, cat_features=cat_features)
+                train_pool.quantize(border_count=border_count)
+                train_pool.save_quantization_borders(borders_path)
+                train_pool.save(f"{train_path}.tmp")
+                if has_eval:
+                    eval_pool = Pool(x_eval, y_eval, cat_features=cat_features)
+                    eval_pool.quantize(input_borders=borders_path)
+                    eval_pool.save(f"{eval_path}.tmp")
+                    os.replace(f"{eval_path}.tmp", eval_path)
+                # train pool подменяется последним, его наличие означает готовый кэш
+                os.replace(f"{train_path}.tmp", train_path)
+                self._evict()
+            else:
+                # время изменения файла используется как время последнего обращения
+                for path in (train_path, eval_path, borders_path):
+                    if os.path.exists(path):
+                        os.utime(path)
+
+            pools = (Pool(f"quantized://{train_path}"),
+                     Pool(f"quantized://{eval_path}") if has_eval else None)
+            self._pools[key] = pools
+            return pools
+
+    def _evict(self) -> None:
+        """Удаление давно не использованных записей сверх максимального размера"""
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            suffix = next((suffix for suffix in SUFFIXES if name.endswith(f".{suffix}")), None)
+            if suffix is None:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            prefix = name[:-len(suffix) - 1]
+            mtime, size = entries.get(prefix, (0.0, 0))
+            entries[prefix] = (max(mtime, stat.st_mtime), size + stat.st_size)
+
+        total = sum(size for _, size in entries.values())
+        for mtime, size, prefix in sorted((mtime, size, prefix)
+                                          for prefix, (mtime, size) in entries.items()):
+            if total <= self.max_size:
+                break
+            # pools текущих данных используются обучением
+            if prefix.startswith(f"{self.data_hash}_"):
+                continue
+            for suffix in SUFFIXES:
+                try:
+                    os.remove(os.path.join(self.cache_dir, f"{prefix}.{suffix}"))
+                except FileNotFoundError:
+                    pass
+            total -= size
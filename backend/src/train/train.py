@@ -2,31 +2,130 @@
 Поиск параметров и обучение модели
 Версия: 1.0
 """
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
 import optuna
-from catboost import CatBoostClassifier
+from optuna.storages import RDBStorage, RetryFailedTrialCallback
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
+from catboost import CatBoostClassifier, Pool
 from sklearn.model_selection import StratifiedKFold
 from sklearn.metrics import roc_auc_score
 
 import pandas as pd
 import numpy as np
 
+from ..data.get_data import get_data_hash
 from ..data.train_test_split import get_split_data
 from ..train.metrics import save_metrics
+from ..train.pool_cache import QuantizedPoolCache
+from ..monitoring.instrumentation import instrument
 
 
-def objective(
-        trial,
-        data_x: pd.DataFrame,
-        data_y: pd.Series,
-        n_folds: int = 5,
-        random_state: int = 10):
+def get_cv_folds(data_x: pd.DataFrame,
+                 data_y: pd.Series,
+                 n_folds: int = 5,
+                 random_state: int = 10) -> List[dict]:
     """
-    Функция для подбора параметров
-    :param trial: кол-во trials
+    Разбиение данных на фолды один раз на весь подбор параметров.
+    Для test части сразу создается Pool для получения предсказаний
     :param data_x: данные с объект-признаками
     :param data_y: данные с таргетом
     :param n_folds: кол-во фолдов
     :param random_state: random state
+    :return: список фолдов со словарями x_train, y_train, x_test, y_test, test_pool
+    """
+    cv_folds = StratifiedKFold(n_splits=n_folds,
+                               shuffle=True,
+                               random_state=random_state)
+    cat_features = data_x.select_dtypes('category').columns.tolist()
+
+    folds = []
+    for train_idx, test_idx in cv_folds.split(data_x, data_y):
+        x_test, y_test = data_x.iloc[test_idx], data_y.iloc[test_idx]
+        folds.append({
+            "x_train": data_x.iloc[train_idx],
+            "y_train": data_y.iloc[train_idx],
+            "x_test": x_test,
+            "y_test": y_test,
+            "test_pool": Pool(x_test, cat_features=cat_features),
+        })
+    return folds
+
+
+class StopFlagCallback:
+    """
+    Callback CatBoost: обучение останавливается после текущей итерации,
+    как только выставлен флаг (trial остановлен pruner)
+    """
+
+    def __init__(self, stop_event: threading.Event):
+        """
+        :param stop_event: флаг остановки
+        """
+        self.stop_event = stop_event
+
+    def after_iteration(self, info) -> bool:
+        """
+        Вызывается CatBoost после каждой итерации
+        :param info: состояние обучения
+        :return: False - остановить обучение
+        """
+        return not self.stop_event.is_set()
+
+
+def fit_fold(cat_params: dict,
+             fold_idx: int,
+             fold: dict,
+             pool_cache: QuantizedPoolCache,
+             stop_event: Optional[threading.Event] = None) -> float:
+    """
+    Обучение модели на одном фолде на квантованных pools из кэша
+    :param cat_params: параметры CatBoost
+    :param fold_idx: номер фолда
+    :param fold: фолд из get_cv_folds
+    :param pool_cache: кэш квантованных pools
+    :param stop_event: флаг остановки обучения, None - без остановки
+    :return: ROC-AUC на test части фолда
+    """
+    train_pool, eval_pool = pool_cache.get(name=f"fold_{fold_idx}",
+                                           border_count=cat_params["border_count"],
+                                           x_train=fold["x_train"],
+                                           y_train=fold["y_train"],
+                                           x_eval=fold["x_test"],
+                                           y_eval=fold["y_test"])
+    model = CatBoostClassifier(**cat_params)
+    model.fit(train_pool,
+              eval_set=eval_pool,
+              early_stopping_rounds=100,
+              callbacks=[StopFlagCallback(stop_event)] if stop_event is not None else None,
+              verbose=0)
+    preds_proba = model.predict_proba(fold["test_pool"])[:, 1]
+    return roc_auc_score(fold["y_test"], preds_proba)
+
+
+def objective(
+        trial,
+        cv_folds: List[dict],
+        pool_cache: QuantizedPoolCache,
+        random_state: int = 10,
+        thread_count: int = -1,
+        fold_jobs: int = 1):
+    """
+    Функция для подбора параметров. Фолды обучаются параллельно, промежуточные
+    значения передаются в optuna в порядке фолдов (шаг - номер фолда), чтобы pruner
+    сравнивал trials на одних и тех же фолдах. При остановке trial уже начатые
+    фолды прерываются через флаг остановки
+    :param trial: кол-во trials
+    :param cv_folds: фолды из get_cv_folds
+    :param pool_cache: кэш квантованных pools
+    :param random_state: random state
+    :param thread_count: кол-во потоков CatBoost на один trial
+    :param fold_jobs: кол-во фолдов, обучаемых параллельно
     :return: среднее значение метрики по фолдам
     """
     cat_params = {
@@ -71,57 +170,192 @@ def objective(
                                                       1,
                                                       log=True)
 
-    cv_folds = StratifiedKFold(n_splits=n_folds,
-                               shuffle=True,
-                               random_state=random_state)
+    # потоки trial делятся между параллельно обучаемыми фолдами: фолдов
+    # одновременно обучается не больше, чем потоков у trial
+    fold_jobs = max(1, min(fold_jobs, len(cv_folds)))
+    if thread_count > 0:
+        fold_jobs = min(fold_jobs, thread_count)
+    cat_params["thread_count"] = thread_count // fold_jobs if thread_count > 0 else -1
+    cat_params["allow_writing_files"] = False
+
+    stop_event = threading.Event()
+    fold_scores = {}
+    cv_predicts = []
+    with ThreadPoolExecutor(max_workers=fold_jobs) as executor:
+        futures = {executor.submit(fit_fold, cat_params, idx, fold, pool_cache, stop_event): idx
+                   for idx, fold in enumerate(cv_folds)}
+        for future in as_completed(futures):
+            fold_scores[futures[future]] = future.result()
+            # в optuna передаются только фолды, идущие подряд с первого,
+            # фолд, обученный раньше предыдущих, ждет их завершения
+            pruned = False
+            while len(cv_predicts) in fold_scores:
+                cv_predicts.append(fold_scores[len(cv_predicts)])
+                trial.report(np.mean(cv_predicts), step=len(cv_predicts))
+                if trial.should_prune():
+                    pruned = True
+                    break
+            if pruned:
+                # еще не начатые фолды отменяются, начатые останавливаются callback
+                stop_event.set()
+                for pending in futures:
+                    pending.cancel()
+                raise optuna.TrialPruned()
 
-    cv_predicts = np.empty(n_folds)
+    return np.mean(cv_predicts)
 
-    for idx, (train_idx, test_idx) in enumerate(cv_folds.split(data_x, data_y)):
-        x_train, x_test = data_x.iloc[train_idx], data_x.iloc[test_idx]
-        y_train, y_test = data_y.iloc[train_idx], data_y.iloc[test_idx]
 
-        cat_features = data_x.select_dtypes('category').columns.tolist()
-        model = CatBoostClassifier(**cat_params, cat_features=cat_features)
-        model.fit(x_train,
-                  y_train,
-                  eval_set=[(x_test, y_test)],
-                  early_stopping_rounds=100,
-                  verbose=0)
+def get_pruner(pruner: str, n_startup_trials: int, n_warmup_steps: int) -> optuna.pruners.BasePruner:
+    """
+    Pruner для остановки неудачных trials по промежуточным значениям метрики на фолдах
+    :param pruner: median, hyperband или none
+    :param n_startup_trials: кол-во trials без остановки (для median)
+    :param n_warmup_steps: кол-во фолдов до первой проверки (для median)
+    :return: pruner optuna
+    """
+    if pruner == "median":
+        return optuna.pruners.MedianPruner(n_startup_trials=n_startup_trials,
+                                           n_warmup_steps=n_warmup_steps)
+    if pruner == "hyperband":
+        return optuna.pruners.HyperbandPruner(min_resource=1)
+    return optuna.pruners.NopPruner()
+
+
+def get_threads_per_trial(n_jobs: int, fold_jobs: int = 1) -> Tuple[int, int]:
+    """
+    Распределение ядер между параллельными trials и их фолдами, чтобы CatBoost
+    в разных trials не конкурировал за одни и те же ядра: всего одновременно
+    обучается не больше n_jobs * fold_jobs моделей, чем ядер
+    :param n_jobs: кол-во параллельных trials, -1 - по кол-ву ядер
+    :param fold_jobs: кол-во фолдов, обучаемых параллельно в одном trial
+    :return: кол-во параллельных trials, кол-во потоков CatBoost на trial
+    """
+    n_cpu = os.cpu_count() or 1
+    max_jobs = max(1, n_cpu // max(1, fold_jobs))
+    n_jobs = max_jobs if n_jobs == -1 else max(1, min(n_jobs, max_jobs))
+    return n_jobs, max(1, n_cpu // n_jobs)
+
+
+def load_best_params(best_params_path: str) -> dict:
+    """
+    Загрузка лучших параметров предыдущего подбора
+    :param best_params_path: путь до файла с параметрами
+    :return: словарь с параметрами, пустой если файла нет
+    """
+    if not os.path.exists(best_params_path):
+        return {}
+    with open(best_params_path) as file:
+        return json.load(file)
 
-        preds_proba = model.predict_proba(x_test)[:, 1]
-        cv_predicts[idx] = roc_auc_score(y_test, preds_proba)
 
-        return np.mean(cv_predicts)
+def get_best_params(study: optuna.Study, best_params_path: str = None) -> dict:
+    """
+    Лучшие параметры study. Если ни один trial не завершился (все остановлены
+    pruner или упали), используются параметры предыдущего подбора,
+    а без них - параметры CatBoost по умолчанию
+    :param study: study optuna
+    :param best_params_path: путь до файла с параметрами предыдущего подбора
+    :return: словарь с параметрами
+    """
+    try:
+        return study.best_params
+    except ValueError:
+        return load_best_params(best_params_path) if best_params_path else {}
 
 
+@instrument("find_optimal_params")
 def find_optimal_params(
-        data_train: pd.DataFrame, data_test: pd.DataFrame, **kwargs
+        data_train: pd.DataFrame, data_test: pd.DataFrame, callbacks: list = None, **kwargs
 ) -> optuna.Study:
     """
-    Пайплайн для тренировки модели
+    Пайплайн для тренировки модели.
+    Trials выполняются параллельно и сохраняются в хранилище optuna (sqlite),
+    поэтому прерванный подбор продолжается при следующем запуске на тех же данных.
+    Новый study начинается с лучших параметров предыдущего подбора
     :param data_train: датасет train
     :param data_test: датасет test
+    :param callbacks: дополнительные callbacks optuna, вызываемые после каждого trial
     :return: [CarBoostClassifier tuning, Study]
     """
     x_train, x_test, y_train, y_test = get_split_data(
         data_train=data_train, data_test=data_test, target=kwargs["target"]
     )
 
-    study = optuna.create_study(direction="maximize", study_name="CatBoost")
+    # sqlite блокирует файл целиком на запись: параллельные trials ждут
+    # освобождения базы, а не падают с "database is locked"
+    engine_kwargs = None
+    if kwargs["study_storage"].startswith("sqlite"):
+        engine_kwargs = {"connect_args": {"timeout": kwargs["study_storage_timeout"]}}
+    storage = RDBStorage(
+        url=kwargs["study_storage"],
+        engine_kwargs=engine_kwargs,
+        heartbeat_interval=60,
+        grace_period=180,
+        # trials, прерванные вместе с процессом, перезапускаются
+        failed_trial_callback=RetryFailedTrialCallback(max_retry=1),
+    )
+    # study привязан к данным: на тех же данных подбор продолжается
+    study = optuna.create_study(direction="maximize",
+                                study_name=f"CatBoost_{get_data_hash(data_train)}",
+                                storage=storage,
+                                pruner=get_pruner(kwargs["pruner"],
+                                                  kwargs["pruner_startup_trials"],
+                                                  kwargs["pruner_warmup_folds"]),
+                                load_if_exists=True)
+    if not study.trials:
+        best_params = load_best_params(kwargs["best_params_path"])
+        if best_params:
+            study.enqueue_trial(best_params, skip_if_exists=True)
+
+    cv_folds = get_cv_folds(x_train, y_train, kwargs["k_folds"], kwargs["random_state"])
+    # квантованные pools фолдов зависят от данных и параметров разбиения
+    pool_cache = QuantizedPoolCache(
+        cache_dir=kwargs["pool_cache_dir"],
+        data_hash=f"{get_data_hash(data_train)}_k{kwargs['k_folds']}_rs{kwargs['random_state']}",
+        max_size_mb=kwargs["pool_cache_max_size_mb"]
+    )
+    n_jobs, thread_count = get_threads_per_trial(kwargs["n_jobs"], kwargs["fold_jobs"])
     function = lambda trial: objective(
-        trial, x_train, y_train, kwargs["k_folds"], kwargs["random_state"]
+        trial, cv_folds, pool_cache, kwargs["random_state"], thread_count, kwargs["fold_jobs"]
     )
-    study.optimize(function, n_trials=kwargs["n_trials"], show_progress_bar=True)
+    study.optimize(function,
+                   n_trials=kwargs["n_trials"],
+                   n_jobs=n_jobs,
+                   callbacks=[MaxTrialsCallback(kwargs["n_trials"],
+                                                states=(TrialState.COMPLETE,))] + (callbacks or []),
+                   show_progress_bar=True)
+
+    # без завершенных trials сохраненные параметры предыдущего подбора не перезаписываются
+    if any(trial.state == TrialState.COMPLETE for trial in study.trials):
+        with open(kwargs["best_params_path"], "w") as file:
+            json.dump(study.best_params, file)
     return study
 
 
+def to_inmemory_study(study: optuna.Study) -> optuna.Study:
+    """
+    Копия study в памяти для сохранения через joblib без привязки к хранилищу
+    :param study: study optuna
+    :return: study с in-memory хранилищем
+    """
+    inmemory_study = optuna.create_study(direction=study.direction, study_name=study.study_name)
+    inmemory_study.add_trials([
+        trial for trial in study.trials
+        if trial.state in (TrialState.COMPLETE, TrialState.PRUNED, TrialState.FAIL)
+    ])
+    return inmemory_study
+
+
+@instrument("train_model")
 def train_model(
     data_train: pd.DataFrame,
     data_test: pd.DataFrame,
     study: optuna.Study,
     target: str,
     metric_path: str,
+    pool_cache_dir: str = None,
+    best_params_path: str = None,
+    pool_cache_max_size_mb: float = 4096,
 ) -> CatBoostClassifier:
     """
     Обучение модели на лучших параметрах
@@ -130,6 +364,10 @@ def train_model(
     :param study: study optuna
     :param target: название целевой переменной
     :param metric_path: путь до папки с метриками
+    :param pool_cache_dir: папка кэша квантованных pools, если None - обучение без кэша
+    :param best_params_path: путь до параметров предыдущего подбора,
+    если в study нет завершенных trials
+    :param pool_cache_max_size_mb: максимальный размер кэша квантованных pools, Мб
     :return: CatBoostClassifier
     """
     # разбивка данных на train/test
@@ -138,12 +376,27 @@ def train_model(
     )
 
     # обучение на лучших параметрах
-    cat_features = x_train.select_dtypes('category').columns.tolist()
-    clf = CatBoostClassifier(**study.best_params,
-                             allow_writing_files=False,
-                             cat_features=cat_features,
-                             verbose=False)
-    clf.fit(x_train, y_train, verbose=False)
+    best_params = get_best_params(study, best_params_path)
+    if pool_cache_dir:
+        pool_cache = QuantizedPoolCache(cache_dir=pool_cache_dir,
+                                        data_hash=get_data_hash(data_train),
+                                        max_size_mb=pool_cache_max_size_mb)
+        train_pool, _ = pool_cache.get(name="full",
+                                       # 254 - значение border_count в CatBoost по умолчанию
+                                       border_count=best_params.get("border_count", 254),
+                                       x_train=x_train,
+                                       y_train=y_train)
+        clf = CatBoostClassifier(**best_params,
+                                 allow_writing_files=False,
+                                 verbose=False)
+        clf.fit(train_pool, verbose=False)
+    else:
+        cat_features = x_train.select_dtypes('category').columns.tolist()
+        clf = CatBoostClassifier(**best_params,
+                                 allow_writing_files=False,
+                                 cat_features=cat_features,
+                                 verbose=False)
+        clf.fit(x_train, y_train, verbose=False)
 
     # сохранение метрик
     save_metrics(x_data=x_test, y_data=y_test, model=clf, metrics_path=metric_path)
@@ -0,0 +1,27 @@
+"""
+Общие фикстуры тестов. Запуск из папки backend: python -m pytest tests
+Версия: 1.0
+"""
+import os
+import sys
+import copy
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from src.config.settings import get_config  # noqa: E402  pylint: disable=wrong-import-position
+
+CONFIG_PATH = os.path.join(BACKEND_DIR, "..", "config", "parameters.yaml")
+
+
+@pytest.fixture
+def config(tmp_path) -> dict:
+    """
+    Копия конфига, отчеты которого пишутся во временную папку
+    """
+    cfg = copy.deepcopy(get_config(CONFIG_PATH))
+    cfg['preprocessing']['memory_report_path'] = str(tmp_path / "memory.json")
+    cfg['instrumentation'] = {'enabled': False, 'report_dir': None}
+    return cfg
@@ -0,0 +1,70 @@
+"""
+Производные признаки (доли визитов, запросы в день, доля активных дней) совпадают
+для сырых логов, аггрегатов, собранных по частям, и введенных пользователем данных
+Версия: 1.0
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_raw_logs
+from src.preprocessing.derived_features import DERIVED_FEATURES, INPUT_COLUMNS
+from src.preprocessing.preprocessing_data import (change_cols_type,
+                                                  pipeline_raw_preprocessing,
+                                                  pipeline_feature_generation,
+                                                  merge_feature_generation)
+from src.preprocessing.preprocessing_input_data import preprocessing_input
+from src.preprocessing.preprocessing_input_fast import records_to_vectors, check_feature_skew
+from src.preprocessing.streaming_aggregation import pipeline_streaming_feature_generation
+
+DERIVED = list(DERIVED_FEATURES)
+
+
+@pytest.fixture
+def raw_logs(tmp_path) -> tuple:
+    """Синтетические сырые логи в памяти и в parquet"""
+    data = make_raw_logs(5000, 200, n_urls=500, n_regions=10, n_cities=30)
+    data['date'] = pd.to_datetime(data['date'])
+    # пользователь с одним визитом: period_days = 1
+    single = data.iloc[[0]].assign(user_id=np.int32(10 ** 6))
+    data = pd.concat([data, single], ignore_index=True)
+    path = str(tmp_path / "raw.parquet")
+    data.to_parquet(path, index=False)
+    return data, path
+
+
+def derived_columns(data: pd.DataFrame, columns_types: dict) -> pd.DataFrame:
+    """Производные признаки с типами из конфига в порядке user_id"""
+    data = data.sort_values('user_id', ignore_index=True)
+    return change_cols_type(data[DERIVED], {col: columns_types[col] for col in DERIVED})
+
+
+def test_derived_features_match_across_entry_points(raw_logs, config):
+    data, path = raw_logs
+    columns_types = config['preprocessing']['agg_columns_type']
+    preprocessed = pipeline_raw_preprocessing(data.copy(), config)
+
+    # сырые логи: векторная аггрегация и эталонная через groupby и merge
+    raw = pipeline_feature_generation(preprocessed)
+    expected = derived_columns(raw, columns_types)
+    pd.testing.assert_frame_equal(derived_columns(merge_feature_generation(preprocessed),
+                                                  columns_types), expected)
+
+    # аггрегаты, собранные по частям файла
+    config['preprocessing']['chunk_size'] = 700
+    streaming = pipeline_streaming_feature_generation(path, config)
+    pd.testing.assert_frame_equal(derived_columns(streaming, columns_types), expected)
+
+    # введенные данные тех же пользователей: датафрейм и быстрый путь сервиса
+    aggregated = change_cols_type(raw, columns_types).sort_values('user_id', ignore_index=True)
+    inputs = aggregated[INPUT_COLUMNS].copy()
+    pd.testing.assert_frame_equal(derived_columns(preprocessing_input(inputs).assign(
+        user_id=aggregated['user_id']), columns_types), expected)
+
+    vectors = records_to_vectors(aggregated[INPUT_COLUMNS].to_dict('records'),
+                                 columns_types, DERIVED)
+    served = change_cols_type(pd.DataFrame(vectors, columns=DERIVED),
+                              {col: columns_types[col] for col in DERIVED})
+    pd.testing.assert_frame_equal(served, expected)
+
+    assert check_feature_skew(aggregated, columns_types)['passed']
@@ -0,0 +1,74 @@
+"""
+Мода устройства при равенстве частот не зависит от способа чтения данных
+Версия: 1.0
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.get_data import get_data
+from src.preprocessing.preprocessing_data import (pipeline_raw_preprocessing,
+                                                  pipeline_feature_generation,
+                                                  merge_feature_generation)
+from src.preprocessing.streaming_aggregation import pipeline_streaming_feature_generation
+
+MODE_COLUMNS = ['cpe_type_cd', 'cpe_manufacturer_name', 'cpe_model_os_type']
+# у каждого пользователя по два визита с двумя устройствами: первым в файле
+# идет значение, которое больше при сортировке
+EXPECTED = {'cpe_type_cd': 'phablet', 'cpe_manufacturer_name': 'Apple',
+            'cpe_model_os_type': 'Android'}
+
+
+def make_tied_logs() -> pd.DataFrame:
+    """Сырые логи, в которых у каждого пользователя две моды"""
+    n_users = 3
+    first = {'cpe_type_cd': 'tablet', 'cpe_manufacturer_name': 'Xiaomi',
+             'cpe_model_os_type': 'iOS', 'cpe_model_name': 'model_x'}
+    second = {'cpe_type_cd': 'phablet', 'cpe_manufacturer_name': 'Apple',
+              'cpe_model_os_type': 'Android', 'cpe_model_name': 'model_a'}
+    rows = []
+    for user_id in range(n_users):
+        for device, part in [(first, 'day'), (first, 'evening'),
+                             (second, 'morning'), (second, 'night')]:
+            rows.append({'region_name': 'region_1', 'city_name': 'city_1',
+                         'url_host': f'url_{part}', 'date': '2022-06-01',
+                         'price': 1000.0, 'part_of_day': part, 'request_cnt': 1,
+                         'user_id': user_id, **device})
+    data = pd.DataFrame(rows)
+    data['date'] = pd.to_datetime(data['date'])
+    return data
+
+
+@pytest.fixture
+def files(tmp_path) -> dict:
+    """Одни и те же логи в parquet и csv"""
+    data = make_tied_logs()
+    paths = {'parquet': str(tmp_path / "raw.parquet"), 'csv': str(tmp_path / "raw.csv")}
+    data.to_parquet(paths['parquet'], index=False)
+    data.to_csv(paths['csv'], index=False)
+    return paths
+
+
+def check_modes(result: pd.DataFrame) -> None:
+    """Мода каждого пользователя - наименьшее значение"""
+    for column, value in EXPECTED.items():
+        assert (np.asarray(result[column]).astype(str) == value).all(), column
+
+
+@pytest.mark.parametrize('data_format', ['parquet', 'csv'])
+def test_in_memory_paths(files, config, data_format):
+    types = config['preprocessing']['change_col_types']
+    data = pipeline_raw_preprocessing(get_data(files[data_format], columns_types=types), config)
+    check_modes(pipeline_feature_generation(data))
+    check_modes(merge_feature_generation(data))
+
+
+@pytest.mark.parametrize('data_format', ['parquet', 'csv'])
+def test_streaming_path(files, config, data_format):
+    config['preprocessing']['chunk_size'] = 2
+    check_modes(pipeline_streaming_feature_generation(files[data_format], config))
+
+
+def test_untyped_path(config):
+    data = pipeline_raw_preprocessing(make_tied_logs(), config)
+    check_modes(pipeline_feature_generation(data))
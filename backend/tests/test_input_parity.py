@@ -0,0 +1,113 @@
+"""
+Быстрое построение признаков сервиса (records_to_vectors, predict_records) совпадает
+с предобработкой введенных данных через pandas (preprocessing_input + change_cols_type)
+Версия: 1.0
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.preprocessing.preprocessing_data import change_cols_type
+from src.preprocessing.preprocessing_input_data import preprocessing_input
+from src.preprocessing.preprocessing_input_fast import records_to_vectors, predict_records
+
+
+def make_records() -> list:
+    """
+    Введенные данные: обычные пользователи, нулевые period_days и визиты,
+    значения категорий, которых не было при обучении
+    """
+    base = {'part_of_day_day': 10, 'part_of_day_evening': 5, 'part_of_day_morning': 3,
+            'part_of_day_night': 2, 'act_days': 7, 'request_cnt': 120, 'period_days': 30,
+            'cpe_type_cd': 'smartphone', 'cpe_manufacturer_name': 'Apple', 'price': 80990.0,
+            'region_cnt': 2, 'city_cnt': 3, 'url_host_cnt': 45}
+    return [
+        base,
+        dict(base, cpe_manufacturer_name='Samsung', price=15490.5, period_days=1),
+        # act_days_pct = 3 / 0
+        dict(base, act_days=3, period_days=0),
+        # act_days_pct = 0 / 0, доли визитов = 0 / 0, avg_req_per_day = 0 / 0
+        dict(base, part_of_day_day=0, part_of_day_evening=0, part_of_day_morning=0,
+             part_of_day_night=0, act_days=0, request_cnt=0, period_days=0),
+        dict(base, cpe_type_cd='unknown_device', cpe_manufacturer_name='Unknown Vendor Ltd'),
+    ]
+
+
+def pandas_features(records: list, columns_types: dict, columns: list) -> pd.DataFrame:
+    """Признаки через датафрейм, как в evaluate_input_batch"""
+    data = preprocessing_input(pd.DataFrame(records))
+    return change_cols_type(data[columns], {col: columns_types[col] for col in columns})
+
+
+def vectors_to_frame(vectors: list, columns_types: dict, columns: list) -> pd.DataFrame:
+    """Векторы признаков в датафрейм с типами из конфига"""
+    data = pd.DataFrame(vectors, columns=columns)
+    return change_cols_type(data, {col: columns_types[col] for col in columns})
+
+
+class RecordingModel:
+    """Модель, запоминающая переданные векторы признаков"""
+
+    def __init__(self, feature_names: list):
+        self.feature_names_ = feature_names
+        self.rows = None
+
+    def predict(self, rows: list) -> np.ndarray:
+        self.rows = rows
+        return np.zeros(len(rows), dtype=np.int64)
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_records_to_vectors_matches_pandas(config, reverse):
+    columns_types = config['preprocessing']['agg_columns_type']
+    columns = list(columns_types)[::-1] if reverse else list(columns_types)
+    records = make_records()
+
+    vectors = records_to_vectors(records, columns_types, columns)
+    assert all(len(vector) == len(columns) for vector in vectors)
+    pd.testing.assert_frame_equal(vectors_to_frame(vectors, columns_types, columns),
+                                  pandas_features(records, columns_types, columns))
+
+
+def test_records_to_vectors_default_order_and_types(config):
+    columns_types = config['preprocessing']['agg_columns_type']
+    vectors = records_to_vectors(make_records(), columns_types)
+
+    for vector in vectors:
+        for value, col_type in zip(vector, columns_types.values()):
+            if col_type == 'category':
+                assert isinstance(value, str)
+            elif col_type.startswith('int'):
+                assert isinstance(value, int)
+            else:
+                assert isinstance(value, float)
+
+
+def test_zero_period_days(config):
+    columns_types = config['preprocessing']['agg_columns_type']
+    columns = list(columns_types)
+    index = columns.index('act_days_pct')
+    vectors = records_to_vectors(make_records(), columns_types, columns)
+
+    assert vectors[2][index] == np.inf
+    assert np.isnan(vectors[3][index])
+
+
+def test_unseen_categories_kept_as_strings(config):
+    columns_types = config['preprocessing']['agg_columns_type']
+    columns = ['cpe_type_cd', 'cpe_manufacturer_name', 'cpe_model_os_type']
+    vectors = records_to_vectors(make_records(), columns_types, columns)
+
+    assert vectors[-1] == ['unknown_device', 'Unknown Vendor Ltd', 'Android']
+    assert vectors[0][2] == 'iOS'
+
+
+def test_predict_records_uses_model_feature_order(config):
+    columns_types = config['preprocessing']['agg_columns_type']
+    feature_names = [col for col in columns_types if col != 'user_id'][::-1]
+    records = make_records()
+    model = RecordingModel(feature_names)
+
+    assert predict_records(model, records, columns_types) == [0] * len(records)
+    pd.testing.assert_frame_equal(vectors_to_frame(model.rows, columns_types, feature_names),
+                                  pandas_features(records, columns_types, feature_names))
@@ -0,0 +1,88 @@
+"""
+Вероятности ObliviousTreesModel из выгрузки совпадают с CatBoostClassifier
+Версия: 1.0
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostClassifier
+
+from src.serving.oblivious_trees import ObliviousTreesModel
+from src.train.export import export_model, validate_export
+
+TOLERANCE = 1e-6
+
+
+def make_data(n_rows: int, seed: int) -> tuple:
+    """
+    Синтетические объект-признаки с категориями (one-hot и CTR), пропусками в числах и таргет
+    :param n_rows: кол-во объектов
+    :param seed: random state
+    :return: объект-признаки и таргет
+    """
+    rng = np.random.default_rng(seed)
+    cities = np.array([f'city_{i}' for i in range(8)])
+    data = pd.DataFrame({
+        'city_name': pd.Categorical(rng.choice(cities, n_rows), categories=cities),
+        'cpe_type_cd': pd.Categorical(rng.choice(['smartphone', 'tablet'], n_rows)),
+        'price': rng.normal(20000, 5000, n_rows),
+        'request_cnt': rng.integers(1, 50, n_rows),
+    })
+    data.loc[rng.random(n_rows) < 0.1, 'price'] = np.nan
+    score = (data['city_name'].cat.codes.to_numpy() % 3
+             + (data['cpe_type_cd'] == 'tablet').to_numpy()
+             + data['price'].fillna(20000).to_numpy() / 10000
+             + rng.normal(0, 1, n_rows))
+    target = pd.Series((score > np.median(score)).astype(int), name='is_male')
+    return data, target
+
+
+@pytest.fixture(scope="module")
+def model_and_data():
+    """Небольшая модель из симметричных деревьев и отложенные данные"""
+    x_train, y_train = make_data(2000, seed=0)
+    x_test, _ = make_data(500, seed=1)
+    model = CatBoostClassifier(iterations=50,
+                               depth=4,
+                               grow_policy='SymmetricTree',
+                               # cpe_type_cd (2 значения) - one-hot, city_name - CTR
+                               one_hot_max_size=2,
+                               cat_features=['city_name', 'cpe_type_cd'],
+                               random_seed=0,
+                               thread_count=1,
+                               allow_writing_files=False,
+                               verbose=False)
+    model.fit(x_train, y_train)
+    return model, x_train, x_test
+
+
+def test_predict_proba_matches_catboost(model_and_data, tmp_path):
+    model, x_train, x_test = model_and_data
+    meta = export_model(model, x_train, str(tmp_path))
+    assert meta['json_exported']
+    with open(os.path.join(str(tmp_path), 'model.json')) as file:
+        info = json.load(file)['features_info']
+    # one-hot признаки сдвигают нумерацию CTR-разбиений
+    assert any(feature.get('values') for feature in info['categorical_features'])
+    assert info.get('ctrs')
+
+    fast_model = ObliviousTreesModel.load(str(tmp_path))
+    features = x_test[fast_model.feature_names_]
+    rows = features.astype(object).to_numpy().tolist()
+
+    expected = model.predict_proba(features)
+    actual = fast_model.predict_proba(rows)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=TOLERANCE)
+    np.testing.assert_array_equal(fast_model.predict(rows), model.predict(features).ravel())
+
+
+def test_validate_export_passes(model_and_data, tmp_path):
+    model, x_train, x_test = model_and_data
+    export_model(model, x_train, str(tmp_path))
+    result = validate_export(model, x_test, str(tmp_path), tolerance=TOLERANCE)
+    assert result['passed']
+    assert result['n_rows'] == len(x_test)
@@ -2,11 +2,11 @@
 Frontend-часть проекта
 Версия: 1.0
 """
-import yaml
 import os
 
 import streamlit as st
 
+from src.config.settings import get_config
 from src.data.get_data import get_data, load_data
 from src.plotting.charts import barplot_group, displot_category, boxplots_parts_day
 from src.training.training import start_training
@@ -53,8 +53,7 @@ def eda_page():
     st.markdown("# Exploratory data analysis")
     st.write("Исследовательский анализ аггрегированных данных")
 
-    with open(CONFIG_PATH) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(CONFIG_PATH)
 
     # load and write dataset
     data = get_data(data_path=config["train"]["train_data_path"])
@@ -133,8 +132,7 @@ def training():
     st.markdown("# Training model CatBoost")
     st.write("Подбод параметров, обучение модели и вывод метрик")
     # get params
-    with open(CONFIG_PATH) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(CONFIG_PATH)
     # endpoint
     endpoint = config['endpoints']['train']
 
@@ -148,8 +146,7 @@ def prediction_input():
     Предсказание модели по введенным данным
     """
     st.markdown("# Prediction")
-    with open(CONFIG_PATH) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(CONFIG_PATH)
     endpoint = config['endpoints']['predict_input']
     unique_values_path = config['preprocessing']['unique_values_path']
 
@@ -164,12 +161,11 @@ def prediction_from_file():
     """Получение предсказаний из файла с данными"""
     st.markdown("# Prediction")
     st.write("Получение предсказания из файла. Файл может содержать как сырые, так и аггрегированные данные")
-    with open(CONFIG_PATH) as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    config = get_config(CONFIG_PATH)
     endpoint = config["endpoints"]["predict_from_file"]
 
     upload_file = st.file_uploader(
-        "", type=["csv"], accept_multiple_files=False
+        "", type=["csv", "parquet", "pqt", "arrow", "feather"], accept_multiple_files=False
     )
     # проверка загружен ли файл
     if upload_file:
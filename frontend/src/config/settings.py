@@ -0,0 +1,134 @@
+"""
+Настройки из parameters.yaml и словарь уникальных значений: файлы читаются
+один раз на процесс, проверяются pydantic-моделью и перечитываются при изменении.
+Проверяются только параметры, которые читает frontend, полная схема конфига
+описана в backend/src/config/settings.py (frontend собирается в отдельный образ)
+Версия: 1.0
+"""
+import os
+import json
+import threading
+from typing import Callable, Dict, Optional
+
+import yaml
+from pydantic import BaseModel, Extra
+
+
+class Section(BaseModel):
+    """Секция конфига: неописанные параметры сохраняются как есть"""
+
+    class Config:
+        extra = Extra.allow
+
+
+class PreprocessingSettings(Section):
+    """Параметры предобработки, которые читает frontend"""
+    unique_values_path: str
+
+
+class TrainSettings(Section):
+    """Пути к данным и результатам обучения, которые читает frontend"""
+    train_data_path: str
+    model_path: str
+    study_path: str
+    metrics_path: str
+
+
+class EndpointsSettings(Section):
+    """Адреса backend"""
+    train: str
+    predict_from_file: str
+    predict_input: str
+
+
+class Settings(Section):
+    """Конфигурационный файл: остальные секции и параметры сохраняются без проверки"""
+    preprocessing: PreprocessingSettings
+    train: TrainSettings
+    endpoints: EndpointsSettings
+
+
+class _FileCache:
+    """
+    Значения, прочитанные из файлов: файл перечитывается,
+    только если изменились его mtime или размер
+    """
+
+    def __init__(self, loader: Callable[[str], object]):
+        """
+        :param loader: функция чтения файла по пути
+        """
+        self.loader = loader
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        """
+        Значение из файла
+        :param path: путь до файла
+        :return: результат loader
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != version:
+                entry = (version, self.loader(path))
+                self._entries[path] = entry
+        return entry[1]
+
+
+def _load_settings(path: str) -> tuple:
+    """
+    Чтение и проверка конфигурационного файла
+    :param path: путь до parameters.yaml
+    :return: объект настроек и словарь с проверенными значениями
+    """
+    with open(path) as file:
+        settings = Settings.parse_obj(yaml.safe_load(file))
+    return settings, settings.dict()
+
+
+def _load_json(path: str) -> dict:
+    """Чтение json-файла"""
+    with open(path) as file:
+        return json.load(file)
+
+
+_settings_cache = _FileCache(_load_settings)
+_json_cache = _FileCache(_load_json)
+
+
+def get_settings(config_path: str) -> Settings:
+    """
+    Типизированные настройки из конфигурационного файла
+    :param config_path: путь до parameters.yaml
+    :return: объект Settings
+    """
+    return _settings_cache.get(config_path)[0]
+
+
+def get_config(config_path: str) -> dict:
+    """
+    Настройки в виде словаря, как при чтении yaml. Словарь общий
+    для всех вызовов в процессе, изменять его нельзя
+    :param config_path: путь до parameters.yaml
+    :return: словарь с настройками
+    """
+    return _settings_cache.get(config_path)[1]
+
+
+def get_unique_values(unique_values_path: str) -> Optional[dict]:
+    """
+    Уникальные значения и диапазоны признаков из обучающих данных
+    :param unique_values_path: путь до unique_values.json
+    :return: словарь или None, если файла еще нет (модель не обучалась)
+    """
+    try:
+        return _json_cache.get(unique_values_path)
+    except FileNotFoundError:
+        return None
@@ -3,43 +3,79 @@
 Версия: 1.0
 """
 from typing import Dict, Tuple
-import io
+import os
 from io import BytesIO
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
 
+# content-type для передачи файла на backend по расширению
+CONTENT_TYPES = {
+    '.csv': 'text/csv',
+    '.parquet': 'application/vnd.apache.parquet',
+    '.pqt': 'application/vnd.apache.parquet',
+    '.arrow': 'application/vnd.apache.arrow.file',
+    '.feather': 'application/vnd.apache.arrow.file',
+}
+
 
 def get_data(data_path: str) -> pd.DataFrame:
     """
-    Чтение данных по заданному пути
-    :param data_path: путь до csv файла
+    Чтение данных по заданному пути. Parquet и feather читаются с сохраненными
+    типами, если файла нет - читается csv с тем же именем
+    :param data_path: путь до файла
     :return: датасет
     """
+    extension = os.path.splitext(data_path)[1].lower()
+    legacy_path = f"{os.path.splitext(data_path)[0]}.csv"
+    if not os.path.exists(data_path) and os.path.exists(legacy_path):
+        data_path, extension = legacy_path, '.csv'
+    if extension in ('.parquet', '.pqt'):
+        return pq.read_table(data_path, memory_map=True).to_pandas()
+    if extension in ('.arrow', '.feather'):
+        return pa.ipc.open_file(pa.memory_map(data_path)).read_all().to_pandas()
     return pd.read_csv(data_path)
 
 
+def get_preview(data: BytesIO, extension: str, n_rows: int = 5) -> pd.DataFrame:
+    """
+    Чтение первых строк файла для предпросмотра без разбора всего файла
+    :param data: загруженный файл
+    :param extension: расширение файла
+    :param n_rows: кол-во строк
+    :return: первые строки датасета
+    """
+    if extension in ('.parquet', '.pqt'):
+        batch = next(pq.ParquetFile(data).iter_batches(batch_size=n_rows), None)
+        preview = batch.to_pandas() if batch is not None else pd.DataFrame()
+    elif extension in ('.arrow', '.feather'):
+        preview = pa.ipc.open_file(data).read_all().slice(0, n_rows).to_pandas()
+    else:
+        preview = pd.read_csv(data, nrows=n_rows)
+    data.seek(0)
+    return preview
+
+
 def load_data(
-    data: str, type_data: str
-) -> Tuple[pd.DataFrame, Dict[str, Tuple[str, BytesIO, str]]]:
+    data: BytesIO, type_data: str
+) -> Tuple[pd.DataFrame, Dict[str, Tuple[str, bytes, str]]]:
     """
-    Получение данных и преобразование в тип BytesIO для обработки в streamlit
-    :param data: данные
+    Получение данных для отправки в FastAPI: загруженные байты передаются
+    без повторного разбора и сериализации, читается только превью
+    :param data: загруженный файл
     :param type_data: тип датасет (train/test)
-    :return: датасет, датасет в формате BytesIO
+    :return: первые строки датасета, файл для отправки
     """
-    dataset = pd.read_csv(data)
+    extension = os.path.splitext(data.name)[1].lower()
+    dataset = get_preview(data, extension)
     st.write("Dataset load")
-    st.write(dataset.head())
-
-    # Преобразовать dataframe в объект BytesIO (для последующего анализа в виде файла в FastAPI)
-    dataset_bytes_obj = io.BytesIO()
-    # запись в BytesIO буфер
-    dataset.to_csv(dataset_bytes_obj, index=False)
-    # Сбросить указатель, чтобы избежать ошибки с пустыми данными
-    dataset_bytes_obj.seek(0)
+    st.write(dataset)
 
     files = {
-        "file": (f"{type_data}_dataset.csv", dataset_bytes_obj, "multipart/form-data")
+        "file": (f"{type_data}_dataset{extension}",
+                 data.getvalue(),
+                 CONTENT_TYPES.get(extension, 'application/octet-stream'))
     }
     return dataset, files
@@ -8,6 +8,8 @@ import requests
 import streamlit as st
 import pandas as pd
 
+from ..config.settings import get_unique_values
+
 
 def evaluate_input(unique_values_path: str, endpoint: object) -> None:
     """
@@ -15,8 +17,11 @@ def evaluate_input(unique_values_path: str, endpoint: object) -> None:
     :param unique_values_path: путь до файла с уникальными значениями
     :param endpoint: endpoint
     """
-    with open(unique_values_path) as file:
-        unique_values = json.load(file)
+    # словарь читается один раз и перечитывается только после нового обучения
+    unique_values = get_unique_values(unique_values_path)
+    if unique_values is None:
+        st.error("Не найден файл с уникальными значениями, необходимо обучить модель")
+        return
     # поля для ввода данных
     part_of_day_morning = st.sidebar.number_input(
         "Кол-во сессий утром",
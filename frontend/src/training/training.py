@@ -4,6 +4,7 @@
 """
 import os
 import json
+import time
 
 import joblib
 import streamlit as st
@@ -11,6 +12,37 @@ import requests
 from optuna.visualization import plot_param_importances, plot_optimization_history
 
 
+STAGES = {
+    None: "Ожидание запуска",
+    "preprocessing": "Подготовка данных",
+    "tuning": "Подбор параметров",
+    "fitting": "Обучение модели на лучших параметрах",
+    "saving": "Сохранение модели",
+}
+
+
+def wait_training(endpoint: str, poll_interval: float = 2.0) -> dict:
+    """
+    Опрос статуса задачи обучения и отображение прогресса
+    :param endpoint: endpoint статуса задачи
+    :param poll_interval: интервал опроса, сек
+    :return: итоговый статус задачи
+    """
+    progress_bar = st.progress(0)
+    progress_text = st.empty()
+    while True:
+        status = requests.get(endpoint, timeout=30).json()
+        if status["state"] not in ("queued", "running"):
+            progress_bar.progress(100)
+            return status
+        done = min(status["trials_completed"] / max(status["n_trials"], 1), 1.0)
+        progress_bar.progress(int(done * 100))
+        eta = f", осталось ~{status['eta_seconds']:.0f} c" if status["eta_seconds"] else ""
+        progress_text.write(f"{STAGES.get(status['stage'], status['stage'])}: "
+                            f"trials {status['trials_completed']}/{status['n_trials']}{eta}")
+        time.sleep(poll_interval)
+
+
 def start_training(config: dict, endpoint: object) -> None:
     """
     Обучение модели и вывод результатов
@@ -25,13 +57,15 @@ def start_training(config: dict, endpoint: object) -> None:
         # если сохраненных метрик нет
         last_metrics = {"roc_auc": 0, "precision": 0, "recall": 0, "f1": 0}
 
-    # обучение модели
-    with st.spinner("Обучение модели..."):
-        result = requests.post(endpoint, timeout=8000)
+    # запуск обучения и ожидание завершения задачи
+    job_id = requests.post(endpoint, timeout=30).json()["job_id"]
+    status = wait_training(endpoint=f"{endpoint}/{job_id}")
+    if status["state"] != "finished":
+        st.error(f"Ошибка обучения: {status['error']}")
+        return
     st.success("Success ✅")
 
-    output = result.json()
-    new_metrics = output["metrics"]
+    new_metrics = status["metrics"]
 
     # diff metrics
     roc_auc, precision, recall, f1_metric = st.columns(4)